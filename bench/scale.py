@@ -0,0 +1,232 @@
+# bench/scale.py
+"""
+Scale benchmark: synthetic corpus → ingest → query latency → recall.
+
+Measures, on a fresh collection in a scratch directory:
+  - ingest throughput per stage (parse+chunk, embed, upsert) in chunks/s
+  - search() latency p50/p95/p99: unfiltered, call_id filter, flag filter
+  - list_call_ids() time (full metadata scan)
+  - recall@k of the vector store (HNSW, or the flat backend) against exact brute-force cosine search
+and appends one JSON line per run to the report so runs can be compared over time.
+
+  uv run python bench/scale.py --calls 1000                      # real embedding model
+  uv run python bench/scale.py --calls 100000 --embedder hash    # pipeline cost without the model
+  uv run python bench/scale.py --calls 10000 --backend flat       # exact mmap store instead of HNSW
+  uv run python bench/scale.py --calls 10000 --shards 4           # hash-partitioned, fan-out queries
+"""
+import argparse, hashlib, json, os, pathlib, platform, random, shutil, statistics, sys, tempfile, time
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import numpy as np
+
+from synth import generate
+from utils.embeddings import get_collection, get_embedding_function, persist_collection, upsert_chunks
+from utils.catalog import CallStats, Catalog
+from utils.ingestion import FLAG_FIELDS, iter_chunks, iter_segments
+from utils.planner import CatalogStats
+from utils.retrieval import list_call_ids, search
+
+QUERIES = [
+    "What is the list price per seat?", "Did they ask for a discount?", "overage per minute",
+    "SOC 2 report and pen-test", "SSO SAML SCIM provisioning", "data retention DPDPA",
+    "How do we compare to Competitor X?", "battle-card against Brightcall", "next steps and pilot",
+    "renewal timing", "integration questions CRM sync", "onboarding timeline",
+]
+
+def _hash_embedder():
+    from chromadb import EmbeddingFunction
+
+    class HashEmbedding(EmbeddingFunction):
+        """Hashed bag of words, 384 dims: exercises index/storage costs without loading a model."""
+        DIM = 384
+
+        def __init__(self):
+            pass
+
+        def __call__(self, input):
+            out = np.full((len(input), self.DIM), 1e-3, dtype=np.float32)
+            for r, t in enumerate(input):
+                for w in t.lower().split():
+                    out[r, int.from_bytes(hashlib.blake2b(w.encode(), digest_size=4).digest(), "little") % self.DIM] += 1.0
+            out /= np.linalg.norm(out, axis=1, keepdims=True)
+            return list(out)
+
+        @staticmethod
+        def name():
+            return "bench-hash"
+
+        def get_config(self):
+            return {}
+
+        @staticmethod
+        def build_from_config(config):
+            return HashEmbedding()
+
+    return HashEmbedding()
+
+def _pct(xs: list[float]) -> dict:
+    xs = sorted(xs)
+    at = lambda p: xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+    return {"p50": round(at(50), 2), "p95": round(at(95), 2), "p99": round(at(99), 2),
+            "mean": round(statistics.fmean(xs), 2), "n": len(xs)}
+
+def _timed(fn) -> float:
+    t = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t) * 1000
+
+def run(args) -> dict:
+    work = pathlib.Path(args.workdir or tempfile.mkdtemp(prefix="copilot-scale-"))
+    tdir, pdir = work / "transcripts", work / "chroma"
+    shutil.rmtree(pdir, ignore_errors=True)
+    rng = random.Random(args.seed)
+    report: dict = {"params": {k: v for k, v in vars(args).items() if k not in ("out", "workdir")}}
+
+    t = time.perf_counter()
+    files = generate(str(tdir), args.calls, args.segments, args.seed)
+    report["generate_s"] = round(time.perf_counter() - t, 2)
+
+    ef = _hash_embedder() if args.embedder == "hash" else get_embedding_function()
+    coll = get_collection(str(pdir), embedding_function=ef, backend=args.backend, shards=args.shards)
+    catalog = Catalog(str(pdir / "catalog.sqlite"))  # planner statistics, as ingest keeps them
+
+    # ---- ingest, stage by stage ----
+    parse_s = embed_s = upsert_s = 0.0
+    n_chunks = n_bytes = 0
+    vectors, ids, calls_of = [], [], []
+    batch: list[dict] = []
+
+    def flush():
+        nonlocal embed_s, upsert_s
+        t0 = time.perf_counter()
+        embs = ef([c["text"] for c in batch])
+        t1 = time.perf_counter()
+        upsert_chunks(coll, batch, embeddings=embs)
+        t2 = time.perf_counter()
+        embed_s += t1 - t0
+        upsert_s += t2 - t1
+        vectors.append(np.asarray(embs, dtype=np.float32))
+        ids.extend(c["id"] for c in batch)
+        calls_of.extend(c["meta"]["call_id"] for c in batch)
+        batch.clear()
+
+    for fp in files:
+        n_bytes += fp.stat().st_size
+        t0 = time.perf_counter()
+        chunks = list(iter_chunks(iter_segments(str(fp)), max_chars=args.max_chars))
+        parse_s += time.perf_counter() - t0
+        if chunks:
+            call = CallStats(chunks[0]["meta"]["call_id"], str(fp), 0.0, FLAG_FIELDS)
+            for c in chunks:
+                call.add(c)
+            catalog.upsert(call.row)
+        for c in chunks:
+            batch.append(c)
+            n_chunks += 1
+            if len(batch) >= args.batch_size:
+                flush()
+    if batch:
+        flush()
+    t0 = time.perf_counter()
+    persist_collection(coll)
+    upsert_s += time.perf_counter() - t0
+    total_s = parse_s + embed_s + upsert_s
+    report["ingest"] = {
+        "files": len(files), "chunks": n_chunks, "mb": round(n_bytes / 1e6, 2),
+        "parse_chunk_s": round(parse_s, 2), "embed_s": round(embed_s, 2), "upsert_s": round(upsert_s, 2),
+        "total_s": round(total_s, 2),
+        "chunks_per_s": {
+            "parse_chunk": round(n_chunks / parse_s, 1) if parse_s else None,
+            "embed": round(n_chunks / embed_s, 1) if embed_s else None,
+            "upsert": round(n_chunks / upsert_s, 1) if upsert_s else None,
+            "end_to_end": round(n_chunks / total_s, 1) if total_s else None,
+        },
+    }
+    print(f"ingest: {n_chunks} chunks from {len(files)} calls in {total_s:.1f}s "
+          f"(parse {parse_s:.1f}s, embed {embed_s:.1f}s, upsert {upsert_s:.1f}s)")
+
+    # ---- query latency ----
+    call_ids = sorted(set(calls_of))
+    filters = {
+        "none": lambda: None,
+        "call_id": lambda: {"call_id": rng.choice(call_ids)},
+        "flag": lambda: {"mentions_security": True},
+        "call_id+flag": lambda: {"call_id": rng.choice(call_ids), "mentions_pricing": True},
+    }
+    stats = CatalogStats(catalog)
+    search(coll, "warmup", k=args.k)
+    report["query_ms"] = {}
+    for name, make_where in filters.items():
+        lat = [_timed(lambda: search(coll, rng.choice(QUERIES), k=args.k, where=make_where(), stats=stats))
+               for _ in range(args.queries)]
+        report["query_ms"][name] = _pct(lat)
+        print(f"query[{name:12s}] p50 {report['query_ms'][name]['p50']:7.2f} ms  "
+              f"p95 {report['query_ms'][name]['p95']:7.2f} ms  p99 {report['query_ms'][name]['p99']:7.2f} ms")
+
+    # ---- list ----
+    found: list[str] = []
+    report["list_call_ids_ms"] = round(_timed(lambda: found.extend(list_call_ids(coll))), 1)
+    assert len(found) == len(call_ids)
+    print(f"list_call_ids: {report['list_call_ids_ms']:.1f} ms for {len(found)} calls")
+
+    # ---- recall@k vs exact cosine ----
+    matrix = np.concatenate(vectors)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    probes = [f"{rng.choice(QUERIES)} {rng.choice(QUERIES)}" for _ in range(args.recall_queries)]
+    qv = np.asarray(ef(probes), dtype=np.float32)
+    qv /= np.linalg.norm(qv, axis=1, keepdims=True)
+    t0 = time.perf_counter()
+    res = coll.query(query_embeddings=list(qv), n_results=args.k, include=[])
+    ann_ms = (time.perf_counter() - t0) * 1000 / len(probes)
+    t0 = time.perf_counter()
+    sims = qv @ matrix.T
+    exact = np.argpartition(-sims, args.k - 1, axis=1)[:, :args.k] if len(ids) > args.k else np.tile(np.arange(len(ids)), (len(probes), 1))
+    exact_ms = (time.perf_counter() - t0) * 1000 / len(probes)
+    recall = [len(set(got) & {ids[j] for j in want}) / min(args.k, len(ids)) for got, want in zip(res["ids"], exact)]
+    report["recall"] = {"k": args.k, "recall_at_k": round(statistics.fmean(recall), 4), "min": round(min(recall), 4),
+                        "ann_ms_per_query": round(ann_ms, 2), "exact_ms_per_query": round(exact_ms, 2)}
+    print(f"recall@{args.k}: {report['recall']['recall_at_k']:.4f} (min {report['recall']['min']:.2f}); "
+          f"{args.backend}{'' if args.shards <= 1 else f' x{args.shards}'} {ann_ms:.2f} ms vs brute force {exact_ms:.2f} ms per query")
+
+    if not args.workdir and not args.keep:
+        shutil.rmtree(work, ignore_errors=True)
+    return report
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--calls", type=int, default=1000)
+    ap.add_argument("--segments", type=int, default=120, help="mean transcript lines per call")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--embedder", choices=("default", "hash"), default="default",
+                    help="default = the ingest model (DefaultEmbeddingFunction); hash = no model, index costs only")
+    ap.add_argument("--backend", choices=("chroma", "flat"), default="chroma",
+                    help="vector store: chroma (HNSW) or flat (exact, mmap'd float16/int8; FLAT_DTYPE)")
+    ap.add_argument("--shards", type=int, default=1, help="> 1: hash-partition the store (VECTOR_SHARDS)")
+    ap.add_argument("--max-chars", type=int, default=1500)
+    ap.add_argument("--batch-size", type=int, default=256)
+    ap.add_argument("--queries", type=int, default=200, help="searches per filter kind")
+    ap.add_argument("--recall-queries", type=int, default=100)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--workdir", default="", help="scratch dir (default: temp dir, removed afterwards)")
+    ap.add_argument("--keep", action="store_true", help="keep the temp dir")
+    ap.add_argument("--out", default=str(ROOT / "bench" / "results" / "scale.jsonl"))
+    args = ap.parse_args()
+
+    import chromadb
+    report = {
+        "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "env": {"python": platform.python_version(), "chromadb": chromadb.__version__,
+                "cpus": os.cpu_count(), "machine": platform.machine()},
+        **run(args),
+    }
+    out = pathlib.Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "a", encoding="utf-8") as f:
+        f.write(json.dumps(report) + "\n")
+    print(f"report appended to {out}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
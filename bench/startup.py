@@ -0,0 +1,115 @@
+# bench/startup.py
+"""
+CLI startup benchmark: how long each command takes to import what it needs.
+
+Each command runs in a fresh interpreter with `-X importtime`, in an empty scratch
+directory (no transcripts, no index) with GROQ_API_KEY and COPILOT_SERVER cleared, so
+nothing touches the network. We record wall time, total import time and which heavy
+modules got loaded, then append one JSON line per command to the report so runs can be
+compared over time. A command that loads other heavy modules than COMMANDS expects
+fails the run.
+
+  uv run python bench/startup.py                          # default command set
+  uv run python bench/startup.py --baseline bench/results/startup.jsonl --max-regression 0.25
+"""
+import argparse, json, os, pathlib, re, statistics, subprocess, sys, tempfile, time
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+HEAVY = ("chromadb", "onnxruntime", "openai", "numpy", "tiktoken")
+
+# (label, argv, heavy modules it must load) — against the empty scratch store, commands
+# run their real code path up to the point where they find nothing to do and exit
+# (ask: 4 no hits, list: 3, summarize: 5, ingest: 2). --help exits before any command code.
+COMMANDS = [
+    ("help", ["--help"], ()),
+    ("ask-help", ["ask", "--help"], ()),
+    ("ingest-empty", ["ingest"], ()),
+    ("list", ["list"], ("chromadb", "numpy")),
+    ("ask-empty", ["ask", "price?", "--mode", "vector"], ("chromadb", "numpy")),
+    ("summarize-last", ["summarize", "--last"], ()),
+    ("cache-stats", ["cache-stats"], ()),
+]
+
+_IMPORT_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def run_once(argv: list[str], workdir: str) -> dict:
+    """One run of main.py in `workdir` (relative data paths resolve there)."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1", GROQ_API_KEY="", COPILOT_SERVER="")
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", str(ROOT / "main.py"), *argv],
+        cwd=workdir, env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - t0
+    total_us, loaded = 0, set()
+    for line in proc.stderr.splitlines():
+        m = _IMPORT_RE.match(line)
+        if not m:
+            continue
+        loaded.add(m[4].split(".")[0])
+        if len(m[3]) <= 1:  # top-level import: cumulative time already includes children
+            total_us += int(m[2])
+    return {
+        "wall_ms": round(wall * 1000, 1),
+        "import_ms": round(total_us / 1000, 1),
+        "heavy": sorted(h for h in HEAVY if h in loaded),
+        "exit_code": proc.returncode,
+    }
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--repeat", type=int, default=3, help="runs per command (median is reported)")
+    ap.add_argument("--out", default=str(ROOT / "bench" / "results" / "startup.jsonl"))
+    ap.add_argument("--baseline", default="", help="earlier report to compare against")
+    ap.add_argument("--max-regression", type=float, default=0.25, help="allowed relative slowdown of import_ms")
+    args = ap.parse_args()
+
+    stamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+    rows, failed = [], False
+    with tempfile.TemporaryDirectory(prefix="startup-") as workdir:
+        os.makedirs(os.path.join(workdir, "transcripts"))
+        for label, argv, expect in COMMANDS:
+            runs = [run_once(argv, workdir) for _ in range(max(1, args.repeat))]
+            row = {
+                "ts": stamp,
+                "command": label,
+                "wall_ms": statistics.median(r["wall_ms"] for r in runs),
+                "import_ms": statistics.median(r["import_ms"] for r in runs),
+                "heavy": runs[-1]["heavy"],
+                "exit_code": runs[-1]["exit_code"],
+            }
+            rows.append(row)
+            print(f"{label:16s} wall {row['wall_ms']:8.1f} ms   imports {row['import_ms']:8.1f} ms   heavy={row['heavy']}")
+            if row["heavy"] != sorted(expect):
+                failed = True
+                print(f"UNEXPECTED IMPORTS {label}: loaded {row['heavy'] or '-'}, expected {sorted(expect) or '-'}")
+
+    out = pathlib.Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "a", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+
+    if not args.baseline:
+        return 1 if failed else 0
+    base: dict[str, dict] = {}
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                r = json.loads(line)
+                base[r["command"]] = r  # latest entry per command wins
+    for row in rows:
+        ref = base.get(row["command"])
+        if not ref or not ref["import_ms"]:
+            continue
+        ratio = row["import_ms"] / ref["import_ms"] - 1.0
+        new_heavy = set(row["heavy"]) - set(ref["heavy"])
+        if ratio > args.max_regression or new_heavy:
+            failed = True
+            print(f"REGRESSION {row['command']}: import {ref['import_ms']} → {row['import_ms']} ms "
+                  f"({ratio:+.0%}), new heavy modules: {sorted(new_heavy) or '-'}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# bench/synth.py
+"""
+Synthetic sales-call transcripts in the `[MM:SS] Speaker: text` format LINE_RE parses.
+
+Each call gets its own prospect company, people and numbers, and lines are drawn from
+topic templates (pricing, security, competitors, small talk) so the keyword flags,
+metadata filters and lexical search all have something realistic to chew on.
+Output is deterministic for a given seed.
+
+  uv run python bench/synth.py --calls 1000 --segments 120 --out /tmp/transcripts
+"""
+import argparse, pathlib, random
+
+COMPANIES = ["Acme", "Globex", "Initech", "Umbrella", "Hooli", "Vandelay", "Stark", "Wayne", "Wonka", "Tyrell",
+             "Cyberdyne", "Soylent", "Massive", "Aperture", "Gringotts", "Oscorp", "Monarch", "Pied Piper"]
+FIRST = ["Jordan", "Priya", "Luis", "Maya", "Dan", "Aisha", "Chen", "Ravi", "Sofia", "Tom", "Neha", "Omar"]
+TITLES = ["RevOps Director", "Finance VP", "CISO", "Head of Sales", "IT Manager", "Procurement Lead"]
+COMPETITORS = ["Competitor X", "Competitor Y", "Brightcall"]
+SKUS = ["Growth", "Pro", "Enterprise"]
+
+PRICING = [
+    "At list the {sku} tier is ₹{price:,} per seat per month, billed annually.",
+    "If you commit to {seats} seats we can offer a {pct}% discount on the first year.",
+    "Overage is ₹{small} per minute once you pass the included AI minutes.",
+    "Finance needs the TCV under ₹{tcv:,} to avoid a board review.",
+    "Can you hold that pricing if we expand to {seats} seats next quarter?",
+]
+SECURITY = [
+    "Our CISO will want the SOC 2 Type II report and the latest pen-test summary.",
+    "Do you support SSO via SAML and user provisioning through SCIM?",
+    "We need the DPA signed and data retention capped at {days} days for DPDPA.",
+    "Is customer data encrypted at rest with KMS-managed keys?",
+    "Legal asked whether you are ISO 27001 certified and GDPR compliant.",
+]
+COMPETITION = [
+    "{comp} quoted us a flat rate with unlimited minutes.",
+    "How do you compare to {comp} on coaching and call scoring?",
+    "Our reps trialled {comp} last year but adoption was low.",
+    "Can you share a battle-card against {comp} for the steering committee?",
+]
+GENERAL = [
+    "Thanks for making time today, appreciate it.",
+    "Let me share my screen and walk through the dashboard.",
+    "The main goal is cutting the time reps spend on call notes.",
+    "We have roughly {seats} reps across three regions.",
+    "Next step is a pilot with the {team} team starting in {month}.",
+    "I'll send a recap email with owners and dates after this call.",
+    "Can we loop in {name} from {team} for the integration questions?",
+    "Onboarding usually takes two weeks including CRM sync.",
+    "That makes sense, let's park it and come back at the end.",
+    "Our renewal cycle lands in {month}, so timing matters.",
+]
+TEAMS = ["EMEA", "APAC", "mid-market", "enterprise", "SDR", "customer success"]
+MONTHS = ["January", "March", "April", "June", "September", "November"]
+
+def _fill(rng: random.Random, tpl: str, ctx: dict) -> str:
+    return tpl.format(
+        sku=rng.choice(SKUS), price=rng.randrange(1200, 3200, 50), seats=rng.choice([25, 40, 80, 150, 300]),
+        pct=rng.choice([5, 8, 10, 12, 15, 20]), small=rng.choice(["0.50", "0.75", "1.10"]),
+        tcv=rng.randrange(500_000, 9_000_000, 50_000), days=rng.choice([30, 90, 180, 365]),
+        comp=ctx["competitor"], team=rng.choice(TEAMS), month=rng.choice(MONTHS), name=rng.choice(FIRST),
+    )
+
+def make_call(rng: random.Random, n_segments: int) -> list[str]:
+    """One call as transcript lines; topic mix varies per call so flag filters are selective."""
+    company = f"{rng.choice(COMPANIES)} {rng.randrange(1, 10_000)}"
+    ae, prospect = rng.sample(FIRST, 2)
+    ctx = {"competitor": rng.choice(COMPETITORS)}
+    speakers = [f"AE ({ae})", f"Prospect ({prospect} – {rng.choice(TITLES)}, {company})", "SE", "Prospect"]
+    weights = [rng.uniform(0.05, 0.3), rng.uniform(0.0, 0.25), rng.uniform(0.0, 0.15)]
+    topics = [PRICING, SECURITY, COMPETITION, GENERAL]
+    weights.append(max(0.2, 1.0 - sum(weights)))
+
+    lines, t = [], 0
+    for i in range(n_segments):
+        pool = rng.choices(topics, weights=weights)[0]
+        text = " ".join(_fill(rng, rng.choice(pool), ctx) for _ in range(rng.choice((1, 1, 2, 3))))
+        mm, ss = divmod(t, 60)
+        lines.append(f"[{min(mm, 99):02d}:{ss:02d}] {speakers[i % 2] if rng.random() < 0.8 else rng.choice(speakers)}:  {text}")
+        t += rng.randint(4, 45)
+    return lines
+
+def generate(out_dir: str, calls: int, segments: int = 120, seed: int = 0) -> list[pathlib.Path]:
+    out = pathlib.Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for n in range(calls):
+        n_seg = max(1, int(rng.gauss(segments, segments * 0.25)))
+        p = out / f"synth_{n:06d}.txt"
+        p.write_text("\n\n".join(make_call(rng, n_seg)) + "\n", encoding="utf-8")
+        paths.append(p)
+    return paths
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--calls", type=int, default=100)
+    ap.add_argument("--segments", type=int, default=120, help="mean segments (lines) per call")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", required=True)
+    args = ap.parse_args()
+    paths = generate(args.out, args.calls, args.segments, args.seed)
+    print(f"wrote {len(paths)} transcripts to {args.out}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -7,11 +7,91 @@ load_dotenv()
 # --- API / models ---
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 GROQ_MODEL   = os.getenv("GROQ_MODEL", "llama3-8b-8192")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")  # any OpenAI-compatible endpoint
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
 
 # --- Paths ---
 TRANSCRIPTS_DIR = "transcripts"   # where your .txt files live
 PERSIST_DIR     = "data/chroma"   # Chroma will persist its index here
+MANIFEST_PATH   = "data/chroma/ingest_manifest.json"  # file hashes/mtimes → chunk IDs (incremental ingest)
+INDEX_VERSION_PATH = "data/chroma/index_version"     # bumped by ingest whenever the collection changes
+CATALOG_PATH    = "data/chroma/catalog.sqlite"       # one row per call (counts, time range, flags)
+LEXICAL_DIR     = "data/chroma/lexical"              # BM25 inverted index (hybrid/lexical search)
+SEGMENTS_DIR    = "data/chroma/segments"             # per-call mmap segment files (ask --expand; utils/segstore.py)
+
+TAGS_FILE       = os.getenv("TAGS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tags.toml"))  # keyword tags
+
+# --- Vector store ---
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")  # "chroma" (HNSW) or "flat" (exact, mmap; utils/flatindex.py)
+FLAT_DTYPE     = os.getenv("FLAT_DTYPE", "float16")     # flat backend storage: "float16" or "int8" (new stores only)
+VECTOR_SHARDS  = int(os.getenv("VECTOR_SHARDS", "1"))  # > 1: hash-partition calls over N collections (utils/shards.py)
+SHARD_WORKERS  = 4                # threads fanning a query out to the shards
+SHARD_MAX_OPEN = int(os.getenv("SHARD_MAX_OPEN", "0"))          # open shard handles kept (LRU); 0 = all
+SHARD_CACHE_BYTES = int(os.getenv("SHARD_CACHE_BYTES", "0"))    # Chroma LRU segment cache limit; 0 = unbounded
+HNSW_SETTINGS_FILE = "hnsw.json"  # in PERSIST_DIR: HNSW M/ef chosen by `maintain --tune`, used for new collections
+
+# --- Near-duplicate chunks (utils/dedup.py) ---
+DEDUP           = os.getenv("DEDUP", "0") == "1"   # store near-duplicate chunks once, as references (re-embeds on change)
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))  # estimated Jaccard of word 3-grams to count as a duplicate
+DEDUP_PERMS     = 128             # MinHash permutations (fixed when the dedup index is created)
+DEDUP_BANDS     = 32              # LSH bands of DEDUP_PERMS / DEDUP_BANDS rows
+DEDUP_FILE      = "dedup.sqlite"  # in PERSIST_DIR: signatures, LSH buckets, references
+
+# --- Index maintenance (maintain) ---
+MAINTAIN_SWEEP_SAMPLE  = 2000     # stored vectors indexed per HNSW configuration in the sweep
+MAINTAIN_SWEEP_QUERIES = 100      # probe queries per configuration
+MAINTAIN_RECALL_TARGET = 0.95     # the sweep picks the fastest configuration reaching this recall@k
+
+# --- Filtered search planning (utils/planner.py) ---
+PLANNER_EXHAUSTIVE_MAX = 256      # score filters matching at most this many chunks exactly, by id
+PLANNER_OVERFETCH_MAX  = 8        # cap on n_results / k for broad filters sent to the HNSW filter
+PLANNER_STATS_TTL      = 30.0     # seconds to reuse corpus-wide chunk/flag totals from the catalog
+
+# --- Result diversity (retrieval.search) ---
+SEARCH_DIVERSITY = float(os.getenv("SEARCH_DIVERSITY", "0"))  # MMR weight on novelty: 0 = relevance only (off)
+MMR_POOL         = 3              # candidates fetched per requested hit when diversity > 0
 
 # --- Chunking ---
 MAX_CHARS = 1500                  # target ~1200–1500 chars per chunk
+
+# --- Prompt context packing ---
+# Snippet tokens per prompt, by model (leaves room for instructions + answer in the context window)
+CONTEXT_BUDGETS = {
+    "llama3-8b-8192": 5000,
+    "llama3-70b-8192": 5000,
+    "llama-3.1-8b-instant": 12000,
+    "llama-3.3-70b-versatile": 12000,
+    "default": 4000,
+}
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))  # > 0 overrides the table above
+
+# --- Full-coverage summaries (summarize --full) ---
+SUMMARY_WINDOW  = 4               # chunks per map call (fixed from the start of the call)
+SUMMARY_FANIN   = 6               # partial notes merged per reduce call
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "4"))  # parallel map/reduce LLM calls
+
+# --- Query server ---
+SERVER_URL = os.getenv("COPILOT_SERVER", "")  # e.g. http://127.0.0.1:8765; empty = run queries in-process
+
+# --- Ingest pipeline ---
+INGEST_BATCH_SIZE = 64            # chunks per embedding/upsert batch (pooled across files)
+
+# --- Live ingest (watch) ---
+WATCH_INTERVAL = float(os.getenv("WATCH_INTERVAL", "1.0"))  # seconds between polls of TRANSCRIPTS_DIR
+WATCH_SETTLE   = 5.0              # idle seconds before a last line without a newline is indexed
+
+# --- Retrieval cache ---
+RETRIEVAL_CACHE_SIZE      = int(os.getenv("RETRIEVAL_CACHE_SIZE", "512"))   # in-memory LRU entries (0 = off)
+RETRIEVAL_CACHE_PATH      = os.getenv("RETRIEVAL_CACHE_PATH", "data/chroma/retrieval_cache.sqlite")  # "" = no disk tier
+RETRIEVAL_CACHE_TTL       = float(os.getenv("RETRIEVAL_CACHE_TTL", str(24 * 3600)))  # seconds
+RETRIEVAL_CACHE_MAX_BYTES = 64 << 20
+
+# --- LLM response cache ---
+LLM_CACHE_PATH      = os.getenv("LLM_CACHE_PATH", "data/chroma/llm_cache.sqlite")  # "" = off
+LLM_CACHE_TTL       = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))     # seconds
+LLM_CACHE_MAX_BYTES = 128 << 20
+
+# --- Batch questions (ask-batch) ---
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))   # LLM requests in flight
+LLM_TIMEOUT       = float(os.getenv("LLM_TIMEOUT", "60"))       # seconds per attempt
+LLM_RETRIES       = int(os.getenv("LLM_RETRIES", "3"))          # extra attempts on timeouts/429/5xx
@@ -1,22 +1,163 @@
 # main.py
 import pathlib
+import sys
+import time
+from typing import List, Optional
 import typer
 from rich import print as rprint
 
-from config import TRANSCRIPTS_DIR, PERSIST_DIR, MAX_CHARS
-from utils.ingestion import parse_file, chunk_segments
-from utils.embeddings import get_collection, upsert_chunks
-from utils.retrieval import list_call_ids, search
-from utils.prompts import ask_qa, summarize_call
+from config import (
+    TRANSCRIPTS_DIR, PERSIST_DIR, MAX_CHARS, MANIFEST_PATH, INGEST_BATCH_SIZE, SERVER_URL,
+    INDEX_VERSION_PATH, CATALOG_PATH, LEXICAL_DIR, SEGMENTS_DIR,
+    RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_PATH, RETRIEVAL_CACHE_TTL, RETRIEVAL_CACHE_MAX_BYTES,
+    LLM_CACHE_PATH, BATCH_CONCURRENCY, LLM_TIMEOUT, LLM_RETRIES, WATCH_INTERVAL, WATCH_SETTLE,
+    MAINTAIN_SWEEP_SAMPLE, MAINTAIN_SWEEP_QUERIES, MAINTAIN_RECALL_TARGET, SEARCH_DIVERSITY,
+)
+from utils.client import CopilotClient, ServerError
+
+# Heavy modules (chromadb, onnxruntime, openai) are imported inside the commands
+# that need them, so --help, list and thin-client calls start fast.
+# Guarded by tests/test_startup.py; measure with bench/startup.py.
 
 app = typer.Typer(help="Conversational AI Copilot CLI for sales-call transcripts")
 
+# Global options (set by the callback below)
+state: dict[str, object] = {"server": ""}
+
+
+@app.callback()
+def _global_options(
+    ctx: typer.Context,
+    server: str = typer.Option(
+        SERVER_URL, "--server", envvar="COPILOT_SERVER",
+        help="URL of a running `serve` instance; list/ask/summarize go through it instead of loading models",
+    ),
+    profile: bool = typer.Option(False, "--profile", help="Print a per-stage timing tree to stderr when the command ends"),
+    trace_out: str = typer.Option("", "--trace-out", help="Write spans to this file (.json = Chrome trace, else JSON lines)"),
+):
+    state["server"] = server
+    if profile or trace_out:
+        _start_trace(ctx, profile, trace_out)
+
+
+def _start_trace(ctx: typer.Context, profile: bool, trace_out: str) -> None:
+    """Enable utils.trace and wrap the whole command in a root span, reported when the context closes."""
+    from utils import trace
+    trace.enable()
+    root = trace.span(f"command.{ctx.invoked_subcommand}")
+    root.__enter__()
+
+    def finish():
+        root.__exit__(None, None, None)
+        if profile:
+            from rich.console import Console
+            Console(stderr=True, highlight=False).print(trace.render_tree(), markup=False)
+        if trace_out:
+            trace.export(trace_out)
+        trace.enable(False)
+        trace.reset()
+
+    ctx.call_on_close(finish)
+
+
+def _client() -> CopilotClient | None:
+    return CopilotClient(str(state["server"])) if state["server"] else None
+
+
+def _catalog():
+    from utils.catalog import Catalog
+    return Catalog(CATALOG_PATH)
+
+
+def _segments():
+    from utils.segstore import SegmentStore
+    return SegmentStore(SEGMENTS_DIR)
+
+
+def _filter_stats():
+    """Planner statistics for filtered searches (utils.planner), backed by the call catalog."""
+    from utils.planner import CatalogStats
+    return CatalogStats(_catalog())
+
+
+def _check_call_id(call_id: str, exit_code: int) -> None:
+    """Reject unknown call_ids up front (skipped for indexes built before the catalog existed)."""
+    from utils import trace
+    with trace.span("catalog.check"):
+        cat = _catalog()
+        known = not call_id or not len(cat) or cat.has(call_id)
+    if not known:
+        rprint(f"[yellow]Unknown call_id '{call_id}'. See: python main.py list[/yellow]")
+        raise typer.Exit(code=exit_code)
+
+
+def _check_tags(*wheres: dict) -> None:
+    """Refuse tag filters on an index tagged with another tag set (tags.toml edited since the last ingest)."""
+    from utils.ingestion import TAGGER
+    from utils.manifest import load_manifest
+    if not any(key in TAGGER.fields for where in wheres for key in where):
+        return
+    manifest = load_manifest(MANIFEST_PATH)
+    if manifest["files"] and manifest.get("tags") != TAGGER.fingerprint:
+        rprint("[red]The tag set (tags.toml) changed since the last ingest:[/red] "
+               "run ingest before filtering on tags.")
+        raise typer.Exit(code=9)
+
+
+def _retrieval_cache():
+    from utils.cache import RetrievalCache
+    return RetrievalCache(
+        INDEX_VERSION_PATH,
+        max_entries=RETRIEVAL_CACHE_SIZE,
+        disk_path=RETRIEVAL_CACHE_PATH or None,
+        ttl=RETRIEVAL_CACHE_TTL,
+        max_bytes=RETRIEVAL_CACHE_MAX_BYTES,
+    )
+
+
+def _report_llm(info: dict) -> None:
+    """One stderr line per LLM request: context packing and stream timings (stdout stays the answer)."""
+    parts = []
+    c = info.get("context")
+    if c:
+        parts.append(f"context: {c['hits_in']} → {c['hits_out']} snippets, {c['tokens_in']:,} → {c['tokens_out']:,} "
+                     f"tokens (saved {c['tokens_saved']:,}; budget {c['budget']:,})")
+    if "gen_ms" in info:
+        ttft = f"{info['ttft_ms']:,.0f} ms" if "ttft_ms" in info else "n/a"
+        parts.append(f"first token {ttft}, generation {info['gen_ms']:,.0f} ms" + (" (cached)" if info.get("cached") else ""))
+    if parts:
+        from rich.console import Console
+        Console(stderr=True).print(f"[dim]{' · '.join(parts)}[/dim]")
+
+
+def _print_token(text: str) -> None:
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+
+def _remote(fn, exit_code: int):
+    """Run a client call, mapping server 404s to the same exit codes as local mode."""
+    try:
+        return fn()
+    except ServerError as e:
+        rprint(f"[yellow]{e}[/yellow]" if e.status == 404 else f"[red]Server error {e.status}:[/red] {e}")
+        raise typer.Exit(code=exit_code if e.status == 404 else 1)
+    except OSError as e:
+        rprint(f"[red]Cannot reach server at {state['server']}:[/red] {e}")
+        raise typer.Exit(code=1)
+
 
 # ----------------------------- Ingestion -----------------------------
 @app.command()
-def ingest():
+def ingest(
+    force: bool = typer.Option(False, help="Re-embed every chunk even if the transcript is unchanged"),
+    workers: int = typer.Option(1, help="Processes for parse/chunk (0 = all cores)"),
+    batch_size: int = typer.Option(INGEST_BATCH_SIZE, help="Chunks per embedding/upsert batch (pooled across files)"),
+):
     """
     Ingest all .txt transcripts from the transcripts/ folder, chunk, and upsert into the vector DB.
+    Incremental: unchanged files are skipped, only new/edited chunks are embedded, and
+    chunks of edited or removed transcripts are deleted.
     """
     tdir = pathlib.Path(TRANSCRIPTS_DIR)
     if not tdir.exists():
@@ -28,36 +169,317 @@ def ingest():
         rprint(f"[yellow]No .txt files found in {TRANSCRIPTS_DIR}[/yellow]")
         raise typer.Exit(code=2)
 
-    coll = get_collection(PERSIST_DIR)
+    from utils.cache import bump_index_version
+    from utils.embeddings import get_collection, get_embedding_function, persist_collection, store_layout
+    from utils.manifest import load_manifest, save_manifest
+    from utils.lexical import LexicalIndex
+    from utils.pipeline import run_ingest, backfill_lexical
+
+    ef = get_embedding_function()
+    coll = get_collection(PERSIST_DIR, embedding_function=ef)
+    manifest = load_manifest(MANIFEST_PATH)
+    layout, was = store_layout(), manifest.get("store", "chroma")
+    if manifest["files"] and was != layout and not force:
+        rprint(f"[yellow]Vector store changed ({was} → {layout}): re-embedding every transcript.[/yellow]")
+        force = True
+        if getattr(coll, "dedup", None) is not None:
+            coll.dedup.reset()  # references from an earlier dedup run may point at chunks deleted since
+    manifest["store"] = layout
+    from utils.ingestion import TAGGER
+    retag = bool(manifest["files"]) and manifest.get("tags") != TAGGER.fingerprint
+    if retag and not force:
+        rprint("[yellow]Tag set changed (tags.toml): re-tagging every transcript.[/yellow]")
+        force = True
+    manifest["tags"] = TAGGER.fingerprint
+    # re-tagging starts the lexical index afresh: its flag columns follow the tag order
+    lexical = LexicalIndex(LEXICAL_DIR) if retag else LexicalIndex.load(LEXICAL_DIR)
+    if not retag and not len(lexical) and coll.count():
+        rprint(f"Building lexical index for {backfill_lexical(coll, lexical)} existing chunks…")
+
+    stats = run_ingest(
+        coll, files, manifest,
+        max_chars=MAX_CHARS, force=force, workers=workers, batch_size=max(1, batch_size),
+        ef=ef, catalog=_catalog(), lexical=lexical, segments=_segments(), log=rprint,
+    )
+
+    persist_collection(coll)
+    if lexical.dirty:
+        lexical.save()
+    save_manifest(MANIFEST_PATH, manifest)
+    if stats.added or stats.deleted or stats.deduped:
+        bump_index_version(INDEX_VERSION_PATH)  # retires cached search results
+    rprint(f"[green]Done.[/green] {stats.files_changed} file(s) changed: "
+           f"added [bold]{stats.added}[/bold], deleted [bold]{stats.deleted}[/bold], "
+           f"skipped [bold]{stats.skipped}[/bold] chunks.")
+    if getattr(coll, "dedup", None) is not None:
+        stored, refs = coll.dedup.counts()
+        rprint(f"Dedup: {stats.deduped} of {stats.added + stats.deduped} new chunks were near-duplicates "
+               f"({stats.dedup_ratio:.1%}); index-wide {refs} of {stored + refs} chunks are references "
+               f"({refs / max(1, stored + refs):.1%})" + (f", {stats.promoted} re-stored" if stats.promoted else "") + ".")
+
+
+@app.command()
+def watch(
+    interval: float = typer.Option(WATCH_INTERVAL, help="Seconds between polls of the transcripts folder"),
+    once: bool = typer.Option(False, "--once", help="Index what is new, then exit"),
+):
+    """
+    Index transcripts while they are being written. Each poll reads only the bytes appended
+    since the last one and re-embeds only each call's last (still open) chunk plus any new
+    chunks, so `ask` can query a call in progress. Edited files are re-read; removed ones are
+    left to `ingest`. Stop with Ctrl-C.
+    """
+    tdir = pathlib.Path(TRANSCRIPTS_DIR)
+    if not tdir.exists():
+        rprint(f"[red]Missing transcripts directory:[/red] {TRANSCRIPTS_DIR}")
+        raise typer.Exit(code=1)
+
+    from utils.cache import bump_index_version
+    from utils.embeddings import get_collection, get_embedding_function, persist_collection, store_layout
+    from utils.manifest import load_manifest, save_manifest
+    from utils.lexical import LexicalIndex
+    from utils.watch import poll
+
+    manifest = load_manifest(MANIFEST_PATH)
+    if manifest["files"] and manifest.get("store", "chroma") != store_layout():
+        rprint(f"[red]The index was built for {manifest.get('store', 'chroma')}, not {store_layout()}:[/red] "
+               f"run ingest first.")
+        raise typer.Exit(code=1)
+    from utils.ingestion import TAGGER
+    if manifest["files"] and manifest.get("tags") != TAGGER.fingerprint:
+        rprint("[red]The tag set (tags.toml) changed since the last ingest:[/red] run ingest first.")
+        raise typer.Exit(code=1)
+    manifest["store"], manifest["tags"] = store_layout(), TAGGER.fingerprint
+    ef = get_embedding_function()
+    coll = get_collection(PERSIST_DIR, embedding_function=ef)
+    lexical = LexicalIndex.load(LEXICAL_DIR)
+    catalog = _catalog()
+    segments = _segments()
+    if not once:
+        rprint(f"Watching [bold]{TRANSCRIPTS_DIR}[/bold] every {interval:g}s (Ctrl-C to stop)…")
+    try:
+        while True:
+            stats = poll(coll, sorted(tdir.glob("*.txt")), manifest, max_chars=MAX_CHARS,
+                         batch_size=INGEST_BATCH_SIZE, settle=WATCH_SETTLE, ef=ef, catalog=catalog,
+                         lexical=lexical, segments=segments, log=rprint)
+            if stats.added or stats.deleted or stats.deduped:
+                persist_collection(coll)
+                if lexical.dirty:
+                    lexical.save()
+                bump_index_version(INDEX_VERSION_PATH)  # retires cached search results
+            if stats.files_changed:
+                save_manifest(MANIFEST_PATH, manifest)
+            if once:
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass  # everything is saved after each poll
+
+
+@app.command()
+def maintain(
+    dry_run: bool = typer.Option(False, "--dry-run", help="Only report what would be removed"),
+    compact: bool = typer.Option(True, help="Rebuild Chroma collections / compact flat stores into fresh files"),
+    tune: bool = typer.Option(False, "--tune", help="Sweep HNSW parameters (recall@k vs latency) and keep the best"),
+    k: int = typer.Option(10, help="k for the sweep's recall@k"),
+    sample: int = typer.Option(MAINTAIN_SWEEP_SAMPLE, help="Stored vectors indexed per sweep configuration"),
+):
+    """
+    Garbage-collect and compact the index. Deletes chunks whose transcript is gone or that
+    the manifest no longer lists (plus their lexical and catalog entries), drops collections
+    of an earlier VECTOR_BACKEND/VECTOR_SHARDS layout, rebuilds into fresh storage and
+    reports the space reclaimed. With DEDUP=1, references of removed calls are dropped and
+    references whose canonical chunk was deleted are embedded and stored themselves.
+    --tune first measures HNSW settings and saves the choice for new collections (and this
+    run's rebuild). Don't run it while ingest/watch is writing.
+    """
+    tdir = pathlib.Path(TRANSCRIPTS_DIR)
+    if not tdir.exists():
+        rprint(f"[red]Missing transcripts directory:[/red] {TRANSCRIPTS_DIR}")
+        raise typer.Exit(code=1)
 
-    total_chunks = 0
-    total_files = 0
-    for fp in files:
-        segs = parse_file(str(fp))
-        chunks = chunk_segments(segs, max_chars=MAX_CHARS)
-        upserted = upsert_chunks(coll, chunks)
-        total_chunks += upserted
-        total_files += 1
-        rprint(f"Ingested [bold]{fp.name}[/bold]: {len(segs)} segments → {upserted} chunks")
+    from utils import maintenance as mt
+    from utils.cache import bump_index_version
+    from utils.embeddings import (
+        delete_chunks, get_collection, get_embedding_function, persist_collection, store_collections, store_layout,
+    )
+    from utils.ingestion import call_id_for
+    from utils.lexical import LexicalIndex
+    from utils.manifest import load_manifest, save_manifest
 
-    rprint(f"[green]Done.[/green] Upserted [bold]{total_chunks}[/bold] chunks from [bold]{total_files}[/bold] file(s).")
+    before = mt.dir_size(PERSIST_DIR)
+    coll = get_collection(PERSIST_DIR, embed=False)
+    manifest = load_manifest(MANIFEST_PATH)
+    lexical = LexicalIndex.load(LEXICAL_DIR)
+    catalog = _catalog()
+    present = {call_id_for(str(fp)) for fp in tdir.glob("*.txt")}
+
+    data = coll.get(include=["metadatas"])
+    ids = list(data["ids"])
+    call_of = {cid: (meta or {}).get("call_id", "") for cid, meta in zip(ids, data["metadatas"] or [])}
+    gone, stray = mt.find_orphans(call_of.items(), present, manifest)
+    dead = set(gone) | set(stray)
+    index = getattr(coll, "dedup", None)
+    refs = index.ref_ids() if index is not None else []
+    ref_dead = [rid for rid, call in refs if call not in present]
+    live = set(ids) | {rid for rid, call in refs if call in present}
+    lex_dead = sorted((set(lexical.id_pos) - live) | (dead & set(lexical.id_pos)))
+    gone_calls = sorted({call_of[cid] for cid in gone} | (set(catalog.call_ids()) - present))
+    gone_files = sorted(name for name, e in manifest["files"].items() if e["call_id"] not in present)
+    segments = _segments()
+    seg_dead = sorted(set(segments.call_ids()) - present)
+    current = store_collections()
+    backend = current[0][0]
+    stale = mt.stale_stores(PERSIST_DIR, current) if manifest.get("store", "chroma") == store_layout() else []
+
+    rprint(f"Orphans: [bold]{len(gone)}[/bold] chunks of {len(gone_calls)} removed call(s)"
+           + (f" ({', '.join(gone_calls[:5])}{', …' if len(gone_calls) > 5 else ''})" if gone_calls else "")
+           + f", [bold]{len(stray)}[/bold] chunks no manifest entry lists, {len(lex_dead)} lexical entries, "
+             f"{len(seg_dead)} segment files" + (f", {len(ref_dead)} dedup references" if index is not None else "")
+           + ".")
+    for kind, name in stale:
+        rprint(f"Stale store: {kind} collection [bold]{name}[/bold] (layout is {store_layout()})")
+    if manifest.get("store", "chroma") != store_layout() and manifest["files"]:
+        rprint(f"[yellow]Index was built for {manifest.get('store', 'chroma')}; run ingest before removing "
+               f"old stores.[/yellow]")
+    if dry_run:
+        return
+
+    changed = bool(dead)
+    delete_chunks(coll, sorted(dead))
+    if index is not None:
+        promoted = _promote_refs(coll, index, dead, present, manifest, tdir, lexical)
+        changed = changed or bool(promoted or ref_dead)
+        if promoted:
+            rprint(f"Stored {promoted} dedup references whose canonical chunk was removed.")
+    lexical.remove(lex_dead)
+    if lexical.dirty:
+        lexical.save()
+    for call in gone_calls:
+        catalog.delete(call)
+    for call in seg_dead:
+        segments.delete(call)
+    for name in gone_files:
+        manifest["files"].pop(name)
+    if gone_files:
+        save_manifest(MANIFEST_PATH, manifest)
+    for kind, name in stale:
+        mt.drop_store(PERSIST_DIR, kind, name)
+
+    if tune:
+        if backend != "chroma":
+            rprint("[yellow]--tune: the flat backend has no HNSW graph to tune; skipped.[/yellow]")
+        elif len(ids) - len(dead) < 2 * k:
+            rprint(f"[yellow]--tune: need at least {2 * k} chunks; skipped.[/yellow]")
+        else:
+            import random
+            from rich.table import Table
+            keep = [cid for cid in ids if cid not in dead]
+            picked = random.Random(0).sample(keep, min(sample, len(keep)))
+            vecs = coll.get(ids=picked, include=["embeddings"])["embeddings"]
+            rprint(f"Sweeping HNSW parameters on {len(picked)} vectors…")
+            results = mt.sweep(vecs, k=k, n_queries=MAINTAIN_SWEEP_QUERIES)
+            best = mt.pick(results, MAINTAIN_RECALL_TARGET)
+            table = Table(title=f"HNSW sweep (recall@{k}, target {MAINTAIN_RECALL_TARGET:g})")
+            for col in ("M", "construction_ef", "search_ef", "recall", "p50 ms", "build s"):
+                table.add_column(col, justify="right")
+            for r in results:
+                mark = "[bold green]" if r is best else ""
+                table.add_row(*(f"{mark}{v}" for v in (r["M"], r["construction_ef"], r["search_ef"],
+                                                          f"{r['recall']:.3f}", f"{r['p50_ms']:.2f}", f"{r['build_s']:.1f}")))
+            rprint(table)
+            path = mt.save_hnsw_settings(PERSIST_DIR, best, k=k, sample=len(picked), target=MAINTAIN_RECALL_TARGET)
+            mt.apply_search_ef(PERSIST_DIR, [name for _, name in current], best["search_ef"])
+            rprint(f"Saved M={best['M']} construction_ef={best['construction_ef']} search_ef={best['search_ef']} "
+                   f"to {path}" + ("" if compact else " (M/construction_ef apply to collections built from now on)"))
+
+    if compact:
+        if backend == "chroma":
+            ef = get_embedding_function()
+            coll = None  # the handle points at the collection being replaced
+            for _, name in current:
+                n = mt.rebuild_chroma(PERSIST_DIR, name, ef)
+                rprint(f"Rebuilt [bold]{name}[/bold]: {n} chunks copied into fresh storage")
+            mt.reclaim_chroma(PERSIST_DIR)
+        else:
+            coll.save(compact=True)
+        changed = True
+    elif coll is not None:
+        persist_collection(coll)
+
+    if changed:
+        bump_index_version(INDEX_VERSION_PATH)  # retires cached search results
+    after = mt.dir_size(PERSIST_DIR)
+    rprint(f"[green]Done.[/green] Removed {len(dead)} chunks; {PERSIST_DIR}: {before / 2**20:.1f} MB → "
+           f"{after / 2**20:.1f} MB (reclaimed [bold]{max(0, before - after) / 2**20:.1f} MB[/bold]).")
+
+
+def _promote_refs(coll, index, dead: set, present: set, manifest: dict, tdir: pathlib.Path, lexical) -> int:
+    """maintain: drop references of removed calls; embed and store the live ones whose canonical was deleted."""
+    from utils import dedup
+    from utils.embeddings import get_embedding_function, upsert_chunks
+    from utils.ingestion import call_id_for
+
+    index.prune(present)
+    orphans = index.remove(sorted(dead))
+    live = {cid for e in manifest["files"].values() if e["call_id"] in present for cid in e["chunk_ids"]}
+    paths = {call_id_for(str(fp)): str(fp) for fp in tdir.glob("*.txt")}
+    chunks = [c for c in dedup.promote(orphans, paths, MAX_CHARS, index.hasher) if c["id"] in live]
+    store, _ = dedup.split(index, chunks)
+    if store:
+        ef = get_embedding_function()
+        upsert_chunks(coll, store, ef([c["text"] for c in store]))
+        lexical.add(store)
+    index.commit()
+    return len(chunks)
 
 
 # ----------------------------- Listing -------------------------------
 @app.command("list")
-def list_calls():
+def list_calls(
+    stats: bool = typer.Option(False, "--stats", help="Show chunk/segment counts, time range and flag counts"),
+):
     """
     List all call_ids currently indexed.
     """
-    coll = get_collection(PERSIST_DIR)
-    ids = list_call_ids(coll)
-    if not ids:
+    client = _client()
+    if client:
+        rows = _remote(client.calls, 3)
+    else:
+        rows = _catalog().rows()
+        if not rows and not stats:
+            # index built before the catalog existed: fall back to a metadata scan
+            from utils.embeddings import get_collection
+            from utils.retrieval import list_call_ids
+            rows = [{"call_id": cid} for cid in list_call_ids(get_collection(PERSIST_DIR, embed=False))]
+    if not rows:
         rprint("[yellow]No calls indexed yet. Run: python main.py ingest[/yellow]")
         raise typer.Exit(code=3)
 
-    rprint("[bold]Indexed call IDs:[/bold]")
-    for cid in ids:
-        rprint(f" • {cid}")
+    if stats and "chunk_count" not in rows[0]:
+        rprint("[yellow]No call catalog yet. Run: python main.py ingest[/yellow]")
+        raise typer.Exit(code=3)
+    if not stats:
+        rprint("[bold]Indexed call IDs:[/bold]")
+        for r in rows:
+            rprint(f" • {r['call_id']}")
+        return
+
+    from rich.table import Table
+    flags = sorted({f for r in rows for f in r.get("flag_counts", {})})
+    table = Table(title="Indexed calls")
+    for col in ("call_id", "chunks", "segments", "first", "last", "modified"):
+        table.add_column(col, justify="right" if col in ("chunks", "segments") else "left")
+    for f in flags:
+        table.add_column(f.replace("mentions_", ""), justify="right")
+    for r in rows:
+        table.add_row(
+            r["call_id"], str(r["chunk_count"]), str(r["segment_count"]),
+            r["first_ts"] or "?", r["last_ts"] or "?",
+            time.strftime("%Y-%m-%d %H:%M", time.localtime(r["source_mtime"])),
+            *[str(r["flag_counts"].get(f, 0)) for f in flags],
+        )
+    rprint(table)
 
 
 # ----------------------------- Q&A -----------------------------------
@@ -69,6 +491,12 @@ def ask(
     pricing_only: bool = False,
     security_only: bool = False,
     competitor_only: bool = False,
+    tag: Optional[List[str]] = typer.Option(None, "--tag", help="Only chunks with this tag (tags.toml); repeatable"),
+    mode: str = typer.Option("hybrid", help="Retrieval: hybrid (BM25 + vector, RRF-fused), vector or lexical"),
+    stream: bool = typer.Option(False, "--stream", help="Print the answer as it is generated (in-process only)"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Bypass the retrieval and LLM response caches"),
+    expand: int = typer.Option(0, "--expand", help="Widen each hit by N neighbouring transcript lines on each side"),
+    diversity: float = typer.Option(SEARCH_DIVERSITY, help="MMR re-ranking: 0 = relevance only, up to 1 = favour distinct hits"),
 ):
     """
     Ask a free-form question over the indexed calls.
@@ -79,9 +507,20 @@ def ask(
       uv run python main.py ask "Security concerns?" --security-only
       uv run python main.py ask "Which competitors came up?" --competitor-only
       uv run python main.py ask "Pricing objections" --pricing-only --call-id 4_negotiation_call
+      uv run python main.py ask "Who has to sign off, and when?" --tag decision_maker --tag timeline
+      uv run python main.py ask "Who asked about DPDPA?" --mode lexical
+      uv run python main.py ask "What was the final discount?" --expand 3
+      uv run python main.py ask "How did we pitch pricing?" --diversity 0.5
     """
-    coll = get_collection(PERSIST_DIR)
-
+    if mode not in ("hybrid", "vector", "lexical"):
+        rprint("[red]--mode must be hybrid, vector or lexical[/red]")
+        raise typer.Exit(code=2)
+    if expand < 0:
+        rprint("[red]--expand must be >= 0[/red]")
+        raise typer.Exit(code=2)
+    if not 0.0 <= diversity <= 1.0:
+        rprint("[red]--diversity must be between 0 and 1[/red]")
+        raise typer.Exit(code=2)
     where: dict[str, object] = {}
     if call_id:
         where["call_id"] = call_id
@@ -91,14 +530,161 @@ def ask(
         where["mentions_security"] = True
     if competitor_only:
         where["mentions_competitor"] = True
+    if tag:
+        from utils.ingestion import TAGGER
+        from utils.tagging import field_for
+        unknown = [t for t in tag if t not in TAGGER.names]
+        if unknown:
+            rprint(f"[red]Unknown tag(s): {', '.join(unknown)}.[/red] Tags: {', '.join(TAGGER.names)}")
+            raise typer.Exit(code=2)
+        where.update({field_for(t): True for t in tag})
+
+    client = _client()
+    if client:
+        if stream:
+            rprint("[red]--stream works in-process only:[/red] unset --server/COPILOT_SERVER to stream.")
+            raise typer.Exit(code=2)
+        print(_remote(lambda: client.ask(q, k=k, where=where, no_cache=no_cache, mode=mode, expand=expand,
+                                               diversity=diversity), 4))
+        return
+
+    _check_call_id(call_id, 4)
+    _check_tags(where)
+
+    from utils.embeddings import get_collection
+    from utils.retrieval import search
+    from utils.prompts import ask_qa
 
-    hits = search(coll, q, k=k, where=where)
+    coll = get_collection(PERSIST_DIR)
+    if not coll.count():  # nothing to match, so don't load the embedding model to find that out
+        rprint("[yellow]No calls indexed yet. Run: python main.py ingest[/yellow]")
+        raise typer.Exit(code=4)
+    lexical = None
+    if mode != "vector":
+        from utils.lexical import LexicalIndex
+        lexical = LexicalIndex.load(LEXICAL_DIR)
+    hits = search(coll, q, k=k, where=where, cache=None if no_cache else _retrieval_cache(),
+                  mode=mode, lexical=lexical, stats=_filter_stats(), diversity=diversity)
     if not hits:
         rprint("[yellow]No matches found. Try increasing --k or removing filters.[/yellow]")
         raise typer.Exit(code=4)
+    if expand:
+        from utils.segstore import expand_hits
+        hits = expand_hits(hits, _segments(), expand)
+
+    info: dict = {}
+    if stream:
+        ask_qa(q, hits, use_cache=not no_cache, info=info, on_token=_print_token)
+        print()
+    else:
+        print(ask_qa(q, hits, use_cache=not no_cache, info=info))
+    _report_llm(info)
+
+
+@app.command("ask-batch")
+def ask_batch(
+    input_path: pathlib.Path = typer.Argument(..., help="JSONL file: {\"q\": ..., \"call_id\": ..., \"pricing_only\": true, \"k\": 8}"),
+    out: str = typer.Option("-", help="Where to write result JSONL ('-' = stdout)"),
+    k: int = typer.Option(6, help="Default top-K for items without their own 'k'"),
+    mode: str = typer.Option("hybrid", help="Retrieval: hybrid, vector or lexical"),
+    concurrency: int = typer.Option(BATCH_CONCURRENCY, help="LLM requests in flight"),
+    retries: int = typer.Option(LLM_RETRIES, help="Retries per LLM request on timeouts/429/5xx"),
+    timeout: float = typer.Option(LLM_TIMEOUT, help="Seconds per LLM attempt"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Bypass the retrieval and LLM response caches"),
+):
+    """
+    Answer a file of questions in one process: batched retrieval, concurrent LLM calls.
+    Writes one JSON line per question, in input order, with per-item latency.
+    """
+    import json
+    from rich.console import Console
+    from utils.batch import item_where, load_items, run_batch
+
+    if mode not in ("hybrid", "vector", "lexical"):
+        rprint("[red]--mode must be hybrid, vector or lexical[/red]")
+        raise typer.Exit(code=2)
+    try:
+        items = load_items(str(input_path))
+    except (OSError, ValueError) as e:
+        rprint(f"[red]Cannot read questions:[/red] {e}")
+        raise typer.Exit(code=8)
+    if not items:
+        rprint(f"[yellow]No questions in {input_path}[/yellow]")
+        raise typer.Exit(code=8)
 
-    answer = ask_qa(q, hits)
-    print(answer)
+    # results go to stdout by default, so progress/summary goes to stderr
+    err = Console(stderr=True)
+    sink = sys.stdout if out == "-" else open(out, "w", encoding="utf-8")
+
+    def write(row: dict) -> None:
+        sink.write(json.dumps(row, ensure_ascii=False) + "\n")
+        sink.flush()
+
+    try:
+        client = _client()
+        if client:
+            totals = _ask_batch_remote(client, items, write, k, mode, concurrency, no_cache)
+        else:
+            _check_tags(*(item_where(it) for it in items))
+            from utils.embeddings import get_collection
+            coll = get_collection(PERSIST_DIR)
+            lexical = None
+            if mode != "vector":
+                from utils.lexical import LexicalIndex
+                lexical = LexicalIndex.load(LEXICAL_DIR)
+            totals = run_batch(
+                coll, items, write, k=k, mode=mode, lexical=lexical,
+                cache=None if no_cache else _retrieval_cache(),
+                concurrency=concurrency, timeout=timeout, retries=retries, use_cache=not no_cache,
+                stats=_filter_stats(), segments=_segments() if any(it.get("expand") for it in items) else None,
+            )
+    finally:
+        if sink is not sys.stdout:
+            sink.close()
+    err.print(f"[green]Done.[/green] {totals['items']} question(s) in {totals['wall_ms'] / 1000:.2f}s "
+              f"(retrieval {totals.get('retrieval_ms', 0) / 1000:.2f}s), "
+              f"errors {totals['errors']}, no hits {totals['no_hits']}")
+
+
+def _ask_batch_remote(client: CopilotClient, items: list, write, k: int, mode: str, concurrency: int,
+                      no_cache: bool) -> dict:
+    """
+    ask-batch through a running server: the server is already warm, so just fan out /ask calls.
+    Rows match run_batch's; each item is its own retrieval "batch" on the server.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from utils.batch import item_where
+
+    def one(i: int) -> dict:
+        it, info = items[i], {}
+        row = {"index": i, "q": it["q"], "where": item_where(it)}
+        try:
+            row["answer"] = client.ask(it["q"], k=int(it.get("k") or k), where=row["where"], no_cache=no_cache,
+                                       mode=mode, expand=it.get("expand", 0), diversity=it.get("diversity", 0.0),
+                                       info=info)
+        except (ServerError, OSError) as e:
+            row["answer"] = ""
+            info["error"] = "no_hits" if isinstance(e, ServerError) and e.status == 404 else str(e)
+        row.update(hit_ids=info.get("hit_ids", []), batch_retrieval_ms=info.get("retrieval_ms", 0.0),
+                   llm_ms=info.get("llm_ms", 0.0), latency_ms=0.0, attempts=info.get("attempts", 0),
+                   cached=info.get("cached", False), context=info.get("context"))
+        if "id" in it:
+            row["id"] = it["id"]
+        if info.get("error"):
+            row["error"] = info["error"]
+        return row
+
+    t0, totals = time.perf_counter(), {"items": len(items), "errors": 0, "no_hits": 0, "retrieval_ms": 0.0}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for row in pool.map(one, range(len(items))):  # map() yields in input order
+            if "error" in row:
+                totals["no_hits" if row["error"] == "no_hits" else "errors"] += 1
+            totals["retrieval_ms"] += row["batch_retrieval_ms"]
+            row["latency_ms"] = round((time.perf_counter() - t0) * 1000, 1)  # queueing included, as run_batch
+            write(row)
+    totals["retrieval_ms"] = round(totals["retrieval_ms"], 1)
+    totals["wall_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return totals
 
 
 # ----------------------------- Summarize ------------------------------
@@ -107,11 +693,17 @@ def summarize(
     call_id: str = typer.Option("", help="Call ID to summarize (e.g. 4_negotiation_call)"),
     last: bool = typer.Option(False, help="Summarize the most recently modified transcript"),
     k: int = typer.Option(12, help="Number of chunks to retrieve for the summary"),
+    full: bool = typer.Option(False, "--full", help="Cover every chunk of the call (parallel map-reduce) instead of the top-k"),
+    stream: bool = typer.Option(False, "--stream", help="Print the summary as it is generated (in-process only)"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Bypass the retrieval and LLM response caches"),
 ):
     """
     Summarize a specific call by ID, or the most recent transcript with --last.
     """
-    # Resolve --last -> call_id
+    # Resolve --last -> call_id (catalog first; glob the folder for pre-catalog indexes)
+    if last and not call_id and not _client():
+        newest = _catalog().latest()
+        call_id = newest["call_id"] if newest else ""
     if last and not call_id:
         files = sorted(
             pathlib.Path(TRANSCRIPTS_DIR).glob("*.txt"),
@@ -127,13 +719,102 @@ def summarize(
         rprint("[yellow]Provide --call-id <id> or use --last[/yellow]")
         raise typer.Exit(code=6)
 
-    coll = get_collection(PERSIST_DIR)
-    hits = search(coll, f"summary of {call_id}", k=k, where={"call_id": call_id})
+    client = _client()
+    if client:
+        if stream:
+            rprint("[red]--stream works in-process only:[/red] unset --server/COPILOT_SERVER to stream.")
+            raise typer.Exit(code=2)
+        print(_remote(lambda: client.summarize(call_id, k=k, no_cache=no_cache, full=full), 7))
+        return
+
+    _check_call_id(call_id, 7)
+
+    from utils.embeddings import get_collection
+    from utils.retrieval import search, get_call_chunks
+    from utils.prompts import summarize_call, summarize_call_full
+
+    if full:
+        # coll.get needs no query embedding, so skip loading the model
+        hits = get_call_chunks(get_collection(PERSIST_DIR, embed=False), call_id)
+    else:
+        hits = search(get_collection(PERSIST_DIR), f"summary of {call_id}", k=k, where={"call_id": call_id},
+                      cache=None if no_cache else _retrieval_cache(), stats=_filter_stats())
     if not hits:
         rprint(f"[yellow]No chunks found for call_id '{call_id}'.[/yellow]")
         raise typer.Exit(code=7)
 
-    print(summarize_call(call_id, hits))
+    summarize = summarize_call_full if full else summarize_call
+    info: dict = {}
+    if stream:
+        summarize(call_id, hits, use_cache=not no_cache, info=info, on_token=_print_token)
+        print()
+    else:
+        print(summarize(call_id, hits, use_cache=not no_cache, info=info))
+    _report_llm(info)
+
+
+# ----------------------------- Cache ----------------------------------
+@app.command("cache-stats")
+def cache_stats(
+    clear: bool = typer.Option(False, help="Empty the on-disk caches after printing"),
+):
+    """
+    Show retrieval/LLM cache hit/miss counters (from the server if --server is set, else the disk tiers).
+    """
+    client = _client()
+    if client:
+        rprint(_remote(client.stats, 1))
+        return
+    if not RETRIEVAL_CACHE_PATH:
+        rprint("[yellow]Disk cache disabled (RETRIEVAL_CACHE_PATH is empty).[/yellow]")
+        return
+    cache = _retrieval_cache()
+    info = cache.disk.info()
+    total = info.get("hits", 0) + info.get("misses", 0)
+    rate = f"{100.0 * info.get('hits', 0) / total:.1f}%" if total else "n/a"
+    rprint(f"[bold]Retrieval cache[/bold] ({RETRIEVAL_CACHE_PATH}): {info['entries']} entries, "
+           f"{info['bytes'] / 1024:.1f} KiB, hits {info.get('hits', 0)}, misses {info.get('misses', 0)}, hit rate {rate}")
+    if LLM_CACHE_PATH:
+        from utils.cache import DiskCache
+        llm = DiskCache(LLM_CACHE_PATH)
+        li = llm.info()
+        rprint(f"[bold]LLM response cache[/bold] ({LLM_CACHE_PATH}): {li['entries']} entries, "
+               f"{li['bytes'] / 1024:.1f} KiB, hits {li.get('hits', 0)}, misses {li.get('misses', 0)}")
+    if clear:
+        cache.disk.clear()
+        if LLM_CACHE_PATH:
+            llm.clear()
+        rprint("[green]Cleared.[/green]")
+
+
+# ----------------------------- Server ---------------------------------
+@app.command()
+def serve(
+    host: str = typer.Option("127.0.0.1", help="Interface to bind"),
+    port: int = typer.Option(8765, help="Port to listen on"),
+    verbose: bool = typer.Option(False, help="Log each request to stderr"),
+):
+    """
+    Run a local HTTP/JSON query server that keeps the collection, embedding model and
+    LLM client warm. Point the CLI at it with --server http://127.0.0.1:8765.
+    """
+    from utils.embeddings import get_collection
+    from utils.lexical import LexicalIndex
+    from utils.prompts import get_client
+    from utils.server import make_server
+
+    coll = get_collection(PERSIST_DIR)
+    coll.query(query_texts=["warmup"], n_results=1)  # load the embedding model + HNSW index now
+    get_client()  # build the LLM client up front
+    srv = make_server(coll, host=host, port=port, verbose=verbose, cache=_retrieval_cache(), catalog=_catalog(),
+                      lexical=LexicalIndex.load(LEXICAL_DIR), segments=_segments())
+    rprint(f"[green]Serving[/green] on http://{host}:{srv.server_address[1]} (Ctrl+C to stop)")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
 
 
 # ----------------------------- Entrypoint -----------------------------
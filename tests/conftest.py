@@ -3,3 +3,54 @@ import sys, pathlib
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
+
+import hashlib
+import pytest
+from chromadb import EmbeddingFunction
+
+class HashEmbedding(EmbeddingFunction):
+    """Offline stand-in for DefaultEmbeddingFunction: bag-of-words hashed into 64 dims."""
+    DIM = 64
+
+    def __init__(self):
+        self.calls = 0
+        self.embedded = 0
+
+    def __call__(self, input):
+        import numpy as np
+        self.calls += 1
+        self.embedded += len(input)
+        out = []
+        for t in input:
+            v = np.full(self.DIM, 1e-3, dtype=np.float32)
+            for w in t.lower().split():
+                v[int(hashlib.md5(w.encode()).hexdigest(), 16) % self.DIM] += 1.0
+            out.append(v / np.linalg.norm(v))
+        return out
+
+    @staticmethod
+    def name():
+        return "hash-test"
+
+    def get_config(self):
+        return {}
+
+    @staticmethod
+    def build_from_config(config):
+        return HashEmbedding()
+
+@pytest.fixture
+def hash_ef():
+    return HashEmbedding()
+
+@pytest.fixture
+def mem_collection(hash_ef, request):
+    """Fresh in-memory Chroma collection using the offline embedding function."""
+    import chromadb
+    client = chromadb.EphemeralClient()
+    name = "t-" + hashlib.md5(request.node.nodeid.encode()).hexdigest()[:12]
+    try:
+        client.delete_collection(name)
+    except Exception:
+        pass
+    return client.get_or_create_collection(name, embedding_function=hash_ef, metadata={"hnsw:space": "cosine"})
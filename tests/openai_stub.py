@@ -0,0 +1,92 @@
+# tests/openai_stub.py
+"""
+Minimal OpenAI-compatible /v1/chat/completions server for offline tests.
+
+  stub = OpenAIStub(tokens=["Hello", " world"], delay=0.01).start()
+  client = OpenAI(base_url=stub.url, api_key="test")
+  ...
+  stub.stop()
+
+Streams SSE chunks when the request has "stream": true. Set `fail_after=N` to emit an
+error event after N tokens (what a provider does when it drops a stream).
+"""
+import json, threading, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class OpenAIStub:
+    def __init__(self, tokens=("Hello", ",", " world", "."), delay: float = 0.0, fail_after: int | None = None):
+        self.tokens = list(tokens)
+        self.delay = delay
+        self.fail_after = fail_after
+        self.requests = []
+        self._srv = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._srv.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._srv.server_address[1]}/v1"
+
+    def start(self) -> "OpenAIStub":
+        threading.Thread(target=self._srv.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._srv.shutdown()
+        self._srv.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.0"  # end of stream = connection close
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                stub.requests.append(body)
+                if not self.path.endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                if body.get("stream"):
+                    self._stream(body)
+                else:
+                    self._json({
+                        "id": "stub", "object": "chat.completion", "created": 0, "model": body.get("model"),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": "".join(stub.tokens)}}],
+                    })
+
+            def _json(self, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _event(self, payload):
+                self.wfile.write(f"data: {json.dumps(payload) if not isinstance(payload, str) else payload}\n\n".encode())
+                self.wfile.flush()
+
+            def _chunk(self, model, delta, finish=None):
+                return {"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+
+            def _stream(self, body):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                model = body.get("model")
+                self._event(self._chunk(model, {"role": "assistant", "content": ""}))
+                for i, tok in enumerate(stub.tokens):
+                    if stub.fail_after is not None and i >= stub.fail_after:
+                        self._event({"error": {"message": "stream dropped", "type": "server_error"}})
+                        return
+                    time.sleep(stub.delay)
+                    self._event(self._chunk(model, {"content": tok}))
+                self._event(self._chunk(model, {}, finish="stop"))
+                self._event("[DONE]")
+
+        return Handler
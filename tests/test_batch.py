@@ -0,0 +1,133 @@
+import asyncio, json, pathlib
+from types import SimpleNamespace
+
+import pytest
+from typer.testing import CliRunner
+
+import main
+import utils.prompts as prompts
+from utils import embeddings
+from utils.embeddings import upsert_chunks
+from utils.ingestion import parse_file, chunk_segments
+from utils.retrieval import search, search_many
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+class Status503(Exception):
+    status_code = 503
+
+class FakeAsyncCompletions:
+    """Answers after a delay that shrinks with the question number, so completions arrive out of order."""
+
+    def __init__(self):
+        self.calls = 0
+        self.in_flight = self.peak = 0
+        self.fail_first = set()
+
+    async def create(self, model, messages, temperature):
+        self.calls += 1
+        q = messages[-1]["content"].split("Question: ")[1].split("\n")[0]
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(0.05 / (1 + int(q.split("#")[1])))
+            if q in self.fail_first:
+                self.fail_first.discard(q)
+                raise Status503("busy")
+        finally:
+            self.in_flight -= 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"re: {q}"))])
+
+@pytest.fixture
+def indexed(tmp_path, monkeypatch, mem_collection):
+    for fp in sorted((ROOT / "transcripts").glob("*.txt")):
+        upsert_chunks(mem_collection, chunk_segments(parse_file(str(fp)), max_chars=600))
+    monkeypatch.setattr(embeddings, "get_collection", lambda *a, **kw: mem_collection)
+    monkeypatch.setattr(main, "LEXICAL_DIR", str(tmp_path / "lexical"))
+    monkeypatch.setattr(main, "RETRIEVAL_CACHE_PATH", "")
+    comp = FakeAsyncCompletions()
+    monkeypatch.setattr(prompts, "client", object())
+    monkeypatch.setattr(prompts, "async_client", SimpleNamespace(chat=SimpleNamespace(completions=comp)))
+    monkeypatch.setattr(prompts, "DEFAULT_MODEL", "test-model")
+    monkeypatch.setattr(prompts, "LLM_CACHE_PATH", "")
+    monkeypatch.setattr(prompts, "_response_cache", None)
+    return mem_collection, comp
+
+def test_search_many_matches_search_with_one_query_per_filter(indexed, hash_ef):
+    coll, _ = indexed
+    queries = [("pricing per seat", None), ("security review", {"call_id": "3_objection_call"}),
+               ("next steps", None), ("discount", {"call_id": "no_such_call"})]
+    hash_ef.calls = 0
+    batched = search_many(coll, queries, k=3, mode="vector")
+    # the unfiltered pair shares one embedding call, the call_id filter is scored exhaustively
+    # (one more), and the unknown call matches no chunks so nothing is embedded for it
+    assert hash_ef.calls == 2
+    for (q, where), hits in zip(queries, batched):
+        assert [h["id"] for h in hits] == [h["id"] for h in search(coll, q, k=3, where=where)]
+
+def test_ask_batch_keeps_input_order_and_retries(indexed, tmp_path):
+    _, comp = indexed
+    qfile, out = tmp_path / "qs.jsonl", tmp_path / "answers.jsonl"
+    lines = [{"q": f"question #{i}", "call_id": "2_pricing_call" if i % 2 else ""} for i in range(6)]
+    lines[3]["pricing_only"] = True
+    qfile.write_text("\n".join(json.dumps(x) for x in lines) + "\n\n", encoding="utf-8")
+    comp.fail_first = {"question #1"}
+
+    res = CliRunner().invoke(main.app, ["ask-batch", str(qfile), "--out", str(out), "--mode", "vector",
+                                        "--concurrency", "3"])
+    assert res.exit_code == 0, res.output
+    rows = [json.loads(x) for x in out.read_text(encoding="utf-8").splitlines()]
+    assert [r["index"] for r in rows] == list(range(6))
+    assert all(r["answer"].startswith(f"re: question #{r['index']}") for r in rows)
+    assert rows[1]["attempts"] == 2 and "error" not in rows[1]
+    assert rows[3]["where"] == {"call_id": "2_pricing_call", "mentions_pricing": True}
+    assert all(r["hit_ids"] and r["latency_ms"] >= r["llm_ms"] > 0 and r["batch_retrieval_ms"] > 0 for r in rows)
+    # latency runs until the row is written: #5 answers fast but waits for a slot and for #0's row
+    assert [r["latency_ms"] for r in rows] == sorted(r["latency_ms"] for r in rows)
+    assert rows[5]["latency_ms"] - rows[5]["llm_ms"] > 10
+    assert comp.peak <= 3 and comp.calls == 7
+
+def test_ask_batch_rejects_bad_input(indexed, tmp_path):
+    qfile = tmp_path / "qs.jsonl"
+    qfile.write_text('{"q": "ok"}\n{"call_id": "x"}\n', encoding="utf-8")
+    res = CliRunner().invoke(main.app, ["ask-batch", str(qfile)], env={"COLUMNS": "400"})
+    assert res.exit_code == 8 and ":2: missing 'q'" in res.output
+
+def test_ask_batch_items_diversify_like_ask(indexed, tmp_path):
+    from utils.batch import load_items, run_batch
+    coll, _ = indexed
+    qfile = tmp_path / "qs.jsonl"
+    qfile.write_text('{"q": "pricing per seat", "k": 3, "diversity": 0.7}\n{"q": "x", "expand": -1}\n',
+                     encoding="utf-8")
+    with pytest.raises(ValueError, match=":2: 'expand'"):
+        load_items(str(qfile))
+    rows = []
+    run_batch(coll, [{"q": "pricing per seat", "k": 3, "diversity": 0.7}, {"q": "pricing per seat", "k": 3}],
+              rows.append, mode="vector")
+    assert rows[0]["hit_ids"] == [h["id"] for h in search(coll, "pricing per seat", k=3, diversity=0.7)]
+    assert rows[1]["hit_ids"] == [h["id"] for h in search(coll, "pricing per seat", k=3)]
+
+def test_only_transient_llm_errors_are_retried():
+    import openai
+    from utils.prompts import _retryable
+    assert _retryable(asyncio.TimeoutError()) and _retryable(Status503())
+    assert _retryable(openai.APIConnectionError(request=None))
+    auth = type("Status401", (Exception,), {"status_code": 401})()
+    assert not any(_retryable(e) for e in (TypeError("bad arg"), KeyError("x"), ValueError("config"), auth))
+
+def test_failed_async_call_records_error_on_its_span(indexed):
+    from utils import trace
+    from utils.prompts import _achat_retry
+    _, comp = indexed
+    comp.fail_first = {"question #9"}
+    msgs = [{"role": "user", "content": "Question: question #9\n"}]
+    trace.enable()
+    try:
+        trace.reset()
+        with pytest.raises(Status503):
+            asyncio.run(_achat_retry(msgs, [], use_cache=False, retries=0))
+        (sp,) = [s for s in trace.spans() if s.name == "llm.chat_async"]
+        assert sp.attrs["error"] == "Status503" and sp.attrs["attempts"] == 1
+    finally:
+        trace.enable(False)
+        trace.reset()
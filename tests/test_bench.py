@@ -0,0 +1,31 @@
+import argparse, sys
+
+import pytest
+
+from conftest import ROOT
+
+sys.path.insert(0, str(ROOT / "bench"))
+import scale, synth  # noqa: E402
+
+from utils.ingestion import LINE_RE, parse_file, FLAG_FIELDS  # noqa: E402
+
+def test_synthetic_transcripts_parse_and_trip_every_flag(tmp_path):
+    paths = synth.generate(str(tmp_path), calls=5, segments=40, seed=1)
+    assert [p.name for p in paths] == [p.name for p in synth.generate(str(tmp_path / "again"), 5, 40, seed=1)]
+    segs = [s for p in paths for s in parse_file(str(p))]
+    lines = [ln for p in paths for ln in p.read_text(encoding="utf-8").splitlines() if ln.strip()]
+    assert all(LINE_RE.match(ln) for ln in lines) and len(segs) == len(lines)
+    assert all(any(s.flag(f) for s in segs) for f in FLAG_FIELDS)
+
+@pytest.mark.parametrize("backend,shards", [("chroma", 1), ("flat", 1), ("flat", 3)])
+def test_scale_run_reports_every_section(tmp_path, backend, shards):
+    args = argparse.Namespace(calls=8, segments=30, seed=0, embedder="hash", max_chars=600, batch_size=32,
+                              queries=5, recall_queries=5, k=3, workdir=str(tmp_path), keep=False, backend=backend,
+                              shards=shards)
+    report = scale.run(args)
+    assert report["ingest"]["chunks"] > 8 and report["ingest"]["chunks_per_s"]["end_to_end"] > 0
+    assert set(report["query_ms"]) == {"none", "call_id", "flag", "call_id+flag"}
+    assert report["query_ms"]["none"]["p99"] >= report["query_ms"]["none"]["p50"] > 0
+    assert 0.0 <= report["recall"]["recall_at_k"] <= 1.0 and report["list_call_ids_ms"] > 0
+    if backend == "flat":
+        assert report["recall"]["recall_at_k"] >= 0.9  # exact search; float16 only reorders near-ties
@@ -0,0 +1,73 @@
+import pathlib
+import time
+
+from utils.cache import DiskCache, LRUCache, RetrievalCache, bump_index_version
+from utils.embeddings import upsert_chunks
+from utils.ingestion import parse_file, chunk_segments
+from utils.retrieval import search
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+def test_lru_evicts_least_recent():
+    c = LRUCache(2)
+    c.put("a", 1); c.put("b", 2)
+    assert c.get("a") == 1
+    c.put("c", 3)
+    assert c.get("b") is None and c.get("a") == 1 and c.get("c") == 3
+
+def test_disk_cache_ttl_and_size(tmp_path):
+    d = DiskCache(str(tmp_path / "c.sqlite"), ttl=0.05, max_bytes=10_000)
+    d.put("k", {"v": 1})
+    assert d.get("k") == {"v": 1}
+    time.sleep(0.1)
+    assert d.get("k") is None
+
+    d = DiskCache(str(tmp_path / "s.sqlite"), ttl=0, max_bytes=1_000)
+    for i in range(20):
+        d.put(f"k{i}", "x" * 200)
+    assert d.info()["bytes"] <= 1_000
+    assert d.get("k19") is not None and d.get("k0") is None
+
+def test_search_cache_hits_and_invalidates(tmp_path, mem_collection, hash_ef):
+    upsert_chunks(mem_collection, chunk_segments(parse_file(str(ROOT / "transcripts" / "2_pricing_call.txt"))))
+    version = str(tmp_path / "index_version")
+    cache = RetrievalCache(version, disk_path=str(tmp_path / "r.sqlite"))
+
+    first = search(mem_collection, "What  is the Price?", k=3, cache=cache)
+    calls = hash_ef.calls
+    again = search(mem_collection, "what is the price?", k=3, cache=cache)
+    assert again == first and hash_ef.calls == calls
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    # a fresh process-level cache still hits via the disk tier
+    cold = RetrievalCache(version, disk_path=str(tmp_path / "r.sqlite"))
+    assert search(mem_collection, "what is the price?", k=3, cache=cold) == first
+    assert cold.stats()["disk_hits"] == 1
+
+    # ingest bumps the version: previous results are retired
+    bump_index_version(version)
+    search(mem_collection, "what is the price?", k=3, cache=cache)
+    assert hash_ef.calls == calls + 1
+    assert cache.disk.info()["entries"] == 1
+
+def test_lookups_write_nothing_until_counters_flush(tmp_path):
+    RetrievalCache(str(tmp_path / "v"), disk_path=str(tmp_path / "r.sqlite")).key("q", None, 3)  # an earlier process
+    cache = RetrievalCache(str(tmp_path / "v"), disk_path=str(tmp_path / "r.sqlite"))
+    statements = []
+    cache.disk._db.set_trace_callback(statements.append)
+    key = cache.key("q", None, 3)  # same index version: nothing to purge
+    assert statements and all(st.startswith("SELECT") for st in statements)
+    cache.put(key, [{"id": "a"}])
+    statements.clear()
+    for _ in range(10):
+        assert cache.get(key) == [{"id": "a"}]  # memory tier
+    assert cache.disk.get(key) is not None      # disk read, `accessed` is fresh
+    assert all(st.startswith("SELECT") for st in statements)
+    assert cache.stats()["disk"]["hits"] == 10  # flushed on demand
+
+    d = cache.disk
+    d.put("b", "x" * 50)
+    d.put("b", "y" * 20)  # replacing a row adjusts the tracked size
+    assert d._total == d.info()["bytes"]
+    d.purge_except("nothing")
+    assert d._total == 0 == d.info()["bytes"]
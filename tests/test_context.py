@@ -0,0 +1,30 @@
+from utils.context import pack, count_tokens
+
+def _hit(cid, call, s, e, score, words=10):
+    return {"id": cid, "text": " ".join(["w"] * words),
+            "meta": {"call_id": call, "seg_start_idx": s, "seg_end_idx": e}, "score": score}
+
+def _words(text):
+    return len(text.split())
+
+def test_pack_drops_overlaps_fills_budget_and_orders_by_call_and_time():
+    hits = [
+        _hit("b:5-6", "b", 5, 6, 0.9),
+        _hit("a:8-9", "a", 8, 9, 0.8),
+        _hit("b:5-6", "b", 5, 6, 0.7),              # same chunk twice (e.g. vector + lexical)
+        _hit("a:0-3", "a", 0, 3, 0.6),
+        _hit("b:0-9", "b", 0, 9, 0.5, words=40),    # too big for what's left
+        _hit("a:1-2", "a", 1, 2, 0.4),              # inside a:0-3
+        _hit("b:1-1", "b", 1, 1, 0.3),
+    ]
+    packed, stats = pack(hits, budget=46, render=lambda h: h["text"], sep="| |", count=_words)
+    assert [h["id"] for h in packed] == ["b:1-1", "b:5-6", "a:0-3", "a:8-9"]
+    assert stats.duplicates == 2 and stats.over_budget == 1
+    assert stats.tokens_out == 4 * 10 + 3 * 2  # blocks + separators
+    assert stats.tokens_saved == stats.tokens_in - stats.tokens_out > 0
+
+def test_best_hit_is_kept_even_over_budget():
+    packed, stats = pack([_hit("a:0-0", "a", 0, 0, None, words=50)], budget=10,
+                         render=lambda h: h["text"], count=_words)
+    assert len(packed) == 1 and stats.tokens_out == 50
+    assert count_tokens("hello world") > 0
@@ -0,0 +1,87 @@
+import shutil
+
+import numpy as np
+from typer.testing import CliRunner
+
+import main
+from utils import embeddings
+from utils.dedup import DedupCollection, DedupIndex, MinHasher, similarity
+from utils.embeddings import upsert_chunks
+from utils.lexical import LexicalIndex
+from utils.retrieval import get_call_chunks, mmr, search
+
+def test_minhash_ignores_timestamps_and_tracks_overlap():
+    h = MinHasher()
+    a = "[00:01] Alice: we can offer twenty percent off the annual plan for fifty seats today"
+    b = "[12:40] Bob: we can offer twenty percent off the annual plan for fifty seats today"
+    c = "[00:02] Carol: the integration roadmap slipped a quarter because of the security review"
+    assert similarity(h.signature(a), h.signature(b)) == 1.0
+    assert similarity(h.signature(a), h.signature(c)) < 0.2
+    assert h.signature(a).dtype == np.uint32 and len(h.signature(a)) == 128
+
+def _dedup_setup(tmp_path, monkeypatch, mem_collection):
+    from test_ingestion import _setup
+    coll = DedupCollection(mem_collection, DedupIndex(str(tmp_path / "dedup.sqlite")))
+    tdir = _setup(tmp_path, monkeypatch, coll)
+    monkeypatch.setattr(embeddings, "DEDUP", True)
+    src = sorted(tdir.glob("*.txt"))[0]
+    shutil.copy(src, tdir / "9_copy.txt")  # same lines, another call
+    return coll, tdir, src
+
+def test_ingest_stores_copies_once_and_keeps_them_call_scoped(tmp_path, monkeypatch, mem_collection, hash_ef):
+    coll, tdir, src = _dedup_setup(tmp_path, monkeypatch, mem_collection)
+    runner = CliRunner()
+    res = runner.invoke(main.app, ["ingest"])
+    assert res.exit_code == 0, res.output
+    assert "Dedup:" in res.output
+
+    orig = get_call_chunks(coll, src.stem)
+    copy = get_call_chunks(coll, "9_copy")
+    assert len(copy) == len(orig) > 0
+    assert all(h["meta"]["dup_of"] == o["id"] for h, o in zip(copy, orig))
+    assert [h["text"] for h in copy] == [h["text"] for h in orig]
+    stored = mem_collection.get(include=["metadatas"])
+    assert "9_copy" not in {m["call_id"] for m in stored["metadatas"]}
+    assert coll.dedup.counts()[1] == len(copy)
+
+    # scoped searches see the copy's own chunks; unscoped ones see each text once
+    for mode in ("vector", "lexical", "hybrid"):
+        lexical = LexicalIndex.load(main.LEXICAL_DIR) if mode != "vector" else None
+        hits = search(coll, "discount price seats", k=3, where={"call_id": "9_copy"}, mode=mode, lexical=lexical)
+        assert hits and all(h["meta"]["call_id"] == "9_copy" for h in hits)
+        hits = search(coll, "discount price seats", k=20, mode=mode, lexical=lexical)
+        assert all(h["meta"]["call_id"] != "9_copy" for h in hits)
+
+    # the original goes away: its references are embedded and stored in its place
+    src.unlink()
+    res = runner.invoke(main.app, ["ingest"])
+    assert res.exit_code == 0, res.output
+    copy2 = get_call_chunks(coll, "9_copy")
+    assert [h["id"] for h in copy2] == [h["id"] for h in copy]
+    assert all("dup_of" not in h["meta"] for h in copy2)
+    assert coll.dedup.counts()[1] == 0
+
+def test_maintain_promotes_references_of_removed_canonicals(tmp_path, monkeypatch, mem_collection, hash_ef):
+    coll, tdir, src = _dedup_setup(tmp_path, monkeypatch, mem_collection)
+    runner = CliRunner()
+    assert runner.invoke(main.app, ["ingest"]).exit_code == 0
+    n_copy = len(get_call_chunks(coll, "9_copy"))
+    src.unlink()  # removed without an ingest run
+    res = runner.invoke(main.app, ["maintain", "--no-compact"])
+    assert res.exit_code == 0, res.output
+    assert get_call_chunks(coll, src.stem) == []
+    copy = get_call_chunks(coll, "9_copy")
+    assert len(copy) == n_copy and all("dup_of" not in h["meta"] for h in copy)
+
+def test_mmr_skips_repeated_text(mem_collection):
+    chunks = [{"id": f"c{i}", "text": text, "meta": {"call_id": "x"}} for i, text in enumerate([
+        "discount on the annual plan for fifty seats",
+        "discount on the annual plan for fifty seats",
+        "discount offered if they sign before the quarter ends",
+    ])]
+    upsert_chunks(mem_collection, chunks)
+    plain = search(mem_collection, "discount annual plan seats", k=2)
+    assert [h["text"] for h in plain] == [chunks[0]["text"]] * 2
+    diverse = search(mem_collection, "discount annual plan seats", k=2, diversity=0.7)
+    assert {h["text"] for h in diverse} == {chunks[0]["text"], chunks[2]["text"]}
+    assert mmr(mem_collection, plain, 2, 0.0) == plain
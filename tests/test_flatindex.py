@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from utils.embeddings import get_collection, persist_collection, upsert_chunks
+from utils.flatindex import FlatCollection
+from utils.retrieval import get_call_chunks, list_call_ids, search
+
+WORDS = "price discount seat overage SOC SSO SAML retention competitor pilot renewal onboarding CRM".split()
+
+def _chunks(n_calls=6, per_call=10, seed=0):
+    rng = np.random.default_rng(seed)
+    out = []
+    for c in range(n_calls):
+        for i in range(per_call):
+            text = " ".join(rng.choice(WORDS, size=8))
+            out.append({"id": f"call{c}:{i}", "text": text, "meta": {
+                "call_id": f"call{c}", "seg_start_idx": i, "seg_end_idx": i,
+                "mentions_pricing": "price" in text, "mentions_security": "SOC" in text,
+                "mentions_competitor": False,
+            }})
+    return out
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_exact_search_matches_brute_force(tmp_path, hash_ef, dtype):
+    coll = FlatCollection.open(str(tmp_path / "flat"), embedding_function=hash_ef, dtype=dtype)
+    chunks = _chunks()
+    upsert_chunks(coll, chunks)
+    mat = np.asarray(hash_ef([c["text"] for c in chunks]))
+    q = "discount price seat"
+    want = np.argsort(-(mat @ np.asarray(hash_ef([q]))[0]))[:5]
+    res = coll.query(query_texts=[q], n_results=5)
+    assert res["ids"][0][0] == chunks[want[0]]["id"]
+    assert len(set(res["ids"][0]) & {chunks[i]["id"] for i in want}) >= 4  # quantization may swap near-ties
+    assert res["distances"][0] == sorted(res["distances"][0])
+
+def test_prefilter_persist_reopen_and_compact(tmp_path, hash_ef):
+    path = str(tmp_path / "flat")
+    coll = FlatCollection.open(path, embedding_function=hash_ef)
+    chunks = _chunks()
+    upsert_chunks(coll, chunks)
+
+    hits = search(coll, "price discount", k=4, where={"call_id": "call2", "mentions_pricing": True})
+    assert hits and all(h["meta"]["call_id"] == "call2" and h["meta"]["mentions_pricing"] for h in hits)
+    assert search(coll, "price", k=4, where={"call_id": "nope"}) == []
+    assert [h["id"] for h in get_call_chunks(coll, "call1")] == [f"call1:{i}" for i in range(10)]
+    assert coll.get(where={"seg_start_idx": {"$gte": 8}}, include=[])["ids"][:2] == ["call0:8", "call0:9"]
+    coll.save()
+
+    again = FlatCollection.open(path, embedding_function=hash_ef)
+    assert isinstance(again.vecs, np.memmap) and again.count() == 60
+    assert list_call_ids(again) == [f"call{c}" for c in range(6)]
+    assert again.query(query_texts=["SOC SSO"], n_results=3)["ids"] == coll.query(query_texts=["SOC SSO"], n_results=3)["ids"]
+
+    # a writer's save is picked up by an already-open reader
+    coll.delete(ids=[c["id"] for c in chunks if c["meta"]["call_id"] in ("call0", "call1")])
+    upsert_chunks(coll, [{**chunks[20], "text": "renewal renewal renewal"}])
+    coll.save()  # 20 of 60 rows dead → compacted
+    assert len(coll.live) == 40 and coll.live.all()
+    assert again.count() == 40 and list_call_ids(again) == [f"call{c}" for c in range(2, 6)]
+    assert again.get(ids=["call2:0"])["documents"] == ["renewal renewal renewal"]
+    assert again.query(query_texts=["renewal"], n_results=1)["ids"] == [["call2:0"]]
+
+def test_get_collection_flat_backend(tmp_path, hash_ef):
+    coll = get_collection(str(tmp_path), embedding_function=hash_ef, backend="flat")
+    upsert_chunks(coll, _chunks(n_calls=2))
+    persist_collection(coll)
+    ro = get_collection(str(tmp_path), embed=False, backend="flat")
+    assert ro.count() == 20 and ro._embedding_function is None
+    assert len(ro.get(limit=5, offset=18, include=["embeddings"])["embeddings"]) == 2
+    with pytest.raises(ValueError):
+        ro.query(query_texts=["price"])
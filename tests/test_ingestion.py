@@ -0,0 +1,121 @@
+import shutil
+import pathlib
+
+from typer.testing import CliRunner
+
+import main
+from utils import embeddings
+import itertools
+
+from utils.ingestion import Segment, parse_file, chunk_segments, iter_chunks
+from utils.catalog import Catalog
+from utils.manifest import load_manifest
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+SAMPLES = sorted((ROOT / "transcripts").glob("*.txt"))
+
+def test_chunk_ids_are_deterministic():
+    a = chunk_segments(parse_file(str(SAMPLES[0])), max_chars=500)
+    b = chunk_segments(parse_file(str(SAMPLES[0])), max_chars=500)
+    assert [c["id"] for c in a] == [c["id"] for c in b]
+    first = a[0]
+    cid, rng, _ = first["id"].split(":")
+    assert cid == first["meta"]["call_id"]
+    assert rng == f'{first["meta"]["seg_start_idx"]}-{first["meta"]["seg_end_idx"]}'
+
+def test_iter_chunks_streams():
+    # an endless segment source still yields chunks: nothing waits for end-of-input
+    endless = (Segment("big", i, "00:00", "AE", "x" * 100) for i in itertools.count())
+    first, second = itertools.islice(iter_chunks(endless, max_chars=1000), 2)
+    assert first["meta"]["seg_start_idx"] == 0 and second["meta"]["seg_start_idx"] == first["meta"]["seg_end_idx"] + 1
+    assert not hasattr(Segment("c", 0, "00:00", "AE", "hi"), "__dict__")
+
+def _setup(tmp_path, monkeypatch, coll):
+    tdir = tmp_path / "transcripts"
+    tdir.mkdir()
+    for fp in SAMPLES[:2]:
+        shutil.copy(fp, tdir / fp.name)
+    monkeypatch.setattr(main, "TRANSCRIPTS_DIR", str(tdir))
+    monkeypatch.setattr(main, "MANIFEST_PATH", str(tmp_path / "manifest.json"))
+    monkeypatch.setattr(main, "INDEX_VERSION_PATH", str(tmp_path / "index_version"))
+    monkeypatch.setattr(main, "CATALOG_PATH", str(tmp_path / "catalog.sqlite"))
+    monkeypatch.setattr(main, "LEXICAL_DIR", str(tmp_path / "lexical"))
+    monkeypatch.setattr(main, "SEGMENTS_DIR", str(tmp_path / "segments"))
+    monkeypatch.setattr(embeddings, "get_collection", lambda *a, **kw: coll)
+    monkeypatch.setattr(embeddings, "get_embedding_function", lambda: coll._embedding_function)
+    return tdir
+
+def test_ingest_is_incremental(tmp_path, monkeypatch, mem_collection, hash_ef):
+    tdir = _setup(tmp_path, monkeypatch, mem_collection)
+    runner = CliRunner()
+
+    assert runner.invoke(main.app, ["ingest"]).exit_code == 0
+    n = mem_collection.count()
+    embedded = hash_ef.embedded
+    assert n > 0
+
+    # second run: nothing changes, nothing is embedded, no duplicates
+    res = runner.invoke(main.app, ["ingest"])
+    assert res.exit_code == 0 and "skipped" in res.output
+    assert mem_collection.count() == n
+    assert hash_ef.embedded == embedded
+
+    # append a line: only the tail chunk is re-embedded
+    victim = sorted(tdir.glob("*.txt"))[0]
+    with open(victim, "a", encoding="utf-8") as f:
+        f.write("\n[59:59] AE: One more thing on pricing before we go.\n")
+    assert runner.invoke(main.app, ["ingest"]).exit_code == 0
+    assert mem_collection.count() == n
+    assert hash_ef.embedded - embedded == 1
+
+    # remove a transcript: its chunks are deleted
+    gone = load_manifest(str(tmp_path / "manifest.json"))["files"][victim.name]["chunk_ids"]
+    victim.unlink()
+    assert runner.invoke(main.app, ["ingest"]).exit_code == 0
+    assert mem_collection.count() == n - len(gone)
+    assert victim.name not in load_manifest(str(tmp_path / "manifest.json"))["files"]
+
+def test_parallel_ingest_matches_serial(tmp_path, monkeypatch, mem_collection, hash_ef):
+    _setup(tmp_path, monkeypatch, mem_collection)
+    res = CliRunner().invoke(main.app, ["ingest", "--workers", "2", "--batch-size", "5"])
+    assert res.exit_code == 0, res.output
+    expected = sum(len(chunk_segments(parse_file(str(fp)), max_chars=main.MAX_CHARS)) for fp in SAMPLES[:2])
+    assert mem_collection.count() == expected
+    # embedding happens in pooled batches, not once per file
+    assert hash_ef.calls == -(-expected // 5)
+
+def test_ingest_maintains_catalog(tmp_path, monkeypatch, mem_collection):
+    tdir = _setup(tmp_path, monkeypatch, mem_collection)
+    runner = CliRunner()
+    assert runner.invoke(main.app, ["ingest"]).exit_code == 0
+
+    cat = Catalog(str(tmp_path / "catalog.sqlite"))
+    segs = parse_file(str(SAMPLES[0]))
+    row = cat.get(segs[0].call_id)
+    assert row["segment_count"] == len(segs)
+    assert row["chunk_count"] == len(chunk_segments(segs, max_chars=main.MAX_CHARS))
+    assert (row["first_ts"], row["last_ts"]) == (segs[0].timestamp, segs[-1].timestamp)
+    assert row["flag_counts"]["mentions_pricing"] >= 0
+
+    res = runner.invoke(main.app, ["list", "--stats"], env={"COLUMNS": "200"})
+    assert res.exit_code == 0 and segs[0].call_id in res.output
+
+    # unknown call_ids are rejected before any vector query
+    assert runner.invoke(main.app, ["ask", "price?", "--call-id", "nope"]).exit_code == 4
+
+    # removing a transcript removes its catalog row
+    (tdir / SAMPLES[0].name).unlink()
+    assert runner.invoke(main.app, ["ingest"]).exit_code == 0
+    assert not cat.has(segs[0].call_id) and len(cat) == 1
+
+def test_first_ingest_replaces_uuid_keyed_chunks(tmp_path, monkeypatch, mem_collection, hash_ef):
+    import uuid
+    _setup(tmp_path, monkeypatch, mem_collection)
+    # an index from before the manifest: same chunks, random ids
+    old = [c for fp in SAMPLES[:2] for c in chunk_segments(parse_file(str(fp)), max_chars=main.MAX_CHARS)]
+    embeddings.upsert_chunks(mem_collection, [{**c, "id": str(uuid.uuid4())} for c in old])
+    res = CliRunner().invoke(main.app, ["ingest"])
+    assert res.exit_code == 0, res.output
+    assert sorted(mem_collection.get(include=[])["ids"]) == sorted(c["id"] for c in old)
+    from utils.lexical import LexicalIndex
+    assert sorted(LexicalIndex.load(main.LEXICAL_DIR).id_pos) == sorted(c["id"] for c in old)
@@ -0,0 +1,64 @@
+import pathlib
+
+from utils.embeddings import upsert_chunks
+from utils.ingestion import parse_file, chunk_segments
+from utils.lexical import LexicalIndex, tokenize
+from utils.retrieval import search
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+def _chunks():
+    out = []
+    for fp in sorted((ROOT / "transcripts").glob("*.txt")):
+        out.extend(chunk_segments(parse_file(str(fp)), max_chars=600))
+    return out
+
+def test_tokenize_keeps_figures_and_codes():
+    assert tokenize("₹2,000 per seat, SOC 2 + DPDPA") == ["₹", "2000", "per", "seat", "soc", "2", "dpdpa"]
+
+def test_bm25_matches_exact_terms_and_filters(tmp_path):
+    chunks = _chunks()
+    idx = LexicalIndex(str(tmp_path / "lex"))
+    idx.add(chunks)
+    top = idx.search("DPDPA", k=3)
+    assert top and all("dpdpa" in tokenize(next(c["text"] for c in chunks if c["id"] == cid)) for cid, _ in top)
+
+    cid = chunks[0]["meta"]["call_id"]
+    for hit_id, _ in idx.search("pricing discount", k=5, where={"call_id": cid, "mentions_pricing": True}):
+        meta = next(c["meta"] for c in chunks if c["id"] == hit_id)
+        assert meta["call_id"] == cid and meta["mentions_pricing"]
+
+def test_incremental_updates_survive_save_and_load(tmp_path):
+    chunks = _chunks()
+    half = len(chunks) // 2
+    idx = LexicalIndex(str(tmp_path / "lex"))
+    idx.add(chunks[:half])
+    idx.save()
+
+    idx = LexicalIndex.load(str(tmp_path / "lex"))
+    idx.add(chunks[half:])
+    gone = [c["id"] for c in chunks[: half // 2 + 1]]
+    idx.remove(gone)  # enough tombstones to trigger compaction
+    idx.save()
+
+    full = LexicalIndex(str(tmp_path / "ref"))
+    full.add(c for c in chunks if c["id"] not in set(gone))
+    again = LexicalIndex.load(str(tmp_path / "lex"))
+    assert len(again) == len(full)
+    for q in ("security review", "Brightcall battle card", "₹ discount"):
+        assert [h for h, _ in again.search(q, k=5)] == [h for h, _ in full.search(q, k=5)]
+
+def test_hybrid_search_fuses_rankings(tmp_path, mem_collection):
+    chunks = _chunks()
+    upsert_chunks(mem_collection, chunks)
+    idx = LexicalIndex(str(tmp_path / "lex"))
+    idx.add(chunks)
+
+    lex = search(mem_collection, "DPDPA", k=3, mode="lexical", lexical=idx)
+    assert lex and "DPDPA" in lex[0]["text"]
+    hyb = search(mem_collection, "DPDPA", k=3, mode="hybrid", lexical=idx)
+    assert len(hyb) == 3 and len({h["id"] for h in hyb}) == 3
+    assert lex[0]["id"] in {h["id"] for h in hyb}
+    # without a lexical index, hybrid degrades to vector search
+    vec = search(mem_collection, "DPDPA", k=3, mode="hybrid", lexical=None)
+    assert [h["id"] for h in vec] == [h["id"] for h in search(mem_collection, "DPDPA", k=3)]
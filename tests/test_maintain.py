@@ -0,0 +1,100 @@
+import json, pathlib, shutil
+
+import pytest
+from typer.testing import CliRunner
+
+import main
+from utils import embeddings, maintenance
+from utils.catalog import Catalog
+from utils.embeddings import get_collection, upsert_chunks
+from utils.lexical import LexicalIndex
+from utils.manifest import load_manifest, save_manifest
+from utils.segstore import SegmentStore
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+SAMPLES = sorted((ROOT / "transcripts").glob("*.txt"))
+
+def _setup(tmp_path, monkeypatch, hash_ef, backend):
+    tdir = tmp_path / "transcripts"
+    tdir.mkdir()
+    for fp in SAMPLES[:2]:
+        shutil.copy(fp, tdir / fp.name)
+    pdir = tmp_path / "chroma"
+    monkeypatch.setattr(main, "TRANSCRIPTS_DIR", str(tdir))
+    monkeypatch.setattr(main, "PERSIST_DIR", str(pdir))
+    monkeypatch.setattr(main, "MANIFEST_PATH", str(pdir / "manifest.json"))
+    monkeypatch.setattr(main, "INDEX_VERSION_PATH", str(pdir / "index_version"))
+    monkeypatch.setattr(main, "CATALOG_PATH", str(pdir / "catalog.sqlite"))
+    monkeypatch.setattr(main, "LEXICAL_DIR", str(pdir / "lexical"))
+    monkeypatch.setattr(main, "SEGMENTS_DIR", str(pdir / "segments"))
+    monkeypatch.setattr(embeddings, "VECTOR_BACKEND", backend)
+    monkeypatch.setattr(embeddings, "get_embedding_function", lambda: hash_ef)
+    return tdir, pdir
+
+@pytest.mark.parametrize("backend", ["chroma", "flat"])
+def test_maintain_collects_orphans_and_compacts(tmp_path, monkeypatch, hash_ef, backend):
+    tdir, pdir = _setup(tmp_path, monkeypatch, hash_ef, backend)
+    runner = CliRunner()
+    assert runner.invoke(main.app, ["ingest"]).exit_code == 0
+
+    # a transcript deleted while its manifest entry was lost, a chunk no manifest lists,
+    # and a collection from another layout
+    victim = SAMPLES[1]
+    (tdir / victim.name).unlink()
+    manifest = load_manifest(main.MANIFEST_PATH)
+    manifest["files"].pop(victim.name)
+    save_manifest(main.MANIFEST_PATH, manifest)
+    keeper = manifest["files"][SAMPLES[0].name]
+    coll = get_collection(str(pdir))
+    stray = {"id": f"{keeper['call_id']}:999-999:0123456789ab", "text": "stray leftover",
+             "meta": {"call_id": keeper["call_id"], "seg_start_idx": 999, "seg_end_idx": 999}}
+    upsert_chunks(coll, [stray])
+    embeddings.persist_collection(coll)
+    other = "flat" if backend == "chroma" else "chroma"
+    old_store = get_collection(str(pdir), backend=other)
+    old_store.upsert(ids=["x:0-0:0"], documents=["x"], metadatas=[{"call_id": "x"}])
+    embeddings.persist_collection(old_store)
+    n_before = coll.count()
+
+    res = runner.invoke(main.app, ["maintain", "--dry-run"], env={"COLUMNS": "400"})
+    assert res.exit_code == 0, res.output
+    assert "1 chunks no manifest entry lists" in res.output and f"Stale store: {other}" in res.output
+    assert get_collection(str(pdir)).count() == n_before
+
+    res = runner.invoke(main.app, ["maintain"], env={"COLUMNS": "400"})
+    assert res.exit_code == 0, res.output
+    assert "reclaimed" in res.output
+    coll = get_collection(str(pdir))
+    assert sorted(coll.get(include=[])["ids"]) == sorted(keeper["chunk_ids"])
+    assert Catalog(main.CATALOG_PATH).call_ids() == [keeper["call_id"]]
+    assert SegmentStore(main.SEGMENTS_DIR).call_ids() == [keeper["call_id"]]
+    assert set(LexicalIndex.load(main.LEXICAL_DIR).id_pos) == set(keeper["chunk_ids"])
+    assert maintenance.store_names(str(pdir)) == [(backend, "calls")]
+    if backend == "chroma":  # old segment directories are gone: one per live collection
+        assert len([d for d in pdir.iterdir() if maintenance._SEGMENT_DIR.match(d.name)]) == 1
+    else:
+        assert coll.live.all()
+    assert coll.query(query_texts=["pricing"], n_results=2)["ids"][0]
+
+    hash_ef.embedded = 0
+    assert runner.invoke(main.app, ["ingest"]).exit_code == 0 and hash_ef.embedded == 0
+
+def test_tune_sweeps_and_persists_hnsw_settings(tmp_path, monkeypatch, hash_ef):
+    _, pdir = _setup(tmp_path, monkeypatch, hash_ef, "chroma")
+    runner = CliRunner()
+    assert runner.invoke(main.app, ["ingest"]).exit_code == 0
+    res = runner.invoke(main.app, ["maintain", "--tune", "--k", "3"], env={"COLUMNS": "400"})
+    assert res.exit_code == 0, res.output
+    assert "HNSW sweep" in res.output
+    saved = json.loads((pdir / "hnsw.json").read_text())
+    assert {"M", "construction_ef", "search_ef", "recall"} <= set(saved)
+    hnsw = get_collection(str(pdir)).configuration["hnsw"]
+    assert (hnsw["max_neighbors"], hnsw["ef_construction"], hnsw["ef_search"]) == \
+        (saved["M"], saved["construction_ef"], saved["search_ef"])
+
+def test_pick_prefers_the_fastest_config_reaching_the_target():
+    rows = [{"M": 8, "construction_ef": 64, "search_ef": 10, "recall": 0.80, "p50_ms": 0.1},
+            {"M": 16, "construction_ef": 64, "search_ef": 40, "recall": 0.97, "p50_ms": 0.4},
+            {"M": 32, "construction_ef": 200, "search_ef": 40, "recall": 0.99, "p50_ms": 0.6}]
+    assert maintenance.pick(rows, 0.95) is rows[1]
+    assert maintenance.pick(rows, 0.999) is rows[2]
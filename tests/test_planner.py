@@ -0,0 +1,76 @@
+import pathlib
+
+import numpy as np
+import pytest
+
+from utils import planner, trace
+from utils.catalog import Catalog, CallStats
+from utils.embeddings import upsert_chunks
+from utils.flatindex import FlatCollection
+from utils.ingestion import FLAG_FIELDS, chunk_segments, parse_file
+from utils.retrieval import search
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+@pytest.fixture
+def indexed(tmp_path, mem_collection):
+    cat = Catalog(str(tmp_path / "catalog.sqlite"))
+    chunks = []
+    for fp in sorted((ROOT / "transcripts").glob("*.txt")):
+        cs = chunk_segments(parse_file(str(fp)), max_chars=300)
+        stats = CallStats(cs[0]["meta"]["call_id"], str(fp), 0.0, FLAG_FIELDS)
+        for c in cs:
+            stats.add(c)
+        cat.upsert(stats.row)
+        chunks += cs
+    upsert_chunks(mem_collection, chunks)
+    return mem_collection, planner.CatalogStats(cat), chunks
+
+def test_estimates_are_upper_bounds_from_the_catalog(indexed):
+    _, stats, chunks = indexed
+    def actual(where):
+        return sum(all(c["meta"].get(k) == v for k, v in where.items()) for c in chunks)
+    for where in ({"call_id": "2_pricing_call"}, {"call_id": "2_pricing_call", "mentions_pricing": True},
+                  {"mentions_security": True}, {"mentions_pricing": False, "mentions_security": True}):
+        assert stats.estimate(where) >= actual(where)
+    assert stats.estimate({"call_id": "2_pricing_call", "mentions_pricing": True}) == \
+        actual({"call_id": "2_pricing_call", "mentions_pricing": True})
+    assert stats.estimate({"call_id": "nope"}) is None
+    assert stats.total() == len(chunks)
+
+def test_plan_choice(indexed, monkeypatch, tmp_path):
+    coll, stats, chunks = indexed
+    assert planner.plan(coll, None, 5, stats).strategy == "ann"
+    assert planner.plan(coll, {"call_id": "2_pricing_call"}, 5, stats).strategy == "exhaustive"
+    assert planner.plan(coll, {"call_id": "2_pricing_call"}, 5).strategy == "exhaustive"  # no stats
+    assert planner.plan(coll, {"mentions_pricing": True}, 5).strategy == "filtered"
+    assert planner.plan(FlatCollection(str(tmp_path)), {"call_id": "x"}, 5, stats).strategy == "native"
+
+    monkeypatch.setattr(planner, "PLANNER_EXHAUSTIVE_MAX", 0)
+    p = planner.plan(coll, {"mentions_security": True}, 3, stats)
+    n_sec = stats.estimate({"mentions_security": True})
+    assert p.strategy == "filtered" and p.n_results == min(n_sec, -(-3 * len(chunks) // n_sec), 24)
+    hits = search(coll, "SOC 2 report", k=3, where={"mentions_security": True}, stats=stats)
+    assert len(hits) == 3 and all(h["meta"]["mentions_security"] for h in hits)
+
+def test_exhaustive_plan_is_exact_and_single_pass(indexed, hash_ef):
+    coll, stats, chunks = indexed
+    where = {"call_id": "2_pricing_call", "mentions_pricing": True}
+    match = [c for c in chunks if all(c["meta"].get(k) == v for k, v in where.items())]
+    assert len(match) > 2
+    q = "discount per seat price"
+    sims = np.asarray(hash_ef([c["text"] for c in match])) @ np.asarray(hash_ef([q]))[0]
+    want = [match[i]["id"] for i in np.argsort(-sims)[:len(match) + 5]]
+
+    trace.reset()
+    trace.enable()
+    try:
+        hits = search(coll, q, k=len(match) + 5, where=where, stats=stats)
+    finally:
+        trace.enable(False)
+    assert [h["id"] for h in hits] == want  # every matching chunk, in exact cosine order
+    assert hits[0]["score"] == pytest.approx(float(sims.max()), abs=1e-5)
+    counters = trace.counters()
+    trace.reset()
+    assert counters["planner.exhaustive"] == 1 and "planner.filtered" not in counters
+    assert counters["planner.chunks_scored"] == len(match)
@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import pytest
+
+import utils.prompts as prompts
+from utils.cache import DiskCache
+
+HITS = [
+    {"id": "c1:0-3:abc", "text": "[00:10] AE: List price is ₹2,000 per seat.",
+     "meta": {"call_id": "c1", "start_ts": "00:10", "end_ts": "00:40"}, "score": 0.9},
+]
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+
+    def create(self, **kw):
+        self.calls += 1
+        if self.fail:
+            raise TimeoutError("boom")
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"answer #{self.calls}"))])
+
+@pytest.fixture
+def fake_llm(tmp_path, monkeypatch):
+    comp = FakeCompletions()
+    monkeypatch.setattr(prompts, "client", SimpleNamespace(chat=SimpleNamespace(completions=comp)))
+    monkeypatch.setattr(prompts, "DEFAULT_MODEL", "test-model")
+    monkeypatch.setattr(prompts, "_response_cache", DiskCache(str(tmp_path / "llm.sqlite")))
+    return comp
+
+def test_response_cache_reuses_answers(fake_llm):
+    a = prompts.ask_qa("What is the list price?", HITS)
+    b = prompts.ask_qa("What is the list price?", HITS)
+    assert a == b and a.startswith("answer #1") and fake_llm.calls == 1
+
+    # different hits → different key
+    other = [dict(HITS[0], id="c1:4-6:def")]
+    prompts.ask_qa("What is the list price?", other)
+    assert fake_llm.calls == 2
+
+    # --no-cache always goes to the model
+    prompts.ask_qa("What is the list price?", HITS, use_cache=False)
+    assert fake_llm.calls == 3
+
+def test_error_fallbacks_are_not_cached(fake_llm):
+    fake_llm.fail = True
+    assert "(LLM error: TimeoutError)" in prompts.summarize_call("c1", HITS)
+    fake_llm.fail = False
+    out = prompts.summarize_call("c1", HITS)
+    assert out.startswith("answer #2")
+    assert prompts._response_cache.info()["entries"] == 1
+
+def _chunks(n, tail="end"):
+    return [{"id": f"c1:{i}-{i}:{'t' if i == n - 1 else 'x'}{tail if i == n - 1 else i}",
+             "text": f"[00:{i:02d}] AE: point {i} {tail if i == n - 1 else ''}",
+             "meta": {"call_id": "c1", "start_ts": f"00:{i:02d}", "end_ts": f"00:{i:02d}", "seg_start_idx": i}}
+            for i in range(n)]
+
+def test_full_summary_map_reduce_recomputes_only_the_tail(fake_llm):
+    out = prompts.summarize_call_full("c1", _chunks(10), window=2, fanin=2, workers=3)
+    assert "Sources:" in out
+    assert fake_llm.calls == 5 + 2 + 1 + 1  # map, two merge levels (odd notes pass through), final
+
+    # lines appended: last chunk grows and a new one follows
+    prompts.summarize_call_full("c1", _chunks(11, tail="more"), window=2, fanin=2, workers=3)
+    assert fake_llm.calls == 9 + 2 + 1 + 1  # two tail windows, the merge above them, final
+
+def test_get_call_chunks_returns_whole_call_in_order(mem_collection):
+    import pathlib
+    from utils.embeddings import upsert_chunks
+    from utils.ingestion import parse_file, chunk_segments
+    from utils.retrieval import get_call_chunks
+
+    fp = pathlib.Path(__file__).resolve().parents[1] / "transcripts" / "1_demo_call.txt"
+    chunks = chunk_segments(parse_file(str(fp)), max_chars=400)
+    upsert_chunks(mem_collection, list(reversed(chunks)))
+    got = get_call_chunks(mem_collection, "1_demo_call")
+    assert [h["id"] for h in got] == [c["id"] for c in chunks]
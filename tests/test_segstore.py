@@ -0,0 +1,104 @@
+import pathlib, threading
+
+from typer.testing import CliRunner
+
+import main
+from utils.client import CopilotClient
+from utils.embeddings import upsert_chunks
+from utils.ingestion import chunk_segments, parse_file
+from utils.retrieval import search
+from utils.segstore import SegmentStore, expand_hits
+from utils.server import make_server
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+PRICING = ROOT / "transcripts" / "2_pricing_call.txt"
+
+def _fields(segs):
+    return [(s.idx, s.timestamp, s.speaker, s.text, s.flags) for s in segs]
+
+def test_write_read_keep_and_replace(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    segs = parse_file(str(PRICING))
+    assert store.write("2_pricing_call", segs) == len(segs)
+    f = store.open("2_pricing_call")
+    assert _fields(f.segments("2_pricing_call")) == _fields(segs)
+    assert _fields(f.segments("2_pricing_call", 5, 8)) == _fields(segs[5:8])
+    # tables and records are views of the mapping, not copies
+    assert not f.offsets.flags.owndata and isinstance(f.raw(0, 3), memoryview)
+    assert f.segments("2_pricing_call", len(segs), len(segs) + 5) == []
+
+    # keep the head, replace the tail (what watch does); readers see the new file
+    assert store.write("2_pricing_call", segs[10:12], keep=10) == 12
+    f2 = store.open("2_pricing_call")
+    assert f2 is not f and _fields(f2.segments("2_pricing_call")) == _fields(segs[:12])
+    assert _fields(f.segments("2_pricing_call", 20, 21)) == _fields(segs[20:21])  # old mapping still valid
+    assert store.has("2_pricing_call", 12) and not store.has("2_pricing_call", 13)
+
+    assert store.call_ids() == ["2_pricing_call"]
+    assert store.delete("2_pricing_call") and store.open("2_pricing_call") is None and store.call_ids() == []
+
+def test_ingest_and_watch_keep_segments_and_expand_needs_no_query(tmp_path, monkeypatch, mem_collection, hash_ef):
+    from test_ingestion import _setup
+    import utils.pipeline as pipeline
+    tdir = _setup(tmp_path, monkeypatch, mem_collection)
+    runner = CliRunner()
+    parsed = []
+    real = pipeline.iter_segments
+    monkeypatch.setattr(pipeline, "iter_segments", lambda path: parsed.append(path) or real(path))
+    assert runner.invoke(main.app, ["ingest"]).exit_code == 0
+    store = SegmentStore(main.SEGMENTS_DIR)
+    files = sorted(tdir.glob("*.txt"))
+    assert sorted(parsed) == [str(fp) for fp in files]  # one parse feeds chunks and segment files
+    assert store.call_ids() == sorted(fp.stem for fp in files)
+    for fp in files:
+        assert _fields(store.open(fp.stem).segments(fp.stem)) == _fields(parse_file(str(fp)))
+    for fp in files:
+        store.path(fp.stem).unlink()
+    assert runner.invoke(main.app, ["ingest", "--workers", "2"]).exit_code == 0  # built in the parse workers
+    assert not list(store.root.glob("*.tmp"))
+    for fp in files:
+        assert _fields(store.open(fp.stem).segments(fp.stem)) == _fields(parse_file(str(fp)))
+
+    hits = search(mem_collection, "discount per seat", k=3)
+    calls = hash_ef.calls
+    wide = expand_hits(hits, store, 2)
+    assert hash_ef.calls == calls  # no embedding / vector query
+    for h, w in zip(hits, wide):
+        m, wm = h["meta"], w["meta"]
+        assert h["text"] in w["text"]
+        assert wm["seg_start_idx"] == max(0, m["seg_start_idx"] - 2)
+        assert (wm["hit_start_idx"], wm["hit_end_idx"]) == (m["seg_start_idx"], m["seg_end_idx"])
+        assert len(w["text"].splitlines()) == wm["seg_end_idx"] - wm["seg_start_idx"] + 1
+    assert expand_hits(hits, store, 0) is hits
+
+    # watch appends: the file is rewritten from the open chunk on, then matches the transcript
+    fp = files[0]
+    lines = [ln for ln in fp.read_text(encoding="utf-8").splitlines() if ln.strip()]
+    for extra in (lines[:3], lines[3:5]):
+        with open(fp, "a", encoding="utf-8") as f:
+            f.write("\n".join(extra) + "\n")
+        assert runner.invoke(main.app, ["watch", "--once"]).exit_code == 0
+        assert _fields(store.open(fp.stem).segments(fp.stem)) == _fields(parse_file(str(fp)))
+
+    # a missing segment file is backfilled by re-parsing, without re-embedding
+    store.delete(files[1].stem)
+    before = hash_ef.embedded
+    assert runner.invoke(main.app, ["ingest"]).exit_code == 0
+    assert hash_ef.embedded == before and store.has(files[1].stem)
+
+def test_server_expands_hits(tmp_path, mem_collection):
+    store = SegmentStore(str(tmp_path))
+    segs = parse_file(str(PRICING))
+    store.write("2_pricing_call", segs)
+    upsert_chunks(mem_collection, chunk_segments(segs, 300))
+    srv = make_server(mem_collection, port=0, segments=store)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    try:
+        c = CopilotClient(f"http://127.0.0.1:{srv.server_address[1]}")
+        plain = c.search("discount", k=2)
+        wide = c.search("discount", k=2, expand=1)
+        assert [h["id"] for h in wide] == [h["id"] for h in plain]
+        assert all(len(w["text"]) > len(h["text"]) for h, w in zip(plain, wide))
+    finally:
+        srv.shutdown()
+        srv.server_close()
@@ -0,0 +1,70 @@
+import json, pathlib, sys
+import threading
+
+import pytest
+from typer.testing import CliRunner
+
+import main
+from utils.client import CopilotClient, ServerError
+from utils.embeddings import upsert_chunks
+from utils.ingestion import parse_file, chunk_segments
+from utils.server import make_server
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+@pytest.fixture
+def served(mem_collection):
+    for fp in sorted((ROOT / "transcripts").glob("*.txt")):
+        upsert_chunks(mem_collection, chunk_segments(parse_file(str(fp))))
+    srv = make_server(mem_collection, port=0)
+    t = threading.Thread(target=srv.serve_forever, daemon=True)
+    t.start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+    srv.server_close()
+
+def test_client_roundtrip(served):
+    c = CopilotClient(served)
+    assert c.health()
+    ids = c.list_call_ids()
+    assert "2_pricing_call" in ids
+    hits = c.search("pricing discount", k=3, where={"call_id": "2_pricing_call"})
+    assert hits and all(h["meta"]["call_id"] == "2_pricing_call" for h in hits)
+    assert "Sources:" in c.ask("What was the discount?", k=3)
+    with pytest.raises(ServerError) as ei:
+        c.summarize("no_such_call")
+    assert ei.value.status == 404
+
+def test_cli_thin_client_mode(served):
+    runner = CliRunner()
+    res = runner.invoke(main.app, ["--server", served, "list"])
+    assert res.exit_code == 0 and "1_demo_call" in res.output
+    res = runner.invoke(main.app, ["--server", served, "summarize", "--call-id", "no_such_call"])
+    assert res.exit_code == 7
+    for argv in (["ask", "discount?", "--stream"], ["summarize", "--call-id", "2_pricing_call", "--stream"]):
+        res = runner.invoke(main.app, ["--server", served, *argv])
+        assert res.exit_code == 2 and "in-process only" in res.output
+
+def test_ask_batch_through_server_matches_local_rows(served, tmp_path):
+    qfile, out = tmp_path / "qs.jsonl", tmp_path / "answers.jsonl"
+    qfile.write_text('{"q": "discount", "call_id": "2_pricing_call", "k": 3, "diversity": 0.5}\n'
+                     '{"q": "security review", "tags": ["security"], "k": 2}\n', encoding="utf-8")
+    res = CliRunner().invoke(main.app, ["--server", served, "ask-batch", str(qfile), "--out", str(out),
+                                        "--mode", "vector"])
+    assert res.exit_code == 0, res.output
+    rows = [json.loads(x) for x in out.read_text(encoding="utf-8").splitlines()]
+    assert set(rows[0]) == {"index", "q", "where", "answer", "hit_ids", "batch_retrieval_ms", "llm_ms",
+                            "latency_ms", "attempts", "cached", "context"}
+    c = CopilotClient(served)
+    assert rows[0]["hit_ids"] == [h["id"] for h in c.search("discount", k=3, where={"call_id": "2_pricing_call"},
+                                                            diversity=0.5)]
+    assert rows[1]["where"] == {"mentions_security": True} and len(rows[1]["hit_ids"]) == 2
+
+def test_thin_client_commands_skip_heavy_imports(served, tmp_path):
+    # the client process only talks HTTP: no chromadb, embedding model or openai client
+    sys.path.insert(0, str(ROOT / "bench"))
+    import startup
+    for argv in (["ask", "What was the discount?", "--k", "3"], ["summarize", "--call-id", "2_pricing_call"],
+                 ["list"], ["cache-stats"]):
+        run = startup.run_once(["--server", served, *argv], str(tmp_path))
+        assert run["exit_code"] == 0 and run["heavy"] == [], argv
@@ -0,0 +1,110 @@
+import hashlib, pathlib
+
+import pytest
+from typer.testing import CliRunner
+
+import main
+from utils import embeddings, trace
+from utils.embeddings import get_collection, persist_collection, upsert_chunks
+from utils.ingestion import chunk_segments, parse_file
+from utils.pipeline import backfill_lexical
+from utils.retrieval import get_call_chunks, list_call_ids, search
+from utils.shards import ShardedCollection, shard_of
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+def _corpus():
+    return [c for fp in sorted((ROOT / "transcripts").glob("*.txt")) for c in chunk_segments(parse_file(str(fp)), 300)]
+
+@pytest.fixture
+def sharded(hash_ef, request):
+    import chromadb
+    client = chromadb.EphemeralClient()
+    tag = hashlib.md5(request.node.nodeid.encode()).hexdigest()[:8]
+    opened = []
+
+    def opener(name):
+        opened.append(name)
+        return client.get_or_create_collection(f"{name}-{tag}", embedding_function=hash_ef,
+                                               metadata={"hnsw:space": "cosine"})
+    return ShardedCollection(opener, 3, embedding_function=hash_ef), opened
+
+def test_fanout_merge_matches_a_single_collection(sharded, mem_collection):
+    coll, opened = sharded
+    chunks = _corpus()
+    upsert_chunks(coll, chunks)
+    upsert_chunks(mem_collection, chunks)
+    assert coll.count() == len(chunks) and len(set(opened)) == 3
+    for i in range(3):  # whole calls per shard
+        calls = {m["call_id"] for m in coll.shard(i).get(include=["metadatas"])["metadatas"]}
+        assert all(shard_of(c, 3) == i for c in calls)
+
+    for q in ("discount per seat", "SOC 2 report", "competitor pricing comparison"):
+        want = [h["id"] for h in search(mem_collection, q, k=5)]
+        assert [h["id"] for h in search(coll, q, k=5)] == want
+    assert list_call_ids(coll) == list_call_ids(mem_collection)
+    assert [h["id"] for h in get_call_chunks(coll, "2_pricing_call")] == \
+        [h["id"] for h in get_call_chunks(mem_collection, "2_pricing_call")]
+
+    # paging (backfill_lexical) sees every chunk exactly once
+    class Sink:
+        ids = []
+        def add(self, rows):
+            rows = list(rows)
+            self.ids += [r["id"] for r in rows]
+            return len(rows)
+    sink = Sink()
+    assert backfill_lexical(coll, sink, page_size=7) == len(chunks)
+    assert sorted(sink.ids) == sorted(c["id"] for c in chunks)
+
+def test_call_id_queries_touch_only_the_owning_shard(sharded):
+    coll, _ = sharded
+    chunks = _corpus()
+    upsert_chunks(coll, chunks)
+    trace.reset()
+    trace.enable()
+    try:
+        hits = search(coll, "price", k=3, where={"call_id": "2_pricing_call", "mentions_pricing": True})
+        coll.query(query_texts=["price"], n_results=3, where={"call_id": "2_pricing_call"})
+    finally:
+        trace.enable(False)
+    counters = trace.counters()
+    trace.reset()
+    assert hits and all(h["meta"]["call_id"] == "2_pricing_call" for h in hits)
+    assert counters["shards.queried"] == 1
+
+    coll.delete(ids=[c["id"] for c in chunks if c["meta"]["call_id"] == "2_pricing_call"])
+    assert "2_pricing_call" not in list_call_ids(coll)
+    assert coll.count() == sum(c["meta"]["call_id"] != "2_pricing_call" for c in chunks)
+
+def test_flat_shards_open_lazily_and_evict(tmp_path, hash_ef, monkeypatch):
+    monkeypatch.setattr(embeddings, "SHARD_MAX_OPEN", 2)
+    coll = get_collection(str(tmp_path), embedding_function=hash_ef, backend="flat", shards=4)
+    assert isinstance(coll, ShardedCollection) and coll.exact_filters and coll.loaded() == []
+    chunks = _corpus()
+    upsert_chunks(coll, chunks)
+    persist_collection(coll)
+    assert len(coll.loaded()) <= 4  # unsaved shards are never dropped
+
+    ro = get_collection(str(tmp_path), embed=False, backend="flat", shards=4)
+    owner = shard_of("3_objection_call", 4)
+    assert len(get_call_chunks(ro, "3_objection_call")) == sum(c["meta"]["call_id"] == "3_objection_call" for c in chunks)
+    assert ro.loaded() == [owner]
+    assert ro.count() == len(chunks) and len(ro.loaded()) == 2
+    assert sorted((tmp_path / "flat").iterdir())[0].name == "calls_s00of04"
+
+def test_ingest_reembeds_when_the_store_layout_changes(tmp_path, monkeypatch, mem_collection, hash_ef):
+    from test_ingestion import _setup
+    _setup(tmp_path, monkeypatch, mem_collection)
+    runner = CliRunner()
+    assert runner.invoke(main.app, ["ingest"]).exit_code == 0
+    before = hash_ef.embedded
+
+    monkeypatch.setattr(embeddings, "store_layout", lambda *a: "chroma/4 shards")
+    res = runner.invoke(main.app, ["watch", "--once"])
+    assert res.exit_code == 1 and "run ingest first" in res.output
+    res = runner.invoke(main.app, ["ingest"])
+    assert res.exit_code == 0 and "re-embedding" in res.output
+    assert hash_ef.embedded - before == mem_collection.count()
+    before = hash_ef.embedded
+    assert runner.invoke(main.app, ["ingest"]).exit_code == 0 and hash_ef.embedded == before
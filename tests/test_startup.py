@@ -0,0 +1,31 @@
+import pathlib
+import subprocess
+import sys
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+def _loaded_after(code: str) -> set[str]:
+    out = subprocess.run(
+        [sys.executable, "-c", code + "\nimport sys; print(' '.join(sys.modules))"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stdout
+    return set(out.split())
+
+def test_cli_import_is_light():
+    mods = _loaded_after("import main")
+    for heavy in ("chromadb", "openai", "onnxruntime", "numpy"):
+        assert heavy not in mods, f"`import main` pulled in {heavy}"
+
+def test_prompts_import_does_not_build_client():
+    mods = _loaded_after("import utils.prompts")
+    assert "openai" not in mods
+
+def test_commands_load_only_the_heavy_modules_they_need(tmp_path):
+    # real runs against an empty store (bench/startup.py's command set), not just --help
+    sys.path.insert(0, str(ROOT / "bench"))
+    import startup
+    (tmp_path / "transcripts").mkdir()
+    for label, argv, expect in startup.COMMANDS:
+        run = startup.run_once(argv, str(tmp_path))
+        assert run["exit_code"] in (0, 2, 3, 4, 5), label
+        assert run["heavy"] == sorted(expect), label
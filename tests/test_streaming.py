@@ -0,0 +1,55 @@
+import pytest
+from typer.testing import CliRunner
+
+import main
+import utils.prompts as prompts
+from utils import embeddings
+from utils.cache import DiskCache
+from openai_stub import OpenAIStub
+from test_prompts import HITS
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    from openai import OpenAI
+    srv = OpenAIStub(tokens=["List", " price", " is", " ₹2,000", "."], delay=0.01).start()
+    monkeypatch.setattr(prompts, "client", OpenAI(base_url=srv.url, api_key="test", max_retries=0))
+    monkeypatch.setattr(prompts, "DEFAULT_MODEL", "stub-model")
+    monkeypatch.setattr(prompts, "_response_cache", DiskCache(str(tmp_path / "llm.sqlite")))
+    yield srv
+    srv.stop()
+
+def test_streamed_answer_matches_blocking_answer(stub):
+    tokens, info = [], {}
+    out = prompts.ask_qa("What is the list price?", HITS, use_cache=False, info=info, on_token=tokens.append)
+    assert tokens[:5] == ["List", " price", " is", " ₹2,000", "."]
+    assert "".join(tokens) == out and out.endswith(prompts._sources_block(HITS))
+    assert out == prompts.ask_qa("What is the list price?", HITS, use_cache=False)
+    assert stub.requests[0]["stream"] is True
+    assert 0 < info["ttft_ms"] <= info["gen_ms"]
+
+def test_mid_stream_error_keeps_partial_answer_and_sources(stub):
+    stub.fail_after = 2
+    tokens, info = [], {}
+    out = prompts.summarize_call("c1", HITS, info=info, on_token=tokens.append)
+    assert out.startswith("List price\n\n(LLM error mid-stream: APIError")
+    assert "Sources:\n[1] c1" in out and "".join(tokens) == out
+    assert info["error"] == "APIError"
+    assert prompts._response_cache.info()["entries"] == 0  # partial answers are never cached
+
+    # a complete stream is cached and replayed in one piece
+    stub.fail_after = None
+    prompts.summarize_call("c1", HITS, on_token=lambda t: None)
+    replay, info = [], {}
+    prompts.summarize_call("c1", HITS, info=info, on_token=replay.append)
+    assert replay[0] == "List price is ₹2,000." and info["cached"] and len(stub.requests) == 2
+
+def test_ask_stream_cli(stub, tmp_path, monkeypatch, mem_collection):
+    from utils.embeddings import upsert_chunks
+    upsert_chunks(mem_collection, [{"id": HITS[0]["id"], "text": HITS[0]["text"],
+                                    "meta": {**HITS[0]["meta"], "seg_start_idx": 0, "seg_end_idx": 3}}])
+    monkeypatch.setattr(embeddings, "get_collection", lambda *a, **kw: mem_collection)
+    monkeypatch.setattr(main, "CATALOG_PATH", str(tmp_path / "catalog.sqlite"))
+    res = CliRunner().invoke(main.app, ["ask", "list price?", "--mode", "vector", "--stream", "--no-cache"])
+    assert res.exit_code == 0, res.output
+    assert "List price is ₹2,000." in res.output and "Sources:" in res.output
+    assert "first token" in res.output
@@ -0,0 +1,89 @@
+import json, re
+
+import pytest
+from typer.testing import CliRunner
+
+import main
+from conftest import ROOT
+from utils.ingestion import FLAG_FIELDS, TAGGER, parse_file
+from utils.tagging import DEFAULT_TAGS, Tagger, _anchors, load_tagger
+
+def _reference(tagger, text):
+    # one search per pattern: what the combined regex must agree with
+    return sum(1 << i for i, pats in enumerate(tagger.tags.values())
+               if any(re.search(p, text, re.I) for p in pats))
+
+def test_single_pass_matches_per_pattern_search():
+    assert FLAG_FIELDS == TAGGER.fields and TAGGER.fields[:3] == tuple(f"mentions_{n}" for n in DEFAULT_TAGS)
+    lines = [s.text for fp in sorted((ROOT / "transcripts").glob("*.txt")) for s in parse_file(str(fp))]
+    lines += ["Brightcall quoted less; the CFO wants a go-live before the renewal in March.",
+              "Next steps: recap email, then procurement raises the PO.", "Thanks, talk soon."]
+    for text in lines:
+        assert TAGGER.bits(text) == _reference(TAGGER, text), text
+    for text in ("the ſeat count", "\u212aMS keys", "Straße pricing", "ſoc 2 and the ſeat"):  # folds lower() misses
+        assert TAGGER.bits(text) == TAGGER._bits_slow(text) == _reference(TAGGER, text) != 0, text
+    bits = TAGGER.bits("We trialled Brightcall last year.")  # overlapping tags both fire
+    assert set(TAGGER.names_of(bits)) == {"competitor", "brightcall"}
+    assert TAGGER.meta(bits)["mentions_brightcall"] is True
+
+def test_tags_file_is_validated(tmp_path):
+    p = tmp_path / "tags.toml"
+    p.write_text("next_steps = ['\\bnext steps?\\b']\nbudget = 'budget'\n", encoding="utf-8")
+    t = load_tagger(str(p))
+    assert t.names == ("next_steps", "budget") and t.bits("Budget and next step") == 0b11
+    assert load_tagger(str(tmp_path / "missing.toml")).names == tuple(DEFAULT_TAGS)
+    # anchors that prefix each other, one inside another's match, a pattern with no literal start
+    t = Tagger({"a": [r"\bnext\b"], "b": ["next steps?"], "c": [r"\d+ seats"], "d": ["ext"], "e": ["İstanbul"],
+                "f": [r"(?:x|yy)z", "q[|]r|w\\.v", "(ab)?c"]})
+    assert _anchors(r"\b(?:May|June)\b") == ["may", "june"] and _anchors("q[|]r|w\\.v") == ["q", "w.v"]
+    assert _anchors("pen-?test") == ["pen"] and _anchors("(ab)?c") is None and _anchors("[Nn]ext") is None
+    for text in ("next steps", "NEXT", "nextext", "we need 40 seats next", "İstanbul next", "no match",
+                 "yyz", "q|r", "w.v", "c"):
+        assert t.bits(text) == _reference(t, text), text
+    for bad in ({"Budget": ["x"]}, {"budget": []}, {"budget": ["(unclosed"]}, {"budget": ["["]},
+                {f"t{i}": ["x"] for i in range(33)}):
+        with pytest.raises(ValueError):
+            Tagger(bad)
+
+def test_ask_tag_filter_and_retag_on_change(tmp_path, monkeypatch, mem_collection, hash_ef):
+    from test_ingestion import _setup
+    _setup(tmp_path, monkeypatch, mem_collection)
+    runner = CliRunner()
+    assert runner.invoke(main.app, ["ingest"]).exit_code == 0
+    metas = mem_collection.get(include=["metadatas"])["metadatas"]
+    assert all(m["flags"] == sum(1 << i for i, f in enumerate(FLAG_FIELDS) if m[f]) for m in metas)
+
+    res = runner.invoke(main.app, ["ask", "q", "--tag", "nope"])
+    assert res.exit_code == 2 and "decision_maker" in res.output
+    seen = {}
+    monkeypatch.setattr("utils.retrieval.search", lambda coll, q, where=None, **kw: seen.update(where) or [])
+    assert runner.invoke(main.app, ["ask", "q", "--tag", "budget", "--tag", "timeline"]).exit_code == 4
+    assert seen == {"mentions_budget": True, "mentions_timeline": True}
+
+    # an edited tag set: watch refuses, ingest re-tags everything
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    manifest["tags"] = "older"
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest))
+    assert runner.invoke(main.app, ["watch", "--once"]).exit_code == 1
+    res = runner.invoke(main.app, ["ask", "q", "--tag", "budget"])
+    assert res.exit_code == 9 and "run ingest" in res.output
+    assert runner.invoke(main.app, ["ask", "q", "--mode", "vector"]).exit_code == 4  # no tag filter: still served
+    embedded = hash_ef.embedded
+    res = runner.invoke(main.app, ["ingest"])
+    assert res.exit_code == 0 and "re-tagging" in res.output and hash_ef.embedded > embedded
+    assert json.loads((tmp_path / "manifest.json").read_text())["tags"] == TAGGER.fingerprint
+
+def test_lexical_index_without_a_new_tag_degrades_to_vector(tmp_path, mem_collection):
+    from utils.embeddings import upsert_chunks
+    from utils.ingestion import chunk_segments
+    from utils.lexical import LexicalIndex
+    from utils.retrieval import search
+    chunks = chunk_segments(parse_file(str(ROOT / "transcripts" / "2_pricing_call.txt")), 300)
+    upsert_chunks(mem_collection, chunks)
+    lexical = LexicalIndex(str(tmp_path / "lex"))
+    lexical.flag_fields = FLAG_FIELDS[:3]  # saved before tags.toml grew
+    lexical.add(chunks)
+    where = {"mentions_budget": False}
+    assert lexical.can_filter({"call_id": "x", "mentions_pricing": True}) and not lexical.can_filter(where)
+    hits = search(mem_collection, "discount", k=3, where=where, mode="hybrid", lexical=lexical)
+    assert hits == search(mem_collection, "discount", k=3, where=where, mode="vector")
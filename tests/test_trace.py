@@ -0,0 +1,73 @@
+import json
+
+import pytest
+from typer.testing import CliRunner
+
+import main
+from utils import embeddings, trace
+from test_prompts import HITS
+
+@pytest.fixture
+def tracing():
+    trace.reset()
+    trace.enable()
+    yield
+    trace.enable(False)
+    trace.reset()
+
+def test_disabled_spans_are_free_noops():
+    assert not trace.enabled()
+    with trace.span("x", a=1) as sp:
+        sp.set(b=2)
+        trace.count("n")
+    assert sp is trace._NOOP and trace.spans() == [] and trace.counters() == {}
+
+def test_nested_spans_counters_and_tree(tracing):
+    with trace.span("outer"):
+        for _ in range(3):
+            with trace.span("inner", k=5):
+                trace.count("chunks_embedded", 2)
+        with pytest.raises(KeyError):
+            with trace.span("boom"):
+                raise KeyError("x")
+    outer, *rest = trace.spans()
+    assert outer.name == "outer" and outer.parent is None
+    assert {s.parent for s in rest} == {outer.id}
+    assert rest[-1].attrs["error"] == "KeyError"
+    assert trace.counters() == {"chunks_embedded": 6}
+
+    tree = trace.render_tree().splitlines()
+    assert tree[0].startswith("outer")
+    assert "├─ inner ×3" in tree[1] and "[chunks_embedded=6]" in tree[1]
+    assert "└─ boom" in tree[2]
+    assert tree[-1] == "counters: chunks_embedded=6"
+
+def test_export_jsonl_and_chrome(tracing, tmp_path):
+    with trace.span("a", mode="hybrid"):
+        trace.count("llm.prompt_tokens", 120)
+    trace.export(str(tmp_path / "t.jsonl"))
+    rows = [json.loads(l) for l in (tmp_path / "t.jsonl").read_text().splitlines()]
+    assert rows[0]["name"] == "a" and rows[0]["attrs"] == {"mode": "hybrid"}
+    assert rows[-1] == {"counters": {"llm.prompt_tokens": 120}}
+
+    trace.export(str(tmp_path / "t.json"))
+    events = json.loads((tmp_path / "t.json").read_text())["traceEvents"]
+    assert [e["ph"] for e in events] == ["X", "C"]
+    assert events[0]["args"] == {"mode": "hybrid", "llm.prompt_tokens": 120}
+
+def test_profile_flag_prints_stage_tree(tmp_path, monkeypatch, mem_collection):
+    from utils.embeddings import upsert_chunks
+    upsert_chunks(mem_collection, [{"id": HITS[0]["id"], "text": HITS[0]["text"],
+                                    "meta": {**HITS[0]["meta"], "seg_start_idx": 0, "seg_end_idx": 3}}])
+    monkeypatch.setattr(embeddings, "get_collection", lambda *a, **kw: mem_collection)
+    monkeypatch.setattr(main, "CATALOG_PATH", str(tmp_path / "catalog.sqlite"))
+    monkeypatch.setenv("GROQ_API_KEY", "")
+    out = tmp_path / "trace.jsonl"
+    res = CliRunner().invoke(main.app, ["--profile", "--trace-out", str(out), "ask", "list price?",
+                                        "--mode", "vector", "--no-cache"], env={"COLUMNS": "400"})
+    assert res.exit_code == 0, res.output
+    assert "command.ask" in res.output and "retrieval.vector_query" in res.output
+    assert "retrieval.embed_query" in res.output and "retrieval.hnsw" in res.output
+    names = {json.loads(l).get("name") for l in out.read_text().splitlines()}
+    assert {"command.ask", "retrieval.search", "retrieval.hnsw"} <= names
+    assert not trace.enabled() and trace.spans() == []
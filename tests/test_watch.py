@@ -0,0 +1,93 @@
+import pathlib
+
+from typer.testing import CliRunner
+
+import main
+from utils import trace
+from utils.catalog import Catalog
+from utils.ingestion import chunk_segments, parse_file
+from utils.manifest import load_manifest
+from utils.watch import poll
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+LINES = [ln for ln in (ROOT / "transcripts" / "2_pricing_call.txt").read_text(encoding="utf-8").splitlines() if ln.strip()]
+
+def _ids(coll, call_id):
+    return sorted(coll.get(where={"call_id": call_id}, include=[])["ids"])
+
+def _expected(fp, max_chars):
+    return sorted(c["id"] for c in chunk_segments(parse_file(str(fp)), max_chars=max_chars))
+
+def test_appends_only_reembed_the_open_chunk(tmp_path, mem_collection, hash_ef):
+    fp = tmp_path / "live_call.txt"
+    manifest = {"version": 1, "files": {}}
+    cat = Catalog(str(tmp_path / "catalog.sqlite"))
+
+    def step(**kw):
+        return poll(mem_collection, [fp], manifest, max_chars=300, ef=hash_ef, catalog=cat, log=lambda m: None, **kw)
+
+    fp.write_text("\n".join(LINES[:6]) + "\n", encoding="utf-8")
+    assert step().added > 0
+    assert _ids(mem_collection, "live_call") == _expected(fp, 300)
+
+    for n in range(6, len(LINES), 3):
+        with open(fp, "a", encoding="utf-8") as f:
+            f.write("\n".join(LINES[n:n + 3]) + "\n")
+        before = hash_ef.embedded
+        trace.reset()
+        trace.enable()
+        try:
+            stats = step()
+        finally:
+            trace.enable(False)
+        parsed = trace.counters()["segments_parsed"]
+        trace.reset()
+        # only the open chunk's lines plus the new ones are read, and only changed chunks embedded
+        open_chunk = manifest["files"][fp.name]["chunk_ids"][-1]
+        assert parsed <= 3 + int(open_chunk.split(":")[1].split("-")[1]) - int(open_chunk.split(":")[1].split("-")[0]) + 1 + 3
+        assert hash_ef.embedded - before == stats.added <= 1 + 3
+        assert _ids(mem_collection, "live_call") == _expected(fp, 300)
+
+    row, segs = cat.get("live_call"), parse_file(str(fp))
+    assert row["segment_count"] == len(segs) and row["chunk_count"] == len(_expected(fp, 300))
+    assert row["flag_counts"] == {f: sum(c["meta"][f] for c in chunk_segments(segs, 300)) for f in row["flag_counts"]}
+    assert step().files_changed == 0  # nothing new: no reads
+
+def test_partial_lines_wait_and_edits_reread(tmp_path, mem_collection, hash_ef):
+    fp = tmp_path / "live_call.txt"
+    manifest = {"version": 1, "files": {}}
+    fp.write_text("\n".join(LINES[:4]) + "\n" + LINES[4][:20], encoding="utf-8")
+    poll(mem_collection, [fp], manifest, max_chars=300, ef=hash_ef, log=lambda m: None)
+    assert manifest["files"][fp.name]["segments"] == 4  # the half-written line is not indexed yet
+
+    with open(fp, "a", encoding="utf-8") as f:
+        f.write(LINES[4][20:] + "\n")
+    poll(mem_collection, [fp], manifest, max_chars=300, ef=hash_ef, log=lambda m: None)
+    assert manifest["files"][fp.name]["segments"] == 5
+    assert _ids(mem_collection, "live_call") == _expected(fp, 300)
+
+    # an in-place edit before the read offset forces a re-read of the whole file
+    fp.write_text("\n".join(["[00:00] AE: (edited) " + LINES[0]] + LINES[1:5]) + "\n", encoding="utf-8")
+    poll(mem_collection, [fp], manifest, max_chars=300, ef=hash_ef, log=lambda m: None)
+    assert _ids(mem_collection, "live_call") == _expected(fp, 300)
+
+def test_watch_cli_after_ingest_then_ingest_again(tmp_path, monkeypatch, mem_collection, hash_ef):
+    from test_ingestion import _setup
+    tdir = _setup(tmp_path, monkeypatch, mem_collection)
+    runner = CliRunner()
+    assert runner.invoke(main.app, ["ingest"]).exit_code == 0
+    victim = sorted(tdir.glob("*.txt"))[0]
+    with open(victim, "a", encoding="utf-8") as f:
+        f.write("\n[59:59] AE: One more thing on pricing before we go.\n")
+
+    before = hash_ef.embedded
+    res = runner.invoke(main.app, ["watch", "--once"])
+    assert res.exit_code == 0, res.output
+    assert "re-read" in res.output and hash_ef.embedded - before == 1
+    assert _ids(mem_collection, victim.stem) == _expected(victim, main.MAX_CHARS)
+    assert "watch" in load_manifest(str(tmp_path / "manifest.json"))["files"][victim.name]
+
+    # ingest agrees with what watch indexed: nothing to embed
+    before = hash_ef.embedded
+    assert runner.invoke(main.app, ["ingest"]).exit_code == 0
+    assert hash_ef.embedded == before
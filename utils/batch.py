@@ -0,0 +1,162 @@
+# utils/batch.py
+"""
+ask-batch: answer a JSONL question set in one process.
+
+Input, one object per line ("question" is accepted for "q"):
+  {"q": "What is the list price?", "call_id": "2_pricing_call", "pricing_only": true, "k": 8}
+  {"q": "Who signs off?", "tags": ["decision_maker", "budget"], "expand": 2, "diversity": 0.5}
+"expand" and "diversity" work as ask's --expand and --diversity.
+
+Retrieval is batched (utils.retrieval.search_many: one vector query per distinct
+filter and k), then the LLM calls run concurrently on the async client under a
+semaphore. Results are emitted in input order as soon as every earlier item is done.
+"""
+import asyncio, json, time
+from typing import Any, Callable, Dict, List, Tuple
+
+from config import MMR_POOL
+from utils.ingestion import TAGGER
+from utils.prompts import ask_qa_async
+from utils.retrieval import mmr, search_many
+from utils.segstore import expand_hits
+from utils.tagging import field_for
+
+# JSONL option → chunk metadata flag (mirrors ask's --*-only switches; "tags": [...] mirrors --tag)
+FLAG_OPTIONS = {f"{name}_only": field for name, field in zip(TAGGER.names, TAGGER.fields)}
+
+def load_items(path: str) -> List[Dict[str, Any]]:
+    """Parse the question file; raises ValueError naming the offending line."""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{lineno}: invalid JSON ({e})") from None
+            if not isinstance(item, dict):
+                raise ValueError(f"{path}:{lineno}: expected a JSON object")
+            q = item.get("q", item.get("question"))
+            if not isinstance(q, str) or not q.strip():
+                raise ValueError(f"{path}:{lineno}: missing 'q'")
+            tags = item.get("tags") or []
+            if not isinstance(tags, list) or any(t not in TAGGER.names for t in tags):
+                raise ValueError(f"{path}:{lineno}: 'tags' must be a list of {', '.join(TAGGER.names)}")
+            expand, diversity = item.get("expand", 0), item.get("diversity", 0.0)
+            if not isinstance(expand, int) or isinstance(expand, bool) or expand < 0:
+                raise ValueError(f"{path}:{lineno}: 'expand' must be an integer >= 0")
+            if not isinstance(diversity, (int, float)) or isinstance(diversity, bool) or not 0 <= diversity <= 1:
+                raise ValueError(f"{path}:{lineno}: 'diversity' must be a number between 0 and 1")
+            item["q"] = q
+            items.append(item)
+    return items
+
+def item_where(item: Dict[str, Any]) -> Dict[str, Any]:
+    where: Dict[str, Any] = {}
+    if item.get("call_id"):
+        where["call_id"] = item["call_id"]
+    for opt, field in FLAG_OPTIONS.items():
+        if item.get(opt):
+            where[field] = True
+    for name in item.get("tags") or []:
+        where[field_for(name)] = True
+    return where
+
+def run_batch(
+    coll,
+    items: List[Dict[str, Any]],
+    write: Callable[[Dict[str, Any]], None],
+    k: int = 6,
+    mode: str = "hybrid",
+    lexical=None,
+    cache=None,
+    concurrency: int = 8,
+    timeout: float = 60.0,
+    retries: int = 3,
+    use_cache: bool = True,
+    stats=None,
+    segments=None,
+) -> Dict[str, Any]:
+    """
+    Answer every item and pass one result dict per item to `write`, in input order.
+    Returns totals: items, errors, no_hits, retrieval_ms, wall_ms.
+    `segments` (a SegmentStore) is needed only by items with "expand".
+
+    Each distinct (k, diversity) is retrieved in one batched call, so retrieval time
+    belongs to the group, not the item: a row's batch_retrieval_ms is that shared call's
+    time and its latency_ms runs from the start of the answer phase until the row is
+    written (waiting for a concurrency slot, retries and backoff included); totals'
+    retrieval_ms sums the group calls once each.
+    """
+    t0 = time.perf_counter()
+    wheres = [item_where(it) for it in items]
+    hits: List[List[Dict[str, Any]]] = [[] for _ in items]
+    batch_ms = [0.0] * len(items)
+    group_ms: List[float] = []
+    groups: Dict[Tuple[int, float], List[int]] = {}
+    for i, it in enumerate(items):
+        groups.setdefault((int(it.get("k") or k), float(it.get("diversity") or 0.0)), []).append(i)
+    for (kk, diversity), idxs in groups.items():
+        t = time.perf_counter()
+        # diversity > 0: fetch the MMR candidate pool in the batch, then re-rank each item (as retrieval.search)
+        res = search_many(coll, [(items[i]["q"], wheres[i]) for i in idxs], k=kk * MMR_POOL if diversity else kk,
+                          cache=cache, mode=mode, lexical=lexical, stats=stats)
+        if diversity:
+            res = [mmr(coll, h, kk, diversity) for h in res]
+        res = [expand_hits(h, segments, items[i].get("expand", 0)) for i, h in zip(idxs, res)]
+        group_ms.append(round((time.perf_counter() - t) * 1000, 1))
+        for i, h in zip(idxs, res):
+            hits[i], batch_ms[i] = h, group_ms[-1]  # one batched call serves the whole group
+
+    totals = asyncio.run(_answer_all(items, wheres, hits, batch_ms, write, concurrency, timeout,
+                                     retries, use_cache))
+    totals.update(items=len(items), retrieval_ms=round(sum(group_ms), 1),
+                  wall_ms=round((time.perf_counter() - t0) * 1000, 1))
+    return totals
+
+async def _answer_all(items, wheres, hits, batch_ms, write, concurrency, timeout, retries, use_cache):
+    sem = asyncio.Semaphore(max(1, concurrency))
+    t0 = time.perf_counter()
+    done: Dict[int, Dict[str, Any]] = {}
+    next_out = 0
+    totals = {"errors": 0, "no_hits": 0}
+
+    async def one(i: int) -> None:
+        nonlocal next_out
+        it = items[i]
+        info: Dict[str, Any] = {}
+        if hits[i]:
+            async with sem:
+                answer = await ask_qa_async(it["q"], hits[i], use_cache=use_cache, timeout=timeout,
+                                            retries=retries, info=info)
+        else:
+            answer = ""
+            info["error"] = "no_hits"
+        row = {
+            "index": i,
+            "q": it["q"],
+            "where": wheres[i],
+            "answer": answer,
+            "hit_ids": [h.get("id") for h in hits[i]],
+            "batch_retrieval_ms": batch_ms[i],
+            "llm_ms": info.get("llm_ms", 0.0),
+            "latency_ms": 0.0,  # set when written
+            "attempts": info.get("attempts", 0),
+            "cached": info.get("cached", False),
+            "context": info.get("context"),
+        }
+        if "id" in it:
+            row["id"] = it["id"]
+        if info.get("error"):
+            row["error"] = info["error"]
+            totals["no_hits" if info["error"] == "no_hits" else "errors"] += 1
+        done[i] = row
+        while next_out in done:
+            row = done.pop(next_out)
+            row["latency_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            write(row)
+            next_out += 1
+
+    await asyncio.gather(*(one(i) for i in range(len(items))))
+    return totals
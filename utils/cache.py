@@ -0,0 +1,255 @@
+# utils/cache.py
+"""
+Small caching toolkit:
+  - LRUCache:   thread-safe in-memory LRU
+  - DiskCache:  SQLite-backed key/value store with TTL and total-size eviction
+  - RetrievalCache: memo for search() results (memory tier + optional disk tier),
+    keyed on normalized query, where filter, k, search mode and the index version
+Ingest bumps the index version whenever the collection changes, which retires
+every cached search result without an explicit purge.
+"""
+import atexit, hashlib, json, os, pathlib, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+# -------------------- index version --------------------
+
+def read_index_version(path: str) -> str:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip() or "0"
+    except FileNotFoundError:
+        return "0"
+
+def bump_index_version(path: str) -> str:
+    p = pathlib.Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    version = str(time.time_ns())
+    tmp = p.with_suffix(".tmp")
+    tmp.write_text(version, encoding="utf-8")
+    os.replace(tmp, p)
+    return version
+
+# -------------------- tiers --------------------
+
+class LRUCache:
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key: str, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class DiskCache:
+    """
+    JSON values in one SQLite table. Entries older than `ttl` seconds are misses;
+    once the table exceeds `max_bytes`, least-recently-accessed rows are evicted.
+    `tag` is an opaque label per row (e.g. index version) that can be purged in bulk;
+    the last tag kept is recorded, so repeating a purge (every new process) only reads.
+    Reads only write `accessed` when it is over ACCESS_GRANULARITY seconds old, and the
+    table size is tracked in memory (re-summed only when it looks over budget, since
+    other processes may share the file).
+    """
+
+    ACCESS_GRANULARITY = 60.0
+
+    def __init__(self, path: str, ttl: float = 86400.0, max_bytes: int = 64 << 20):
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, tag TEXT NOT NULL DEFAULT '',"
+            " size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, n INTEGER NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._total = self._size()
+
+    def _size(self) -> int:
+        return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, created, accessed, size FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl and now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._total -= row[3]
+                return None
+            if now - row[2] > self.ACCESS_GRANULARITY:
+                self._db.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any, tag: str = "") -> None:
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM cache WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, tag, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, data, tag, len(data), now, now),
+            )
+            self._total += len(data) - (old[0] if old else 0)
+            self._evict()
+
+    def _evict(self) -> None:
+        if self._total <= self.max_bytes:
+            return
+        total = self._total = self._size()
+        if total <= self.max_bytes:
+            return
+        # drop oldest-accessed rows until we are ~10% under budget
+        target = int(self.max_bytes * 0.9)
+        for key, size in self._db.execute("SELECT key, size FROM cache ORDER BY accessed").fetchall():
+            if total <= target:
+                break
+            self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            total -= size
+        self._total = total
+
+    def purge_except(self, tag: str) -> int:
+        with self._lock:
+            kept = self._db.execute("SELECT value FROM meta WHERE name = 'kept_tag'").fetchone()
+            if kept is not None and kept[0] == tag:
+                return 0
+            n = self._db.execute("DELETE FROM cache WHERE tag != ?", (tag,)).rowcount
+            self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('kept_tag', ?)", (tag,))
+            if n:
+                self._total = self._size()
+            return n
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM cache")
+            self._db.execute("DELETE FROM counters")
+            self._total = 0
+
+    def incr(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO counters (name, n) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET n = n + excluded.n",
+                (name, n),
+            )
+
+    def info(self) -> Dict[str, int]:
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+            counters = dict(self._db.execute("SELECT name, n FROM counters").fetchall())
+        return {"entries": entries, "bytes": size, **counters}
+
+# -------------------- retrieval memo --------------------
+
+def _normalize_query(q: str) -> str:
+    return " ".join(q.lower().split())
+
+class RetrievalCache:
+    """
+    Two-tier memo for search(): memory LRU in front of an optional DiskCache.
+    The index version is re-read on every lookup (one tiny file read), so results
+    cached before an ingest are never served after it. Hit/miss counts for the disk
+    tier's counters table are kept in memory and written every FLUSH_EVERY lookups,
+    by stats() and at exit, so a lookup served from memory does no SQLite write.
+    """
+
+    FLUSH_EVERY = 256
+
+    def __init__(self, version_path: str, max_entries: int = 512, disk_path: str | None = None,
+                 ttl: float = 86400.0, max_bytes: int = 64 << 20):
+        self.version_path = version_path
+        self.mem = LRUCache(max_entries)
+        self.disk = DiskCache(disk_path, ttl=ttl, max_bytes=max_bytes) if disk_path else None
+        self.hits = self.misses = self.disk_hits = 0
+        self._version = None
+        self._pending = {"hits": 0, "misses": 0}
+        self._pending_lock = threading.Lock()
+        if self.disk is not None:
+            atexit.register(self.flush)
+
+    def key(self, q: str, where: Dict[str, Any] | None, k: int, mode: str = "vector", diversity: float = 0.0) -> str:
+        version = read_index_version(self.version_path)
+        if version != self._version:
+            if self._version is not None:
+                self.mem.clear()
+            if self.disk is not None:
+                self.disk.purge_except(version)
+            self._version = version
+        parts = [_normalize_query(q), where or {}, int(k), mode, version]
+        if diversity:
+            parts.append(round(float(diversity), 4))
+        raw = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> List[Dict[str, Any]] | None:
+        hits = self.mem.get(key)
+        if hits is None and self.disk is not None:
+            hits = self.disk.get(key)
+            if hits is not None:
+                self.disk_hits += 1
+                self.mem.put(key, hits)
+        if hits is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        if self.disk is not None:
+            with self._pending_lock:
+                self._pending["hits" if hits is not None else "misses"] += 1
+                due = sum(self._pending.values()) >= self.FLUSH_EVERY
+            if due:
+                self.flush()
+        return [dict(h) for h in hits] if hits is not None else None
+
+    def flush(self) -> None:
+        """Add the pending hit/miss counts to the disk tier's counters."""
+        if self.disk is None:
+            return
+        with self._pending_lock:
+            pending, self._pending = self._pending, {"hits": 0, "misses": 0}
+        for name, n in pending.items():
+            if n:
+                self.disk.incr(name, n)
+
+    def put(self, key: str, hits: List[Dict[str, Any]]) -> None:
+        self.mem.put(key, hits)
+        if self.disk is not None:
+            self.disk.put(key, hits, tag=self._version or "")
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "mem_entries": len(self.mem),
+        }
+        if self.disk is not None:
+            self.flush()
+            out["disk"] = self.disk.info()
+        return out
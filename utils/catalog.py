@@ -0,0 +1,106 @@
+# utils/catalog.py
+"""
+Call catalog: one SQLite row per indexed call, maintained by ingest.
+
+Answers "which calls exist / how big are they / which is newest" without
+scanning chunk metadata in the vector store.
+"""
+import json, pathlib, sqlite3, threading
+from typing import Any, Dict, List
+
+_COLUMNS = ("call_id", "source", "chunk_count", "segment_count", "first_ts", "last_ts", "source_mtime", "flag_counts")
+
+class Catalog:
+    def __init__(self, path: str):
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS calls ("
+            " call_id TEXT PRIMARY KEY, source TEXT NOT NULL,"
+            " chunk_count INTEGER NOT NULL, segment_count INTEGER NOT NULL,"
+            " first_ts TEXT, last_ts TEXT, source_mtime REAL NOT NULL,"
+            " flag_counts TEXT NOT NULL DEFAULT '{}')"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS calls_mtime ON calls(source_mtime)")
+
+    def upsert(self, row: Dict[str, Any]) -> None:
+        vals = [row.get(c) for c in _COLUMNS]
+        vals[-1] = json.dumps(row.get("flag_counts") or {}, sort_keys=True)
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO calls ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                vals,
+            )
+
+    def touch(self, call_id: str, source_mtime: float) -> None:
+        with self._lock:
+            self._db.execute("UPDATE calls SET source_mtime = ? WHERE call_id = ?", (source_mtime, call_id))
+
+    def delete(self, call_id: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM calls WHERE call_id = ?", (call_id,))
+
+    def _rows(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            cur = self._db.execute(sql, params)
+            out = [dict(zip(_COLUMNS, r)) for r in cur.fetchall()]
+        for r in out:
+            r["flag_counts"] = json.loads(r["flag_counts"] or "{}")
+        return out
+
+    def get(self, call_id: str) -> Dict[str, Any] | None:
+        rows = self._rows(f"SELECT {', '.join(_COLUMNS)} FROM calls WHERE call_id = ?", (call_id,))
+        return rows[0] if rows else None
+
+    def has(self, call_id: str) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM calls WHERE call_id = ?", (call_id,)).fetchone() is not None
+
+    def call_ids(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._db.execute("SELECT call_id FROM calls ORDER BY call_id")]
+
+    def rows(self) -> List[Dict[str, Any]]:
+        return self._rows(f"SELECT {', '.join(_COLUMNS)} FROM calls ORDER BY call_id")
+
+    def latest(self) -> Dict[str, Any] | None:
+        """Call whose source transcript was modified most recently."""
+        rows = self._rows(f"SELECT {', '.join(_COLUMNS)} FROM calls ORDER BY source_mtime DESC LIMIT 1")
+        return rows[0] if rows else None
+
+    def totals(self, flag_names) -> Dict[str, Any]:
+        """Corpus-wide chunk count and per-flag chunk counts (planner statistics)."""
+        sums = ", ".join("COALESCE(SUM(json_extract(flag_counts, ?)), 0)" for _ in flag_names)
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT COALESCE(SUM(chunk_count), 0){', ' + sums if sums else ''} FROM calls",
+                tuple(f'$."{f}"' for f in flag_names),
+            ).fetchone()
+        return {"chunk_count": row[0], "flag_counts": dict(zip(flag_names, row[1:]))}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM calls").fetchone()[0]
+
+class CallStats:
+    """Accumulates one call's catalog row while its chunks stream past."""
+
+    def __init__(self, call_id: str, source: str, source_mtime: float, flag_names: tuple[str, ...]):
+        self.row: Dict[str, Any] = {
+            "call_id": call_id, "source": source, "source_mtime": source_mtime,
+            "chunk_count": 0, "segment_count": 0, "first_ts": None, "last_ts": None,
+            "flag_counts": {f: 0 for f in flag_names},
+        }
+
+    def add(self, chunk: Dict[str, Any]) -> None:
+        m, r = chunk["meta"], self.row
+        r["chunk_count"] += 1
+        r["segment_count"] = m["seg_end_idx"] + 1
+        if r["first_ts"] is None:
+            r["first_ts"] = m["start_ts"]
+        r["last_ts"] = m["end_ts"]
+        for f in r["flag_counts"]:
+            if m.get(f):
+                r["flag_counts"][f] += 1
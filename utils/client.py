@@ -0,0 +1,61 @@
+# utils/client.py
+"""Thin client for utils/server.py. Stdlib only, so CLI calls through it start instantly."""
+import json
+from typing import Any, Dict, List
+from urllib import request, error
+
+class ServerError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+class CopilotClient:
+    def __init__(self, base_url: str, timeout: float = 120.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _call(self, method: str, path: str, body: Dict[str, Any] | None = None) -> Dict[str, Any]:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        req = request.Request(self.base_url + path, data=data, method=method,
+                              headers={"Content-Type": "application/json"})
+        try:
+            with request.urlopen(req, timeout=self.timeout) as resp:
+                return json.loads(resp.read() or b"{}")
+        except error.HTTPError as e:
+            try:
+                msg = json.loads(e.read() or b"{}").get("error", str(e))
+            except ValueError:
+                msg = str(e)
+            raise ServerError(e.code, msg) from None
+
+    def health(self) -> bool:
+        return bool(self._call("GET", "/health").get("ok"))
+
+    def stats(self) -> Dict[str, Any]:
+        return self._call("GET", "/stats")
+
+    def list_call_ids(self) -> List[str]:
+        return self._call("GET", "/list")["call_ids"]
+
+    def calls(self) -> List[Dict[str, Any]]:
+        return self._call("GET", "/calls")["calls"]
+
+    def search(self, q: str, k: int = 6, where: Dict[str, Any] | None = None,
+               mode: str = "vector", expand: int = 0, diversity: float = 0.0) -> List[Dict[str, Any]]:
+        body = {"q": q, "k": k, "where": where or {}, "mode": mode, "expand": expand, "diversity": diversity}
+        return self._call("POST", "/search", body)["hits"]
+
+    def ask(self, q: str, k: int = 6, where: Dict[str, Any] | None = None, no_cache: bool = False,
+            mode: str = "hybrid", expand: int = 0, diversity: float = 0.0,
+            info: Dict[str, Any] | None = None) -> str:
+        """The answer; `info` (if given) receives the rest of the reply (hit_ids, timings, context)."""
+        body = {"q": q, "k": k, "where": where or {}, "no_cache": no_cache, "mode": mode, "expand": expand,
+                "diversity": diversity}
+        res = self._call("POST", "/ask", body)
+        if info is not None:
+            info.update((key, v) for key, v in res.items() if key != "answer")
+        return res["answer"]
+
+    def summarize(self, call_id: str, k: int = 12, no_cache: bool = False, full: bool = False) -> str:
+        body = {"call_id": call_id, "k": k, "no_cache": no_cache, "full": full}
+        return self._call("POST", "/summarize", body)["summary"]
@@ -0,0 +1,122 @@
+# utils/context.py
+"""
+Token-budgeted context packing for LLM prompts.
+
+pack() takes ranked hits and returns the subset worth sending:
+  1. drop duplicates: same chunk id, or a segment range already covered by a
+     better-scored hit of the same call (seg_start_idx / seg_end_idx)
+  2. fill the model's token budget greedily by score (the best hit always goes in)
+  3. order what's left by call, then by position in the call, so the model reads
+     each conversation forwards
+Tokens are counted with tiktoken (cl100k_base, close enough for Llama budgets);
+if the encoding can't be loaded (offline, no cache) a chars/4 estimate is used.
+"""
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, List, Tuple
+
+from config import CONTEXT_BUDGETS, CONTEXT_TOKEN_BUDGET
+
+_encoding = None
+_encoding_failed = False
+
+def count_tokens(text: str) -> int:
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding_failed = True
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+def budget_for(model: str | None) -> int:
+    """CONTEXT_TOKEN_BUDGET when set, else the per-model entry in CONTEXT_BUDGETS."""
+    if CONTEXT_TOKEN_BUDGET > 0:
+        return CONTEXT_TOKEN_BUDGET
+    return CONTEXT_BUDGETS.get(model or "", CONTEXT_BUDGETS["default"])
+
+@dataclass
+class PackStats:
+    hits_in: int = 0
+    hits_out: int = 0
+    duplicates: int = 0
+    over_budget: int = 0
+    tokens_in: int = 0
+    tokens_out: int = 0
+    budget: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_in - self.tokens_out
+
+    def as_dict(self) -> Dict[str, int]:
+        return {**asdict(self), "tokens_saved": self.tokens_saved}
+
+def _covered(ranges: List[Tuple[int, int]], s: int, e: int) -> bool:
+    """True if every segment in [s, e] lies inside the union of `ranges`."""
+    pos = s
+    for rs, re_ in sorted(ranges):
+        if rs > pos:
+            break
+        pos = max(pos, re_ + 1)
+        if pos > e:
+            return True
+    return pos > e
+
+def pack(
+    hits: List[Dict[str, Any]],
+    budget: int,
+    render: Callable[[Dict[str, Any]], str],
+    sep: str = "",
+    count: Callable[[str], int] = count_tokens,
+) -> Tuple[List[Dict[str, Any]], PackStats]:
+    """
+    Select and order hits for one prompt. `render` turns a hit into the exact text
+    block the prompt will contain and `sep` is the text between blocks, so the
+    token counts match what is sent.
+    """
+    stats = PackStats(hits_in=len(hits), budget=budget)
+    if not hits:
+        return [], stats
+    sep_tokens = count(sep) if sep else 0
+    cost = [count(render(h)) for h in hits]
+    stats.tokens_in = sum(cost) + sep_tokens * (len(hits) - 1)
+
+    # best first; unscored hits keep their retrieval rank
+    order = sorted(range(len(hits)), key=lambda i: (-(hits[i].get("score") or 0.0), i))
+    seen_ids, kept_ranges = set(), {}
+    chosen: List[int] = []
+    used = 0
+    for i in order:
+        h, m = hits[i], hits[i].get("meta") or {}
+        if h.get("id") is not None and h["id"] in seen_ids:
+            stats.duplicates += 1
+            continue
+        s, e, cid = m.get("seg_start_idx"), m.get("seg_end_idx"), m.get("call_id")
+        if s is not None and e is not None and _covered(kept_ranges.get(cid, []), int(s), int(e)):
+            stats.duplicates += 1
+            continue
+        extra = cost[i] + (sep_tokens if chosen else 0)
+        if chosen and used + extra > budget:
+            stats.over_budget += 1
+            continue
+        chosen.append(i)
+        used += extra
+        seen_ids.add(h.get("id"))
+        if s is not None and e is not None:
+            kept_ranges.setdefault(cid, []).append((int(s), int(e)))
+
+    # calls in order of their best hit, each read forwards in time
+    call_rank: Dict[Any, int] = {}
+    for i in chosen:
+        call_rank.setdefault((hits[i].get("meta") or {}).get("call_id"), len(call_rank))
+    chosen.sort(key=lambda i: (
+        call_rank[(hits[i].get("meta") or {}).get("call_id")],
+        (hits[i].get("meta") or {}).get("seg_start_idx", 0),
+        i,
+    ))
+    stats.hits_out = len(chosen)
+    stats.tokens_out = used
+    return [hits[i] for i in chosen], stats
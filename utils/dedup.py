@@ -0,0 +1,339 @@
+# utils/dedup.py
+"""
+Near-duplicate chunk suppression (DEDUP=1).
+
+Calls repeat themselves: intros, recaps, the same pricing pitch in dozens of calls.
+Ingest gives each chunk a MinHash signature (word 3-grams of the spoken text, so
+timestamps and speaker labels don't count) and looks it up in an LSH table of the
+chunks already stored. A chunk whose estimated Jaccard similarity to a stored one
+reaches DEDUP_THRESHOLD is not embedded or stored: it becomes a reference
+(id, call_id, its own metadata) to that canonical chunk.
+
+  DedupIndex       SQLite side table (<persist_dir>/dedup.sqlite): canonical
+                   signatures, LSH band keys, references
+  DedupCollection  Collection wrapper (like utils.shards.ShardedCollection) that makes
+                   references visible wherever a call is named: get(where=call_id),
+                   get(ids=...) and call-scoped query() return them with their
+                   canonical's document/embedding and their own metadata (plus
+                   "dup_of"). Unscoped queries see each text once.
+  split / promote  ingest helpers: route chunks to the store or the reference list;
+                   rebuild references whose canonical was deleted so they can be stored
+
+The hash parameters are fixed when the index is created, so its signatures stay
+comparable; changing DEDUP_PERMS/DEDUP_BANDS needs a fresh index (ingest --force
+after deleting dedup.sqlite).
+"""
+import hashlib, json, pathlib, re, sqlite3, threading, zlib
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from utils import trace
+from utils.ingestion import LINE_RE, iter_chunks, iter_segments
+from utils.planner import conjuncts
+from utils.results import concat, merge, page
+
+_PRIME = 4294967311  # smallest prime above 2**32
+_WORD_RE = re.compile(r"\w+")
+
+class MinHasher:
+    """MinHash over word 3-grams with `num_perm` universal hash functions ((a*x + b) mod p)."""
+
+    def __init__(self, num_perm: int = 128, shingle: int = 3, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm, self.shingle, self.seed = num_perm, shingle, seed
+        # a, b < 2**32 keep a*x + b inside uint64 for 32-bit shingle hashes
+        self.a = rng.integers(1, 1 << 32, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> List[int]:
+        words: List[str] = []
+        for line in text.splitlines():
+            m = LINE_RE.match(line)
+            words.extend(_WORD_RE.findall((m["text"] if m else line).lower()))
+        n = self.shingle
+        grams = [" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))]
+        return [zlib.crc32(g.encode("utf-8")) for g in grams]
+
+    def signature(self, text: str) -> np.ndarray:
+        h = np.asarray(self.shingles(text), dtype=np.uint64)
+        return (((h[:, None] * self.a[None, :] + self.b[None, :]) % _PRIME).min(axis=0) & 0xFFFFFFFF).astype(np.uint32)
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+def band_keys(sig: np.ndarray, bands: int) -> List[int]:
+    rows = len(sig) // bands
+    return [int.from_bytes(hashlib.blake2b(sig[i * rows:(i + 1) * rows].tobytes(), digest_size=8,
+                                           person=i.to_bytes(4, "little")).digest(), "little", signed=True)
+            for i in range(bands)]
+
+class DedupIndex:
+    """
+    Canonical signatures and references in SQLite. Writes are batched into one
+    transaction per commit() (ingest/watch call it before saving the manifest).
+    """
+
+    def __init__(self, path: str, num_perm: int = 128, bands: int = 32, threshold: float = 0.8):
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS params (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, call_id TEXT NOT NULL, sig BLOB NOT NULL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS bands (key INTEGER NOT NULL, id TEXT NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS bands_key ON bands(key)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS bands_id ON bands(id)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS refs (id TEXT PRIMARY KEY, canonical TEXT NOT NULL,"
+                             " call_id TEXT NOT NULL, meta TEXT NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS refs_canonical ON refs(canonical)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS refs_call ON refs(call_id)")
+            for key, val in (("num_perm", num_perm), ("bands", bands), ("seed", 1)):
+                self._db.execute("INSERT OR IGNORE INTO params VALUES (?, ?)", (key, val))
+        params = dict(self._db.execute("SELECT key, value FROM params"))
+        self.bands = params["bands"]
+        self.hasher = MinHasher(params["num_perm"], seed=params["seed"])
+
+    # ---- ingest side ----
+    def _sig(self, chunk: Dict[str, Any]) -> np.ndarray:
+        sig = chunk.get("sig")
+        return np.asarray(sig, dtype=np.uint32) if sig is not None else self.hasher.signature(chunk["text"])
+
+    def match(self, chunk: Dict[str, Any]) -> str | None:
+        """Id of the stored chunk `chunk` duplicates, or None if it should be stored itself."""
+        cid = chunk["id"]
+        with self._lock:
+            if self._db.execute("SELECT 1 FROM chunks WHERE id = ?", (cid,)).fetchone():
+                return None
+            row = self._db.execute("SELECT canonical FROM refs WHERE id = ?", (cid,)).fetchone()
+            if row is not None:
+                return row[0]
+            sig = self._sig(chunk)
+            keys = band_keys(sig, self.bands)
+            cands = [r[0] for r in self._db.execute(
+                f"SELECT DISTINCT id FROM bands WHERE key IN ({', '.join('?' * len(keys))})", keys)]
+            best, best_sim = None, self.threshold
+            for i in range(0, len(cands), 500):
+                part = cands[i:i + 500]
+                for other, blob in self._db.execute(
+                        f"SELECT id, sig FROM chunks WHERE id IN ({', '.join('?' * len(part))})", part):
+                    sim = similarity(sig, np.frombuffer(blob, dtype=np.uint32))
+                    if sim >= best_sim and other != cid:
+                        best, best_sim = other, sim
+        trace.count("dedup.candidates", len(cands))
+        return best
+
+    def add(self, chunk: Dict[str, Any]) -> None:
+        """Register a stored (canonical) chunk."""
+        sig = self._sig(chunk)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?)",
+                             (chunk["id"], chunk["meta"].get("call_id", ""), sig.tobytes()))
+            self._db.execute("DELETE FROM bands WHERE id = ?", (chunk["id"],))
+            self._db.executemany("INSERT INTO bands VALUES (?, ?)", [(k, chunk["id"]) for k in band_keys(sig, self.bands)])
+
+    def add_ref(self, chunk: Dict[str, Any], canonical: str) -> None:
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO refs VALUES (?, ?, ?, ?)",
+                             (chunk["id"], canonical, chunk["meta"].get("call_id", ""),
+                              json.dumps(chunk["meta"], sort_keys=True)))
+
+    def remove(self, ids: Iterable[str]) -> List[Tuple[str, str]]:
+        """
+        Forget chunks (stored or references). Returns the (id, call_id) of references whose
+        canonical was among them: they are dropped too and must be stored again (promote()).
+        """
+        ids = list(ids)
+        orphans: List[Tuple[str, str]] = []
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                part = ids[i:i + 500]
+                marks = ", ".join("?" * len(part))
+                self._db.execute(f"DELETE FROM refs WHERE id IN ({marks})", part)
+                orphans += self._db.execute(f"SELECT id, call_id FROM refs WHERE canonical IN ({marks})", part).fetchall()
+                self._db.execute(f"DELETE FROM refs WHERE canonical IN ({marks})", part)
+                self._db.execute(f"DELETE FROM chunks WHERE id IN ({marks})", part)
+                self._db.execute(f"DELETE FROM bands WHERE id IN ({marks})", part)
+        return orphans
+
+    def prune(self, present: set) -> int:
+        """Drop references of calls that no longer exist; returns how many."""
+        with self._lock:
+            gone = [r[0] for r in self._db.execute("SELECT DISTINCT call_id FROM refs") if r[0] not in present]
+            n = 0
+            for call in gone:
+                n += self._db.execute("DELETE FROM refs WHERE call_id = ?", (call,)).rowcount
+        return n
+
+    def reset(self) -> None:
+        """Forget every signature and reference (the store is about to be rebuilt)."""
+        with self._lock:
+            for table in ("chunks", "bands", "refs"):
+                self._db.execute(f"DELETE FROM {table}")
+
+    def commit(self) -> None:
+        with self._lock:
+            self._db.commit()
+
+    # ---- query side ----
+    def refs(self, ids: Sequence[str]) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+        """{reference id: (canonical id, its metadata)} for the given ids that are references."""
+        out: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        ids = list(ids)
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                part = ids[i:i + 500]
+                for rid, canon, meta in self._db.execute(
+                        f"SELECT id, canonical, meta FROM refs WHERE id IN ({', '.join('?' * len(part))})", part):
+                    out[rid] = (canon, json.loads(meta))
+        return out
+
+    def refs_of_calls(self, call_ids: Sequence[str]) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """(reference id, canonical id, metadata) of every reference in these calls."""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, canonical, meta FROM refs WHERE call_id IN ({', '.join('?' * len(call_ids))})"
+                " ORDER BY call_id, id", list(call_ids)).fetchall()
+        return [(rid, canon, json.loads(meta)) for rid, canon, meta in rows]
+
+    def ref_ids(self) -> List[Tuple[str, str]]:
+        """(reference id, call_id) of every reference."""
+        with self._lock:
+            return self._db.execute("SELECT id, call_id FROM refs").fetchall()
+
+    def counts(self) -> Tuple[int, int]:
+        """(stored chunks, references)."""
+        with self._lock:
+            return (self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0],
+                    self._db.execute("SELECT COUNT(*) FROM refs").fetchone()[0])
+
+# ---- ingest helpers ----
+def split(index: DedupIndex, chunks: Iterable[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """(chunks to store, chunks recorded as references). Stored ones are registered as canonicals."""
+    store, refs = [], []
+    with trace.span("dedup.split"):
+        for c in chunks:
+            if c.get("sig") is None:
+                c["sig"] = index.hasher.signature(c["text"])
+            canon = index.match(c)
+            if canon is None:
+                index.add(c)
+                store.append(c)
+            else:
+                index.add_ref(c, canon)
+                refs.append(c)
+    return store, refs
+
+def promote(orphans: Sequence[Tuple[str, str]], paths: Dict[str, str], max_chars: int,
+            hasher: MinHasher | None = None) -> List[Dict[str, Any]]:
+    """
+    Rebuild the chunks of orphaned references from their transcripts (`paths`: call_id →
+    file), for split() and storing. Ids no longer in the file were edited away and are skipped.
+    """
+    by_call: Dict[str, set] = defaultdict(set)
+    for cid, call in orphans:
+        by_call[call].add(cid)
+    out = []
+    for call, ids in sorted(by_call.items()):
+        path = paths.get(call)
+        if path is None:
+            continue
+        out += [c for c in iter_chunks(iter_segments(path), max_chars=max_chars, minhash=hasher) if c["id"] in ids]
+    return out
+
+# ---- query side ----
+def _matches(meta: Dict[str, Any], where: Dict[str, Any] | None) -> bool:
+    for key, val in conjuncts(where):
+        have = meta.get(key)
+        if isinstance(val, dict):
+            op, arg = next(iter(val.items())) if len(val) == 1 else (None, None)
+            ok = {"$eq": lambda: have == arg, "$ne": lambda: have != arg,
+                  "$in": lambda: have in arg, "$nin": lambda: have not in arg}.get(op)
+            if ok is None or not ok():
+                return False
+        elif have != val:
+            return False
+    return True
+
+def _scoped_calls(where: Dict[str, Any] | None) -> List[str]:
+    """Calls a filter names (call_id equality or $in); references are only visible in those."""
+    for key, val in conjuncts(where):
+        if key != "call_id":
+            continue
+        if isinstance(val, str):
+            return [val]
+        if isinstance(val, dict) and isinstance(val.get("$in"), list):
+            return [str(v) for v in val["$in"]]
+    return []
+
+class DedupCollection:
+    """Collection API passthrough to `coll` that resolves references (see module docstring)."""
+
+    def __init__(self, coll, index: DedupIndex):
+        self.coll = coll
+        self.dedup = index
+
+    def __getattr__(self, name):  # count, upsert, delete, save, _embedding_function, exact_filters, ...
+        return getattr(self.coll, name)
+
+    def _refs_for(self, where) -> List[Tuple[str, str, Dict[str, Any]]]:
+        calls = _scoped_calls(where)
+        return [r for r in self.dedup.refs_of_calls(calls) if _matches(r[2], where)] if calls else []
+
+    def _resolve(self, refs: List[Tuple[str, str, Dict[str, Any]]], include: Sequence[str]) -> Dict[str, Any]:
+        """Rows for references: canonical document/embedding, own metadata."""
+        res: Dict[str, Any] = {"ids": [r[0] for r in refs]}
+        want = [key for key in ("documents", "embeddings") if key in include]
+        got = self.coll.get(ids=sorted({r[1] for r in refs}), include=want) if refs and want else {"ids": []}
+        pos = {cid: j for j, cid in enumerate(got["ids"])}
+        keep = [i for i, r in enumerate(refs) if not want or r[1] in pos]  # canonical briefly missing: skip
+        res["ids"] = [refs[i][0] for i in keep]
+        for key in ("documents", "embeddings"):
+            res[key] = [got[key][pos[refs[i][1]]] for i in keep] if key in want else None
+        res["metadatas"] = [{**refs[i][2], "dup_of": refs[i][1]} for i in keep] if "metadatas" in include else None
+        return res
+
+    def get(self, ids: Sequence[str] | None = None, where: Dict[str, Any] | None = None, limit: int | None = None,
+            offset: int | None = None, include: Sequence[str] = ("documents", "metadatas"), **kw) -> Dict[str, Any]:
+        if ids is not None:
+            refs = self.dedup.refs(ids)
+            stored = [cid for cid in ids if cid not in refs]
+            base = self.coll.get(ids=stored, where=where, include=include, **kw) if stored else {"ids": []}
+            extra = [(rid, *refs[rid]) for rid in ids if rid in refs and _matches(refs[rid][1], where)]
+            return page(concat([base, self._resolve(extra, include)], include), offset, limit)
+        refs = self._refs_for(where)
+        if not refs:
+            return self.coll.get(where=where, limit=limit, offset=offset, include=include, **kw)
+        base = self.coll.get(where=where, include=include, **kw)
+        return page(concat([base, self._resolve(refs, include)], include), offset, limit)
+
+    def query(self, query_texts: Sequence[str] | None = None, query_embeddings=None, n_results: int = 10,
+              where: Dict[str, Any] | None = None, include: Sequence[str] = ("documents", "metadatas", "distances"),
+              **kw) -> Dict[str, Any]:
+        refs = self._refs_for(where)
+        if not refs:
+            return self.coll.query(query_texts=query_texts, query_embeddings=query_embeddings,
+                                   n_results=n_results, where=where, include=include, **kw)
+        if query_embeddings is None:
+            ef = self.coll._embedding_function
+            if ef is None:
+                raise ValueError("query_texts needs an embedding_function (open with embed=True)")
+            with trace.span("retrieval.embed_query"):
+                query_embeddings = ef(list(query_texts or []))
+        qv = np.asarray(query_embeddings, dtype=np.float32)
+        want = list(dict.fromkeys(list(include) + ["distances"]))
+        base = self.coll.query(query_embeddings=qv, n_results=n_results, where=where, include=want, **kw)
+        # score the call's references exactly (a call has tens of them) and merge by distance
+        rows = self._resolve(refs, list(dict.fromkeys([k for k in include if k != "distances"] + ["embeddings"])))
+        mat = np.asarray(rows["embeddings"], dtype=np.float32).reshape(len(rows["ids"]), -1)
+        mat /= np.maximum(np.linalg.norm(mat, axis=1, keepdims=True), 1e-12)
+        qn = qv / np.maximum(np.linalg.norm(qv, axis=1, keepdims=True), 1e-12)
+        dists = (1.0 - qn @ mat.T) if len(mat) else np.zeros((len(qv), 0), dtype=np.float32)
+        extra = {"ids": [rows["ids"]] * len(qv), "distances": dists.tolist()}
+        for key in ("documents", "metadatas", "embeddings"):
+            extra[key] = [rows[key]] * len(qv) if key in want and rows.get(key) is not None else None
+        return merge([base, extra], len(qv), n_results, include)
@@ -1,23 +1,140 @@
 # utils/embeddings.py
-import chromadb
-from chromadb.utils import embedding_functions
-
-def get_collection(persist_dir: str = "data/chroma", name: str = "calls"):
-    client = chromadb.PersistentClient(path=persist_dir)
-    ef = embedding_functions.DefaultEmbeddingFunction()  # no external API needed
-    coll = client.get_or_create_collection(
-        name=name,
-        embedding_function=ef,
-        metadata={"hnsw:space": "cosine"},
-    )
-    return coll
-
-def upsert_chunks(coll, chunks: list[dict]) -> int:
+# chromadb is imported inside the functions: it costs ~1s, and commands that
+# never touch the vector store shouldn't pay for it.
+import json, os
+
+from config import (
+    DEDUP, DEDUP_BANDS, DEDUP_FILE, DEDUP_PERMS, DEDUP_THRESHOLD, FLAT_DTYPE, HNSW_SETTINGS_FILE, SHARD_CACHE_BYTES,
+    SHARD_MAX_OPEN, SHARD_WORKERS, VECTOR_BACKEND, VECTOR_SHARDS,
+)
+from utils import trace
+
+def get_embedding_function():
+    with trace.span("embeddings.model_init"):
+        from chromadb.utils import embedding_functions
+        return embedding_functions.DefaultEmbeddingFunction()  # no external API needed
+
+def get_collection(persist_dir: str = "data/chroma", name: str = "calls", embedding_function=None, embed: bool = True,
+                   backend: str = "", shards: int = 0, dedup: bool | None = None):
+    """
+    Open (or create) the persistent collection.
+    embed=False opens it without an embedding function — enough for get/delete/count
+    and metadata scans, and skips the embedding model entirely.
+    backend: "chroma" (HNSW) or "flat" (utils.flatindex, exact search over mmap'd
+    vectors under <persist_dir>/flat/<name>); defaults to VECTOR_BACKEND.
+    shards: > 1 returns a utils.shards.ShardedCollection over that many collections
+    of `backend`, opened lazily; defaults to VECTOR_SHARDS.
+    dedup: wrap it in a utils.dedup.DedupCollection (near-duplicates stored once, as
+    references in <persist_dir>/DEDUP_FILE); defaults to DEDUP.
+    """
+    if DEDUP if dedup is None else dedup:
+        from utils.dedup import DedupCollection, DedupIndex
+        index = DedupIndex(os.path.join(persist_dir, DEDUP_FILE), num_perm=DEDUP_PERMS, bands=DEDUP_BANDS,
+                           threshold=DEDUP_THRESHOLD)
+        return DedupCollection(get_collection(persist_dir, name, embedding_function, embed, backend, shards, dedup=False),
+                               index)
+    backend = backend or VECTOR_BACKEND
+    shards = shards or VECTOR_SHARDS
+    if backend not in ("chroma", "flat"):
+        raise ValueError(f"backend must be 'chroma' or 'flat', got {backend!r}")
+    if shards > 1:
+        from utils.shards import ShardedCollection
+        ef = (embedding_function or get_embedding_function()) if embed else None
+        return ShardedCollection(
+            lambda shard: get_collection(persist_dir, shard, ef, embed, backend, shards=1, dedup=False),
+            shards, name=name, embedding_function=ef, workers=SHARD_WORKERS, max_open=SHARD_MAX_OPEN,
+            exact_filters=backend == "flat",
+        )
+    if backend == "flat":
+        with trace.span("embeddings.open_collection", embed=embed, backend=backend):
+            from utils.flatindex import FlatCollection
+            ef = (embedding_function or get_embedding_function()) if embed else None
+            return FlatCollection.open(os.path.join(persist_dir, "flat", name), embedding_function=ef,
+                                       dtype=FLAT_DTYPE, name=name)
+    with trace.span("embeddings.open_collection", embed=embed):
+        with trace.span("embeddings.import_chromadb"):
+            from chromadb.errors import NotFoundError
+
+        client = chroma_client(persist_dir)
+        if not embed:
+            try:
+                return client.get_collection(name=name, embedding_function=None)
+            except NotFoundError:
+                pass  # first run: create it normally below
+        ef = embedding_function or get_embedding_function()
+        coll = client.get_or_create_collection(
+            name=name,
+            embedding_function=ef,
+            metadata=hnsw_metadata(persist_dir),  # only used when the collection is created
+        )
+        return coll
+
+def chroma_client(persist_dir: str):
+    import chromadb
+    if SHARD_CACHE_BYTES > 0:  # bound loaded segments (LRU); must be the same for every open in a process
+        from chromadb.config import Settings
+        settings = Settings(chroma_segment_cache_policy="LRU", chroma_memory_limit_bytes=SHARD_CACHE_BYTES)
+        return chromadb.PersistentClient(path=persist_dir, settings=settings)
+    return chromadb.PersistentClient(path=persist_dir)
+
+HNSW_KEYS = ("M", "construction_ef", "search_ef")
+
+def load_hnsw_settings(persist_dir: str) -> dict:
+    """HNSW parameters chosen by `maintain --tune` (<persist_dir>/HNSW_SETTINGS_FILE); {} = Chroma defaults."""
+    try:
+        with open(os.path.join(persist_dir, HNSW_SETTINGS_FILE), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return {k: int(data[k]) for k in HNSW_KEYS if isinstance(data.get(k), int)}
+
+def hnsw_metadata(persist_dir: str) -> dict:
+    """Collection metadata for new Chroma collections: cosine space plus any tuned HNSW parameters."""
+    return {"hnsw:space": "cosine", **{f"hnsw:{k}": v for k, v in load_hnsw_settings(persist_dir).items()}}
+
+def upsert_chunks(coll, chunks: list[dict], embeddings=None) -> int:
+    """Upsert chunks; pass precomputed `embeddings` to skip Chroma's own embedding call."""
     if not chunks:
         return 0
-    coll.upsert(
-        ids=[c["id"] for c in chunks],
-        documents=[c["text"] for c in chunks],
-        metadatas=[c["meta"] for c in chunks],
-    )
+    with trace.span("embeddings.upsert"):
+        coll.upsert(
+            ids=[c["id"] for c in chunks],
+            documents=[c["text"] for c in chunks],
+            metadatas=[c["meta"] for c in chunks],
+            embeddings=embeddings,
+        )
+        trace.count("chunks_upserted", len(chunks))
     return len(chunks)
+
+def delete_chunks(coll, ids) -> int:
+    ids = list(ids)
+    if not ids:
+        return 0
+    with trace.span("embeddings.delete"):
+        coll.delete(ids=ids)
+        trace.count("chunks_deleted", len(ids))
+    return len(ids)
+
+def persist_collection(coll) -> None:
+    """Flush staged writes (flat backend); Chroma collections persist on every call already."""
+    save = getattr(coll, "save", None)
+    if callable(save):
+        with trace.span("embeddings.persist"):
+            save()
+
+def store_layout(backend: str = "", shards: int = 0, dedup: bool | None = None) -> str:
+    """
+    Where get_collection() puts chunks, e.g. "chroma", "flat/4 shards" or "chroma+dedup";
+    ingest re-embeds when it changes.
+    """
+    backend, shards = backend or VECTOR_BACKEND, shards or VECTOR_SHARDS
+    layout = backend if shards <= 1 else f"{backend}/{shards} shards"
+    return layout + ("+dedup" if (DEDUP if dedup is None else dedup) else "")
+
+def store_collections(backend: str = "", shards: int = 0, name: str = "calls") -> list[tuple[str, str]]:
+    """(backend, collection name) pairs the current layout reads and writes."""
+    backend, shards = backend or VECTOR_BACKEND, shards or VECTOR_SHARDS
+    if shards <= 1:
+        return [(backend, name)]
+    from utils.shards import shard_names
+    return [(backend, n) for n in shard_names(name, shards)]
@@ -0,0 +1,461 @@
+# utils/flatindex.py
+"""
+Exact (brute-force) vector store with memory-mapped, quantized embeddings.
+
+A drop-in for the subset of the Chroma Collection API this repo uses
+(query/get/upsert/delete/count), so search(), list_call_ids(), ingest and the
+server work unchanged. Pick it with VECTOR_BACKEND=flat (see get_collection).
+
+Layout (one directory):
+  vectors.f16 | vectors.i8   raw row-major (n, dim) matrix, unit-normalized, append-only
+  scales.npy                 int8 only: per-row float32 scale (q * scale is unit length)
+  call.npy / flags.npy / live.npy   per-row columns: call index, FLAG_FIELDS bitmask, tombstone
+  rows.jsonl + row_offsets.npy      one {"id","doc","meta"} line per row; only hits are decoded
+  ids.txt                    newline-separated ids (read on the first get/upsert/delete by id)
+  meta.json                  dim, dtype, row count, call names; written last on save()
+
+Everything is opened with mmap, so opening is O(1) in the collection size and
+processes serving the same directory share the page cache. Queries are one
+matmul per block of rows plus argpartition, over the rows left after a
+boolean pre-filter on call_id / mentions_* (other metadata keys fall back to
+decoding the rows). Scores are exact cosine on the stored (quantized) vectors.
+
+Writes are staged in memory until save(): new rows are appended to the files,
+the small columns are rewritten, and meta.json goes last, so readers see the
+old or the new row count, never a torn row. Deletes are tombstones until more
+than a quarter of the rows are dead, then save() compacts.
+"""
+import json, mmap, os, pathlib, threading
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from utils.ingestion import FLAG_FIELDS
+
+DTYPES = {"float16": np.float16, "int8": np.int8}
+# Rows scored per matmul (bounds the float32 scratch copy of the quantized block)
+BLOCK_ROWS = 16384
+
+class FlatCollection:
+    exact_filters = True  # where filters are applied before scoring (see utils.planner)
+
+    def __init__(self, path: str, embedding_function=None, dtype: str = "float16", name: str = "calls"):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {tuple(DTYPES)}, got {dtype!r}")
+        self.path = path
+        self.name = name
+        self._embedding_function = embedding_function
+        self.dtype = dtype
+        self.flag_fields = FLAG_FIELDS
+        self.dim = 0
+        self.calls: List[str] = []
+        self.call_pos: Dict[str, int] = {}
+        self.vecs = np.zeros((0, 0), dtype=DTYPES[dtype])
+        self.scales = np.zeros(0, dtype=np.float32)
+        self.call = np.zeros(0, dtype=np.int32)
+        self.flags = np.zeros(0, dtype=np.uint32)
+        self.live = np.zeros(0, dtype=bool)
+        self.row_offsets = np.zeros(1, dtype=np.int64)
+        self._ids: List[str] | None = []
+        self._id_pos: Dict[str, int] | None = {}
+        self._rows_mm: mmap.mmap | None = None
+        self._saved = 0                       # rows [0, _saved) are on disk
+        self._mem_rows: List[tuple] = []      # (id, doc, meta) for rows >= _saved
+        self._pending: List[tuple] = []       # (id, doc, meta, vector) not merged into the arrays yet
+        self._ids_bytes = 0
+        self._metas: List[dict] | None = None  # decoded metadata, only for filters on other keys
+        self._loaded_mtime = 0.0
+        self._lock = threading.RLock()
+        self.dirty = False
+
+    # -------------------- persistence --------------------
+
+    @property
+    def _vec_path(self) -> pathlib.Path:
+        return pathlib.Path(self.path) / ("vectors.f16" if self.dtype == "float16" else "vectors.i8")
+
+    @classmethod
+    def open(cls, path: str, embedding_function=None, dtype: str = "float16", name: str = "calls") -> "FlatCollection":
+        """Open the store at `path` (an empty one if it doesn't exist yet; `dtype` only applies then)."""
+        meta_path = pathlib.Path(path) / "meta.json"
+        if meta_path.exists():
+            with open(meta_path, "r", encoding="utf-8") as f:
+                dtype = json.load(f)["dtype"]
+        coll = cls(path, embedding_function=embedding_function, dtype=dtype, name=name)
+        coll._load()
+        return coll
+
+    def _load(self) -> None:
+        d = pathlib.Path(self.path)
+        meta_path = d / "meta.json"
+        if not meta_path.exists():
+            return
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        n = int(meta["n"])
+        self.dim = int(meta["dim"])
+        self.flag_fields = tuple(meta["flag_fields"])
+        self.calls = meta["calls"]
+        self.call_pos = {c: i for i, c in enumerate(self.calls)}
+        self._ids_bytes = int(meta["ids_bytes"])
+        # the files may hold rows past n from an interrupted save; the columns bound what is visible
+        self.vecs = (np.memmap(self._vec_path, dtype=DTYPES[self.dtype], mode="r", shape=(n, self.dim))
+                     if n else np.zeros((0, self.dim), dtype=DTYPES[self.dtype]))
+        self.scales = np.load(d / "scales.npy", mmap_mode="r") if self.dtype == "int8" else np.zeros(0, np.float32)
+        self.call = np.load(d / "call.npy", mmap_mode="r")
+        self.flags = np.load(d / "flags.npy", mmap_mode="r")
+        self.row_offsets = np.load(d / "row_offsets.npy", mmap_mode="r")
+        self.live = np.array(np.load(d / "live.npy"))  # tombstoning writes into it
+        if self._rows_mm is not None:
+            self._rows_mm.close()
+        self._rows_mm = None
+        if n:
+            with open(d / "rows.jsonl", "rb") as f:
+                self._rows_mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._saved = n
+        self._mem_rows = []
+        self._ids = self._id_pos = None
+        self._metas = None
+        self._loaded_mtime = meta_path.stat().st_mtime
+        self.dirty = False
+
+    def _reload_if_changed(self) -> None:
+        """Pick up a save() from another process (cheap stat; skipped while we have unsaved writes)."""
+        if self.dirty:
+            return
+        try:
+            mtime = (pathlib.Path(self.path) / "meta.json").stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime > self._loaded_mtime:
+            self._load()
+
+    def save(self, compact: bool = False) -> None:
+        """
+        Append new rows to disk, rewrite the columns, then meta.json; compacts past 25%
+        tombstones, or past none with compact=True (`maintain`).
+        """
+        with self._lock:
+            self._commit()
+            dead = np.count_nonzero(~self.live)
+            if not self.dirty and not (compact and dead):
+                return
+            n = len(self.live)
+            if n and dead > (0 if compact else 0.25 * n):
+                self._compact()
+                n = len(self.live)
+            d = pathlib.Path(self.path)
+            d.mkdir(parents=True, exist_ok=True)
+            rewrite = self._saved == 0
+            if n > self._saved or rewrite:
+                new = range(self._saved, n)
+                offs = [int(self.row_offsets[self._saved])] if self._saved else [0]
+                lines = []
+                for i in new:
+                    cid, doc, meta = self._mem_rows[i - self._saved]
+                    line = (json.dumps({"id": cid, "doc": doc, "meta": meta}, ensure_ascii=False) + "\n").encode("utf-8")
+                    lines.append(line)
+                    offs.append(offs[-1] + len(line))
+                ids_blob = "".join(self._mem_rows[i - self._saved][0] + "\n" for i in new).encode("utf-8")
+                _append(d / "rows.jsonl", offs[0], b"".join(lines), rewrite)
+                _append(d / "ids.txt", self._ids_bytes, ids_blob, rewrite)
+                _append(self._vec_path, self._saved * self.dim * self.vecs.itemsize,
+                        np.ascontiguousarray(self.vecs[self._saved:n]).tobytes(), rewrite)
+                self._ids_bytes += len(ids_blob)
+                self.row_offsets = np.concatenate([np.asarray(self.row_offsets[:self._saved + 1] if self._saved else [0]),
+                                                   np.asarray(offs[1:], dtype=np.int64)]).astype(np.int64)
+            cols = {"call": self.call, "flags": self.flags, "live": self.live, "row_offsets": self.row_offsets}
+            if self.dtype == "int8":
+                cols["scales"] = self.scales
+            for col, arr in cols.items():
+                tmp = d / f"{col}.tmp.npy"
+                np.save(tmp, np.asarray(arr))
+                os.replace(tmp, d / f"{col}.npy")
+            meta = {"version": 1, "dim": self.dim, "dtype": self.dtype, "n": n, "ids_bytes": self._ids_bytes,
+                    "flag_fields": list(self.flag_fields), "calls": self.calls}
+            tmp = d / "meta.json.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp, d / "meta.json")
+            ids, id_pos = self._ids, self._id_pos
+            self._load()  # swap the in-memory copies for maps of what was just written
+            self._ids, self._id_pos = ids, id_pos
+
+    def _compact(self) -> None:
+        """Drop tombstoned rows; the next save rewrites every file from scratch."""
+        keep = np.flatnonzero(self.live)
+        rows = [self._row(int(i)) for i in keep]
+        self.vecs = np.asarray(self.vecs[keep])
+        if self.dtype == "int8":
+            self.scales = np.asarray(self.scales[keep])
+        self.call = np.asarray(self.call[keep])
+        self.flags = np.asarray(self.flags[keep])
+        self.live = np.ones(len(keep), dtype=bool)
+        self.row_offsets = np.zeros(1, dtype=np.int64)
+        self._saved = 0
+        self._ids_bytes = 0
+        self._mem_rows = rows
+        self._ids = [r[0] for r in rows]
+        self._id_pos = {cid: i for i, cid in enumerate(self._ids)}
+        self._metas = None
+
+    # -------------------- rows --------------------
+
+    def _row(self, i: int) -> tuple:
+        if i >= self._saved:
+            return self._mem_rows[i - self._saved]
+        s, e = int(self.row_offsets[i]), int(self.row_offsets[i + 1])
+        r = json.loads(self._rows_mm[s:e])
+        return r["id"], r["doc"], r["meta"]
+
+    def _id_map(self) -> Dict[str, int]:
+        if self._id_pos is None:
+            ids: List[str] = []
+            if self._ids_bytes:
+                with open(pathlib.Path(self.path) / "ids.txt", "rb") as f:
+                    ids = f.read(self._ids_bytes).decode("utf-8").split("\n")[:-1]
+            ids += [r[0] for r in self._mem_rows]
+            self._ids = ids
+            # later rows win: an id re-added after a tombstone points at its newest row
+            self._id_pos = {cid: i for i, cid in enumerate(ids) if self.live[i]}
+        return self._id_pos
+
+    # -------------------- updates --------------------
+
+    def count(self) -> int:
+        with self._lock:
+            self._reload_if_changed()
+            return int(np.count_nonzero(self.live)) + len(self._pending)
+
+    def upsert(self, ids: Sequence[str], documents: Sequence[str] | None = None,
+               metadatas: Sequence[dict] | None = None, embeddings=None, **_) -> None:
+        ids = list(ids)
+        documents = list(documents) if documents is not None else [""] * len(ids)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in ids]
+        if embeddings is None:
+            if self._embedding_function is None:
+                raise ValueError("upsert without embeddings needs an embedding_function")
+            embeddings = self._embedding_function(documents)
+        vecs = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        with self._lock:
+            self._reload_if_changed()
+            if not self.dim:
+                self.dim = vecs.shape[1]
+                self.vecs = np.zeros((0, self.dim), dtype=DTYPES[self.dtype])
+            if vecs.shape[1] != self.dim:
+                raise ValueError(f"embedding dimension {vecs.shape[1]} != collection dimension {self.dim}")
+            self.delete(ids=ids)
+            last = {cid: j for j, cid in enumerate(ids)}  # repeated ids in one call: the last one wins
+            for j, (cid, doc, meta, v) in enumerate(zip(ids, documents, metadatas, vecs)):
+                if last[cid] == j:
+                    self._pending.append((cid, doc, dict(meta or {}), v))
+            self.dirty = True
+
+    def delete(self, ids: Sequence[str] | None = None, where: Dict[str, Any] | None = None, **_) -> None:
+        with self._lock:
+            self._reload_if_changed()
+            drop = set(ids or ())
+            if where:
+                drop |= {self._row(int(i))[0] for i in np.flatnonzero(self._mask(where))}
+            if not drop:
+                return
+            self._pending = [p for p in self._pending if p[0] not in drop]
+            pos = self._id_map()
+            for cid in drop:
+                i = pos.pop(cid, None)
+                if i is not None:
+                    self.live[i] = False
+                    self.dirty = True
+
+    def _commit(self) -> None:
+        """Merge pending upserts into the arrays (quantized) and the in-memory rows."""
+        if not self._pending:
+            return
+        pend, self._pending = self._pending, []
+        v = np.stack([p[3] for p in pend]).astype(np.float32)
+        v /= np.maximum(np.linalg.norm(v, axis=1, keepdims=True), 1e-12)
+        if self.dtype == "int8":
+            q = np.round(v * (127.0 / np.maximum(np.abs(v).max(axis=1, keepdims=True), 1e-12))).astype(np.int8)
+            scale = 1.0 / np.maximum(np.linalg.norm(q.astype(np.float32), axis=1), 1e-12)
+            self.scales = np.concatenate([np.asarray(self.scales), scale.astype(np.float32)])
+        else:
+            q = v.astype(np.float16)
+        start = len(self.live)
+        self.vecs = np.concatenate([np.asarray(self.vecs), q])
+        calls = []
+        for _, _, meta, _ in pend:
+            c = str(meta.get("call_id", ""))
+            if c not in self.call_pos:
+                self.call_pos[c] = len(self.calls)
+                self.calls.append(c)
+            calls.append(self.call_pos[c])
+        self.call = np.concatenate([np.asarray(self.call), np.array(calls, dtype=np.int32)])
+        bits = [sum(1 << i for i, f in enumerate(self.flag_fields) if meta.get(f)) for _, _, meta, _ in pend]
+        self.flags = np.concatenate([np.asarray(self.flags), np.array(bits, dtype=np.uint32)])
+        self.live = np.concatenate([self.live, np.ones(len(pend), dtype=bool)])
+        self._mem_rows.extend((cid, doc, meta) for cid, doc, meta, _ in pend)
+        if self._id_pos is not None:
+            for j, (cid, *_rest) in enumerate(pend):
+                self._ids.append(cid)
+                self._id_pos[cid] = start + j
+        if self._metas is not None:
+            self._metas.extend(meta for _, _, meta, _ in pend)
+
+    # -------------------- filters --------------------
+
+    def _mask(self, where: Dict[str, Any] | None) -> np.ndarray:
+        """Live rows matching a Chroma-style filter ($and/$or, $eq/$ne/$in/$nin/$gt/$gte/$lt/$lte)."""
+        self._commit()
+        mask = self.live.copy()
+        if where:
+            mask &= self._clause(where)
+        return mask
+
+    def _clause(self, where: Dict[str, Any]) -> np.ndarray:
+        n = len(self.live)
+        out = np.ones(n, dtype=bool)
+        for key, val in where.items():
+            if key == "$and":
+                for sub in val:
+                    out &= self._clause(sub)
+            elif key == "$or":
+                any_ = np.zeros(n, dtype=bool)
+                for sub in val:
+                    any_ |= self._clause(sub)
+                out &= any_
+            else:
+                op, arg = next(iter(val.items())) if isinstance(val, dict) else ("$eq", val)
+                out &= self._field(key, op, arg)
+        return out
+
+    def _field(self, key: str, op: str, arg) -> np.ndarray:
+        if key == "call_id" and op in ("$eq", "$ne", "$in", "$nin"):
+            wanted = [arg] if op in ("$eq", "$ne") else list(arg)
+            codes = [self.call_pos[c] for c in wanted if c in self.call_pos]
+            hit = np.isin(self.call, codes)
+            return hit if op in ("$eq", "$in") else ~hit
+        if key in self.flag_fields and op in ("$eq", "$ne") and isinstance(arg, bool):
+            has = (self.flags & np.uint32(1 << self.flag_fields.index(key))) != 0
+            return has if (op == "$eq") == arg else ~has
+        # any other key: decode the metadata once and evaluate in Python
+        if self._metas is None:
+            self._metas = [self._row(i)[2] for i in range(len(self.live))]
+        test = _OPS.get(op)
+        if test is None:
+            raise ValueError(f"unsupported filter operator {op!r}")
+        return np.fromiter((key in m and test(m[key], arg) for m in self._metas), dtype=bool, count=len(self._metas))
+
+    def call_ids(self) -> List[str]:
+        """Distinct call_ids with at least one live chunk (from the call column, no row decoding)."""
+        with self._lock:
+            self._reload_if_changed()
+            self._commit()
+            return sorted(self.calls[i] for i in np.unique(np.asarray(self.call)[self.live]) if self.calls[i])
+
+    # -------------------- query --------------------
+
+    def _dequantize(self, rows: np.ndarray) -> np.ndarray:
+        block = np.asarray(self.vecs[rows], dtype=np.float32)
+        if self.dtype == "int8":
+            block *= np.asarray(self.scales[rows])[:, None]
+        return block
+
+    def _scores(self, qv: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Cosine scores (m, len(rows)); contiguous blocks when most rows match, gathered blocks otherwise."""
+        out = np.empty((len(qv), len(rows)), dtype=np.float32)
+        dense = len(rows) > len(self.live) // 2
+        for s in range(0, len(rows), BLOCK_ROWS):
+            part = rows[s:s + BLOCK_ROWS]
+            if dense and part[-1] - part[0] + 1 == len(part):
+                idx = slice(int(part[0]), int(part[-1]) + 1)  # mmap slice: no gather copy
+            else:
+                idx = part
+            out[:, s:s + len(part)] = qv @ self._dequantize(idx).T
+        return out
+
+    def query(self, query_texts: Sequence[str] | None = None, query_embeddings=None, n_results: int = 10,
+              where: Dict[str, Any] | None = None, include: Sequence[str] = ("documents", "metadatas", "distances"),
+              **_) -> Dict[str, Any]:
+        if query_embeddings is None:
+            if self._embedding_function is None:
+                raise ValueError("query_texts needs an embedding_function (open with embed=True)")
+            query_embeddings = self._embedding_function(list(query_texts or []))
+        qv = np.asarray(query_embeddings, dtype=np.float32)
+        qv = qv.reshape(len(qv), -1)
+        qv /= np.maximum(np.linalg.norm(qv, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            self._reload_if_changed()
+            rows = np.flatnonzero(self._mask(where))
+            res: Dict[str, Any] = {"ids": [], "distances": [], "documents": [], "metadatas": [], "embeddings": None}
+            if not len(rows) or n_results <= 0:
+                for _ in range(len(qv)):
+                    for key in ("ids", "distances", "documents", "metadatas"):
+                        res[key].append([])
+                return _trim(res, include)
+            scores = self._scores(qv, rows)
+            k = min(n_results, len(rows))
+            for r in range(len(qv)):
+                top = np.argpartition(-scores[r], k - 1)[:k] if len(rows) > k else np.arange(len(rows))
+                top = top[np.argsort(-scores[r, top], kind="stable")]
+                got = [self._row(int(rows[t])) for t in top]
+                res["ids"].append([g[0] for g in got])
+                res["documents"].append([g[1] for g in got])
+                res["metadatas"].append([g[2] for g in got])
+                res["distances"].append([float(1.0 - scores[r, t]) for t in top])
+            if "embeddings" in include:
+                res["embeddings"] = [self._vectors_for(ids) for ids in res["ids"]]
+            return _trim(res, include)
+
+    def get(self, ids: Sequence[str] | None = None, where: Dict[str, Any] | None = None, limit: int | None = None,
+            offset: int | None = None, include: Sequence[str] = ("documents", "metadatas"), **_) -> Dict[str, Any]:
+        with self._lock:
+            self._reload_if_changed()
+            mask = self._mask(where)
+            if ids is not None:
+                pos = self._id_map()
+                rows = [pos[c] for c in ids if c in pos and mask[pos[c]]]
+            else:
+                rows = np.flatnonzero(mask).tolist()
+            rows = rows[offset or 0:]
+            if limit is not None:
+                rows = rows[:limit]
+            got = [self._row(i) for i in rows]
+            res = {"ids": [g[0] for g in got], "documents": [g[1] for g in got],
+                   "metadatas": [g[2] for g in got], "embeddings": None}
+            if "embeddings" in include:
+                res["embeddings"] = list(self._dequantize(np.asarray(rows, dtype=np.int64))) if rows else []
+            return _trim(res, include)
+
+    def _vectors_for(self, ids: List[str]) -> list:
+        pos = self._id_map()
+        return list(self._dequantize(np.asarray([pos[c] for c in ids], dtype=np.int64)))
+
+_OPS = {
+    "$eq": lambda a, b: a == b,
+    "$ne": lambda a, b: a != b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+}
+
+def _trim(res: Dict[str, Any], include: Sequence[str]) -> Dict[str, Any]:
+    for key in ("documents", "metadatas", "distances"):
+        if key in res and key not in include:
+            res[key] = None
+    return res
+
+def _append(path: pathlib.Path, at: int, data: bytes, rewrite: bool) -> None:
+    """Write `data` at byte `at`, dropping anything after it (left over from an interrupted save)."""
+    if rewrite:
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return
+    with open(path, "r+b" if path.exists() else "wb") as f:
+        f.seek(at)
+        f.truncate()
+        f.write(data)
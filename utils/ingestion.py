@@ -1,91 +1,164 @@
-import re, uuid, pathlib
+import re, hashlib, pathlib
 from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+from config import TAGS_FILE
+from utils import trace
+from utils.tagging import load_tagger
 
 # Matches: [MM:SS] Speaker: text...
 LINE_RE = re.compile(r"^\[(?P<ts>\d{2}:\d{2})\]\s*(?P<speaker>[^:]+):\s*(?P<text>.+)$")
 
-# Light keyword flags you can filter on later
-PRICING_RE   = re.compile(r"(₹|\bprice|pricing|discount|overage|minute|SKU|TCV|ARR|seat)", re.I)
-SECURITY_RE  = re.compile(r"(SOC|ISO|pen-?test|DPA|GDPR|DPDPA|KMS|encrypt|SSO|SAML|OIDC|SCIM|retention)", re.I)
-COMP_RE      = re.compile(r"(Competitor\s+[A-Z]|Brightcall|battle-?card)", re.I)
+# Keyword tags you can filter on later (tags.toml; one regex pass per line, see utils/tagging.py)
+TAGGER = load_tagger(TAGS_FILE)
+
+# Flag bit order; chunk metadata expands the bitmask back into these scalar fields
+FLAG_FIELDS = TAGGER.fields
 
-@dataclass
+@dataclass(slots=True)
 class Segment:
-    id: str
+    """One transcript line. Slotted, with flags packed into an int bitmask (see FLAG_FIELDS)."""
     call_id: str
     idx: int
     timestamp: str
     speaker: str
     text: str
-    flags: dict
+    flags: int = 0
 
-def _flags_for(t: str) -> dict:
-    return {
-        "mentions_pricing":    bool(PRICING_RE.search(t)),
-        "mentions_security":   bool(SECURITY_RE.search(t)),
-        "mentions_competitor": bool(COMP_RE.search(t)),
-    }
+    @property
+    def id(self) -> str:
+        return f"{self.call_id}:{self.idx}"
 
-def parse_file(path: str) -> list[Segment]:
-    """Parse a transcript .txt into structured segments."""
-    call_id = pathlib.Path(path).stem.replace(" ", "_")
-    segs, i = [], 0
+    def flag(self, name: str) -> bool:
+        return bool(self.flags & (1 << FLAG_FIELDS.index(name)))
+
+def call_id_for(path: str) -> str:
+    return pathlib.Path(path).stem.replace(" ", "_")
+
+def chunk_id(call_id: str, seg_start: int, seg_end: int, text: str) -> str:
+    """
+    Content-addressed chunk ID: call_id + segment range + a hash of the text.
+    Re-ingesting an unchanged transcript yields the same IDs, so upserts are
+    idempotent and only edited chunks get new IDs.
+    """
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+    return f"{call_id}:{seg_start}-{seg_end}:{digest}"
+
+def flags_meta(bits: int) -> dict:
+    return TAGGER.meta(bits)
+
+def _segment(call_id: str, idx: int, raw: str) -> Segment | None:
+    ln = raw.strip()
+    if not ln:
+        return None
+    m = LINE_RE.match(ln)
+    if not m:
+        return None
+    return Segment(
+        call_id=call_id,
+        idx=idx,
+        timestamp=m["ts"].strip(),
+        speaker=m["speaker"].strip(),
+        text=m["text"].strip(),
+        flags=TAGGER.bits(m["text"]),
+    )
+
+def iter_segments(path: str) -> Iterator[Segment]:
+    """Stream a transcript .txt as segments, one line at a time (memory independent of file size)."""
+    call_id = call_id_for(path)
+    i = 0
     with open(path, "r", encoding="utf-8") as f:
         for raw in f:
-            ln = raw.strip()
-            if not ln:
-                continue
-            m = LINE_RE.match(ln)
-            if not m:
-                continue
-            segs.append(Segment(
-                id=str(uuid.uuid4()),
-                call_id=call_id,
-                idx=i,
-                timestamp=m["ts"].strip(),
-                speaker=m["speaker"].strip(),
-                text=m["text"].strip(),
-                flags=_flags_for(m["text"])
-            ))
-            i += 1
-    return segs
-
-def chunk_segments(segs: list[Segment], max_chars: int = 1500) -> list[dict]:
+            seg = _segment(call_id, i, raw)
+            if seg is not None:
+                yield seg
+                i += 1
+    trace.count("segments_parsed", i)
+
+def read_segments_from(path: str, offset: int = 0, start_idx: int = 0,
+                       final: bool = False) -> tuple[list[Segment], list[int], int]:
     """
-    Coalesce adjacent segments into ~max_chars chunks.
-    Returns a list of {id, text, meta} dicts ready for the vector DB.
-    Note: Chroma metadata values must be scalar (str/int/float/bool/None).
+    Segments of the complete lines from byte `offset` on, numbered from `start_idx`.
+    Returns (segments, byte offset where each segment's line starts, offset after
+    the last complete line). A trailing line without a newline may still be being
+    written, so it is left for the next read unless final=True.
+    """
+    call_id = call_id_for(path)
+    segs: list[Segment] = []
+    starts: list[int] = []
+    pos = offset
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b"\n") and not final:
+                break
+            seg = _segment(call_id, start_idx + len(segs), raw.decode("utf-8"))
+            if seg is not None:
+                segs.append(seg)
+                starts.append(pos)
+            pos += len(raw)
+    trace.count("segments_parsed", len(segs))
+    return segs, starts, pos
+
+def parse_file(path: str) -> list[Segment]:
+    """Parse a transcript .txt into structured segments."""
+    with trace.span("ingestion.parse_file"):
+        return list(iter_segments(path))
+
+def iter_chunks(segs: Iterable[Segment], max_chars: int = 1500, minhash=None) -> Iterator[dict]:
     """
-    chunks, buf, metas, size = [], [], [], 0
+    Coalesce adjacent segments into ~max_chars chunks, yielding each chunk as soon as it fills.
+    Only the chunk under construction is held in memory.
+    With a utils.dedup.MinHasher as `minhash`, each chunk also carries its "sig"
+    (near-duplicate detection; computed here so it runs in the parse workers).
+    """
+    buf: list[str] = []
+    first = last = None
+    bits = size = 0
 
-    def flush():
-        nonlocal buf, metas, size
-        if not buf:
-            return
+    def make() -> dict:
+        text = "\n".join(buf)
         # IMPORTANT: metadata only has scalar values (no lists)
-        chunks.append({
-            "id": str(uuid.uuid4()),
-            "text": "\n".join(buf),
+        chunk = {
+            "id": chunk_id(first.call_id, first.idx, last.idx, text),
+            "text": text,
             "meta": {
-                "call_id": metas[0].call_id,
-                "start_ts": metas[0].timestamp,
-                "end_ts": metas[-1].timestamp,
-                "seg_start_idx": metas[0].idx,   # int (OK for Chroma)
-                "seg_end_idx": metas[-1].idx,    # int (OK for Chroma)
-                "mentions_pricing":    any(m.flags["mentions_pricing"] for m in metas),
-                "mentions_security":   any(m.flags["mentions_security"] for m in metas),
-                "mentions_competitor": any(m.flags["mentions_competitor"] for m in metas),
-            }
-        })
-        buf.clear(); metas.clear(); size = 0
+                "call_id": first.call_id,
+                "start_ts": first.timestamp,
+                "end_ts": last.timestamp,
+                "seg_start_idx": first.idx,   # int (OK for Chroma)
+                "seg_end_idx": last.idx,      # int (OK for Chroma)
+                "flags": bits,                # tag bitmask (TAGGER.names order)
+                **flags_meta(bits),
+            },
+        }
+        if minhash is not None:
+            chunk["sig"] = minhash.signature(text)
+        return chunk
 
     for s in segs:
         piece = f"[{s.timestamp}] {s.speaker}: {s.text}"
         if size and size + len(piece) > max_chars:
-            flush()
+            yield make()
+            buf.clear(); bits = size = 0
+            first = None
+        if first is None:
+            first = s
         buf.append(piece)
-        metas.append(s)
+        last = s
+        bits |= s.flags
         size += len(piece)
 
-    flush()
-    return chunks
+    if buf:
+        yield make()
+
+def chunk_segments(segs: Iterable[Segment], max_chars: int = 1500) -> list[dict]:
+    """
+    Coalesce adjacent segments into ~max_chars chunks.
+    Returns a list of {id, text, meta} dicts ready for the vector DB.
+    Note: Chroma metadata values must be scalar (str/int/float/bool/None).
+    """
+    with trace.span("ingestion.chunk"):
+        chunks = list(iter_chunks(segs, max_chars=max_chars))
+        trace.count("chunks_built", len(chunks))
+        return chunks
@@ -0,0 +1,294 @@
+# utils/lexical.py
+"""
+BM25 lexical index kept next to the Chroma collection.
+
+Catches what embeddings blur: SKU names, "SOC 2", "DPDPA", competitor names, ₹ figures.
+
+Layout (CSR, one directory of .npy files + meta.json):
+  offsets[t]..offsets[t+1]  → slice of post_docs / post_tfs for term t
+  doc_len / doc_call / doc_flags / live  → per-document columns
+Adds are merged into the CSR arrays with one vectorized sort; deletes are
+tombstones (live=False) until more than a quarter of the docs are dead,
+then the arrays are compacted.
+"""
+import json, math, os, pathlib, re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from utils.ingestion import FLAG_FIELDS
+
+# Words, numbers (thousands separators dropped: "₹2,000" → "₹", "2000"), and ₹ on its own
+TOKEN_RE = re.compile(r"₹|\d+(?:[.,]\d+)*|[^\W\d_]+(?:[-'][^\W\d_]+)*", re.UNICODE)
+
+K1 = 1.2
+B = 0.75
+
+def tokenize(text: str) -> List[str]:
+    out = []
+    for tok in TOKEN_RE.findall(text.lower()):
+        if tok[0].isdigit():
+            tok = tok.replace(",", "")
+        out.append(tok)
+    return out
+
+class LexicalIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self.flag_fields: Tuple[str, ...] = FLAG_FIELDS
+        self.ids: List[str] = []
+        self.id_pos: Dict[str, int] = {}
+        self.calls: List[str] = []
+        self.call_pos: Dict[str, int] = {}
+        self.terms: List[str] = []
+        self.vocab: Dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.post_docs = np.zeros(0, dtype=np.int32)
+        self.post_tfs = np.zeros(0, dtype=np.uint16)
+        self.doc_len = np.zeros(0, dtype=np.uint32)
+        self.doc_call = np.zeros(0, dtype=np.int32)
+        self.doc_flags = np.zeros(0, dtype=np.uint32)
+        self.live = np.zeros(0, dtype=bool)
+        self.live_len = 0
+        # (term_ids, tfs, doc, length, call_pos, flag_bits) per doc not yet merged into the CSR
+        self._pending: List[Tuple[np.ndarray, np.ndarray, int, int, int, int]] = []
+        self._loaded_mtime = 0.0
+        self.dirty = False
+
+    # -------------------- persistence --------------------
+
+    _ARRAYS = ("offsets", "post_docs", "post_tfs", "doc_len", "doc_call", "doc_flags", "live")
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        """Open the index at `path` (an empty one if it doesn't exist yet)."""
+        idx = cls(path)
+        meta_path = pathlib.Path(path) / "meta.json"
+        if not meta_path.exists():
+            return idx
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        idx.flag_fields = tuple(meta["flag_fields"])
+        idx.ids = meta["ids"]
+        idx.calls = meta["calls"]
+        idx.terms = meta["terms"]
+        idx.live_len = int(meta["live_len"])
+        idx.id_pos = {cid: i for i, cid in enumerate(idx.ids)}
+        idx.call_pos = {c: i for i, c in enumerate(idx.calls)}
+        idx.vocab = {t: i for i, t in enumerate(idx.terms)}
+        for name in cls._ARRAYS:
+            # postings are read-only until the next add/compact, so map them instead of reading
+            setattr(idx, name, np.load(pathlib.Path(path) / f"{name}.npy", mmap_mode="r"))
+        idx.live = np.array(idx.live)  # tombstoning writes into it
+        idx._loaded_mtime = meta_path.stat().st_mtime
+        return idx
+
+    def save(self) -> None:
+        self._commit()
+        d = pathlib.Path(self.path)
+        d.mkdir(parents=True, exist_ok=True)
+        for name in self._ARRAYS:
+            tmp = d / f"{name}.tmp.npy"
+            np.save(tmp, np.asarray(getattr(self, name)))
+            os.replace(tmp, d / f"{name}.npy")
+        meta = {
+            "flag_fields": list(self.flag_fields),
+            "ids": self.ids,
+            "calls": self.calls,
+            "terms": self.terms,
+            "live_len": self.live_len,
+        }
+        tmp = d / "meta.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, d / "meta.json")  # meta.json last: readers see old or new, never mixed
+        self._loaded_mtime = (d / "meta.json").stat().st_mtime
+        self.dirty = False
+
+    def refresh(self) -> "LexicalIndex":
+        """Return a reloaded index if another process saved a newer one (cheap stat otherwise)."""
+        try:
+            mtime = (pathlib.Path(self.path) / "meta.json").stat().st_mtime
+        except FileNotFoundError:
+            return self
+        return LexicalIndex.load(self.path) if mtime > self._loaded_mtime else self
+
+    # -------------------- updates --------------------
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.live)) + len(self._pending)
+
+    def add(self, chunks: Iterable[Dict[str, Any]]) -> int:
+        """Index chunks ({id, text, meta}); re-adding an existing id replaces it."""
+        n = 0
+        for c in chunks:
+            if c["id"] in self.id_pos:
+                self.remove([c["id"]])
+            counts = Counter(tokenize(c["text"]))
+            tids = np.fromiter((self._term_id(t) for t in counts), dtype=np.int64, count=len(counts))
+            tfs = np.fromiter(counts.values(), dtype=np.int64, count=len(counts)).clip(max=65535).astype(np.uint16)
+            meta = c.get("meta") or {}
+            cid = meta.get("call_id", "")
+            if cid not in self.call_pos:
+                self.call_pos[cid] = len(self.calls)
+                self.calls.append(cid)
+            bits = sum(1 << i for i, f in enumerate(self.flag_fields) if meta.get(f))
+            length = int(tfs.sum(dtype=np.int64))
+            doc = len(self.ids)
+            self.ids.append(c["id"])
+            self.id_pos[c["id"]] = doc
+            self.live_len += length
+            self._pending.append((tids, tfs, doc, length, self.call_pos[cid], bits))
+            n += 1
+        self.dirty = self.dirty or n > 0
+        return n
+
+    def remove(self, ids: Iterable[str]) -> int:
+        n = 0
+        for cid in ids:
+            doc = self.id_pos.pop(cid, None)
+            if doc is None:
+                continue
+            if doc >= len(self.live):
+                self._commit()  # doc is still pending (added twice in one batch)
+            if not self.live[doc]:
+                continue
+            self.live[doc] = False
+            self.live_len -= int(self.doc_len[doc])
+            n += 1
+        if n:
+            self.dirty = True
+            if np.count_nonzero(~self.live) > 0.25 * len(self.live):
+                self._compact()
+        return n
+
+    def _term_id(self, t: str) -> int:
+        tid = self.vocab.get(t)
+        if tid is None:
+            tid = self.vocab[t] = len(self.terms)
+            self.terms.append(t)
+        return tid
+
+    def _commit(self) -> None:
+        """Merge pending docs into the CSR arrays (one stable sort by term id)."""
+        if not self._pending:
+            return
+        pend = self._pending
+        self._pending = []
+        n_terms = len(self.terms)
+        old_terms = np.repeat(np.arange(len(self.offsets) - 1, dtype=np.int64), np.diff(self.offsets))
+        new_terms = np.concatenate([p[0] for p in pend])
+        new_tfs = np.concatenate([p[1] for p in pend])
+        new_docs = np.concatenate([np.full(len(p[0]), p[2], dtype=np.int32) for p in pend])
+        terms = np.concatenate([old_terms, new_terms])
+        # stable: within a term, old postings (smaller doc ids) stay ahead of new ones
+        order = np.argsort(terms, kind="stable")
+        self.post_docs = np.concatenate([self.post_docs, new_docs])[order]
+        self.post_tfs = np.concatenate([self.post_tfs, new_tfs])[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(terms, minlength=n_terms))]).astype(np.int64)
+        self.doc_len = np.concatenate([self.doc_len, np.array([p[3] for p in pend], dtype=np.uint32)])
+        self.doc_call = np.concatenate([self.doc_call, np.array([p[4] for p in pend], dtype=np.int32)])
+        self.doc_flags = np.concatenate([self.doc_flags, np.array([p[5] for p in pend], dtype=np.uint32)])
+        self.live = np.concatenate([self.live, np.ones(len(pend), dtype=bool)])
+
+    def _compact(self) -> None:
+        """Drop tombstoned docs and renumber the survivors."""
+        self._commit()
+        keep = np.asarray(self.live)
+        remap = np.full(len(keep), -1, dtype=np.int64)
+        remap[keep] = np.arange(int(keep.sum()))
+        post_keep = keep[self.post_docs]
+        terms = np.repeat(np.arange(len(self.offsets) - 1, dtype=np.int64), np.diff(self.offsets))[post_keep]
+        self.post_docs = remap[self.post_docs[post_keep]].astype(np.int32)
+        self.post_tfs = np.asarray(self.post_tfs)[post_keep]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(terms, minlength=len(self.terms)))]).astype(np.int64)
+        self.ids = [cid for cid, k in zip(self.ids, keep) if k]
+        self.id_pos = {cid: i for i, cid in enumerate(self.ids)}
+        self.doc_len = np.asarray(self.doc_len)[keep]
+        self.doc_call = np.asarray(self.doc_call)[keep]
+        self.doc_flags = np.asarray(self.doc_flags)[keep]
+        self.live = np.ones(len(self.ids), dtype=bool)
+
+    # -------------------- query --------------------
+
+    def can_filter(self, where: Dict[str, Any] | None) -> bool:
+        """
+        True if every key of `where` is call_id or one of this index's flag fields. An index
+        saved before tags.toml gained a tag can't filter on it until ingest rebuilds it.
+        """
+        if not where:
+            return True
+        clauses = where["$and"] if "$and" in where else [{k: v} for k, v in where.items()]
+        return all(key == "call_id" or key in self.flag_fields for clause in clauses for key in clause)
+
+    def _filter_mask(self, where: Dict[str, Any] | None, docs: np.ndarray) -> np.ndarray | None:
+        """Boolean mask over `docs` (doc indices) for a Chroma-style equality filter."""
+        if not where:
+            return None
+        clauses = where["$and"] if "$and" in where else [{k: v} for k, v in where.items()]
+        mask = np.ones(len(docs), dtype=bool)
+        for clause in clauses:
+            for key, val in clause.items():
+                if key == "call_id":
+                    pos = self.call_pos.get(val)
+                    if pos is None:
+                        return np.zeros(len(docs), dtype=bool)
+                    mask &= self.doc_call[docs] == pos
+                elif key in self.flag_fields:
+                    bit = np.uint32(1 << self.flag_fields.index(key))
+                    has = (self.doc_flags[docs] & bit) != 0
+                    mask &= has if val else ~has
+                else:
+                    raise ValueError(f"lexical search cannot filter on {key!r}")
+        return mask
+
+    def search(self, q: str, k: int = 6, where: Dict[str, Any] | None = None) -> List[Tuple[str, float]]:
+        """Top-k (chunk_id, bm25_score) among live docs matching `where`."""
+        self._commit()
+        n_live = int(np.count_nonzero(self.live))
+        if not n_live or k <= 0:
+            return []
+        avgdl = max(self.live_len / n_live, 1.0)
+        all_docs, all_w = [], []
+        for t in set(tokenize(q)):
+            tid = self.vocab.get(t)
+            if tid is None:
+                continue
+            s, e = int(self.offsets[tid]), int(self.offsets[tid + 1])
+            docs = self.post_docs[s:e]
+            df = int(np.count_nonzero(self.live[docs])) if len(docs) else 0
+            if not df:
+                continue
+            idf = math.log(1.0 + (n_live - df + 0.5) / (df + 0.5))
+            tf = self.post_tfs[s:e].astype(np.float64)
+            norm = K1 * (1.0 - B + B * self.doc_len[docs] / avgdl)
+            all_docs.append(docs)
+            all_w.append(idf * tf * (K1 + 1.0) / (tf + norm))
+        if not all_docs:
+            return []
+
+        docs = np.concatenate(all_docs)
+        w = np.concatenate(all_w)
+        n_docs = len(self.ids)
+        if len(docs) < n_docs // 4:
+            # rare terms: accumulate over the touched docs only
+            cand, inv = np.unique(docs, return_inverse=True)
+            scores = np.bincount(inv, weights=w)
+        else:
+            dense = np.bincount(docs, weights=w, minlength=n_docs)
+            cand = np.flatnonzero(dense)
+            scores = dense[cand]
+
+        ok = self.live[cand]
+        mask = self._filter_mask(where, cand)
+        if mask is not None:
+            ok &= mask
+        cand, scores = cand[ok], scores[ok]
+        if not len(cand):
+            return []
+        if len(cand) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            cand, scores = cand[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return [(self.ids[i], float(s)) for i, s in zip(cand[order], scores[order])]
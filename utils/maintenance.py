@@ -0,0 +1,203 @@
+# utils/maintenance.py
+"""
+Index upkeep behind `main.py maintain`.
+
+  find_orphans     chunks whose call has no transcript any more, or that the manifest
+                   does not list for a call it tracks (left by an interrupted ingest,
+                   a lost manifest, or transcripts renamed while none existed)
+  stale_stores     collections of earlier layouts (another VECTOR_BACKEND/VECTOR_SHARDS)
+  rebuild_chroma   copy a collection into a fresh one (current HNSW settings, no deleted
+                   nodes left in the graph), then swap the names
+  reclaim_chroma   drop segment directories no collection references, VACUUM the db
+  sweep / pick     recall@k against query latency over HNSW construction (M,
+                   construction_ef) and search (search_ef) parameters, on a sample of
+                   the stored vectors, in an in-memory client
+
+Chroma keeps the files of deleted collections and the free pages of deleted rows,
+so deletes alone never shrink data/chroma; the rebuild plus reclaim does.
+"""
+import itertools, json, os, pathlib, re, shutil, sqlite3, statistics, time
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from config import HNSW_SETTINGS_FILE
+from utils.embeddings import HNSW_KEYS, chroma_client, hnsw_metadata
+
+# Every combination is one index build: Chroma keeps a loaded index's search_ef until
+# the process reopens it, so it can't be varied on a single build.
+HNSW_GRID = {"M": (8, 16, 32), "construction_ef": (64, 200), "search_ef": (10, 40, 160)}
+
+_SEGMENT_DIR = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass  # removed while we walked
+    return total
+
+# ---- orphans ----
+def find_orphans(rows: Iterable[Tuple[str, str]], present: set, manifest: dict) -> Tuple[List[str], List[str]]:
+    """
+    rows: (chunk id, call_id) pairs from the store. Returns (ids of calls with no
+    transcript, ids the manifest does not list for a call it tracks). Calls the
+    manifest doesn't know (indexed before it existed) only lose chunks in the first case.
+    """
+    tracked: Dict[str, set] = {}
+    for entry in manifest["files"].values():
+        tracked.setdefault(entry["call_id"], set()).update(entry.get("chunk_ids") or [])
+    gone, stray = [], []
+    for cid, call in rows:
+        if call not in present:
+            gone.append(cid)
+        elif call in tracked and cid not in tracked[call]:
+            stray.append(cid)
+    return gone, stray
+
+# ---- stores ----
+def store_names(persist_dir: str) -> List[Tuple[str, str]]:
+    """(backend, name) of every collection in persist_dir."""
+    out = []
+    if os.path.exists(os.path.join(persist_dir, "chroma.sqlite3")):
+        out += [("chroma", c.name) for c in chroma_client(persist_dir).list_collections()]
+    flat = pathlib.Path(persist_dir) / "flat"
+    if flat.is_dir():
+        out += [("flat", d.name) for d in sorted(flat.iterdir()) if d.is_dir()]
+    return out
+
+def stale_stores(persist_dir: str, current: List[Tuple[str, str]], base: str = "calls") -> List[Tuple[str, str]]:
+    """Stores of `base` (plain or sharded) that the current layout does not use."""
+    pat = re.compile(rf"^{re.escape(base)}(_s\d+of\d+)?$")
+    return [s for s in store_names(persist_dir) if pat.match(s[1]) and s not in current]
+
+def drop_store(persist_dir: str, backend: str, name: str) -> None:
+    if backend == "flat":
+        shutil.rmtree(pathlib.Path(persist_dir) / "flat" / name)
+    else:
+        chroma_client(persist_dir).delete_collection(name)
+
+def rebuild_chroma(persist_dir: str, name: str, embedding_function=None) -> int:
+    """
+    Copy collection `name` into a fresh one created with the current HNSW settings
+    (hnsw_metadata) and swap it in. The copy keeps ids, embeddings, documents and
+    metadata, so nothing is re-embedded. An interrupted swap is finished on the next run.
+    Returns the rows copied.
+    """
+    client = chroma_client(persist_dir)
+    tmp = f"{name}__rebuild"
+    names = {c.name for c in client.list_collections()}
+    if tmp in names:
+        if name not in names:  # stopped between dropping the original and renaming the copy
+            client.get_collection(tmp, embedding_function=None).modify(name=name)
+            names.add(name)
+        else:  # stopped mid-copy: the original is intact
+            client.delete_collection(tmp)
+    if name not in names:
+        return 0
+    old = client.get_collection(name, embedding_function=None)
+    new = client.create_collection(tmp, embedding_function=embedding_function, metadata=hnsw_metadata(persist_dir))
+    n, batch = old.count(), client.get_max_batch_size()
+    for off in range(0, n, batch):
+        page = old.get(limit=batch, offset=off, include=["embeddings", "documents", "metadatas"])
+        new.add(ids=page["ids"], embeddings=page["embeddings"], documents=page["documents"],
+                metadatas=page["metadatas"])
+    if new.count() != n:
+        client.delete_collection(tmp)
+        raise RuntimeError(f"rebuild of {name} copied {new.count()} of {n} rows; original kept")
+    client.delete_collection(name)
+    new.modify(name=name)
+    return n
+
+def reclaim_chroma(persist_dir: str, timeout: float = 5.0) -> None:
+    """Remove vector segment directories no collection references, then VACUUM (as `chroma utils vacuum`)."""
+    db = os.path.join(persist_dir, "chroma.sqlite3")
+    if not os.path.exists(db):
+        return
+    con = sqlite3.connect(db, timeout=timeout)
+    try:
+        live = {row[0] for row in con.execute("SELECT id FROM segments")}
+        con.execute("VACUUM")
+    finally:
+        con.close()
+    for d in pathlib.Path(persist_dir).iterdir():
+        if d.is_dir() and _SEGMENT_DIR.match(d.name) and d.name not in live:
+            shutil.rmtree(d, ignore_errors=True)
+
+# ---- HNSW sweep ----
+def _unit(m: np.ndarray) -> np.ndarray:
+    return m / np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+
+def sweep(vectors, k: int = 10, n_queries: int = 100, grid: Dict[str, tuple] = HNSW_GRID,
+          seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Index `vectors` once per grid point in an in-memory client and time single queries.
+    Probes are midpoints of random pairs of stored vectors (a stored vector would
+    trivially find itself); ground truth is exact cosine top-k. One row per config:
+    {M, construction_ef, search_ef, recall, p50_ms, build_s}.
+    """
+    import chromadb
+    x = _unit(np.asarray(vectors, dtype=np.float32))
+    rng = np.random.default_rng(seed)
+    a, b = rng.integers(0, len(x), (2, n_queries))
+    qs = _unit(x[a] + x[b])
+    k = min(k, len(x))
+    sims = qs @ x.T
+    truth = [set(row) for row in np.argpartition(-sims, k - 1, axis=1)[:, :k].tolist()]
+    ids = [str(i) for i in range(len(x))]
+
+    client = chromadb.EphemeralClient()
+    batch = client.get_max_batch_size()
+    out: List[Dict[str, Any]] = []
+    for m, efc, ef in itertools.product(grid["M"], grid["construction_ef"], grid["search_ef"]):
+        name = f"hnsw-sweep-{m}-{efc}-{ef}"
+        try:
+            client.delete_collection(name)
+        except Exception:
+            pass  # not left over from an earlier run
+        coll = client.create_collection(name, embedding_function=None, metadata={
+            "hnsw:space": "cosine", "hnsw:M": m, "hnsw:construction_ef": efc, "hnsw:search_ef": ef})
+        t = time.perf_counter()
+        for s in range(0, len(x), batch):
+            coll.add(ids=ids[s:s + batch], embeddings=x[s:s + batch])
+        build_s = time.perf_counter() - t
+        lat, hits = [], 0
+        for q, want in zip(qs, truth):
+            t = time.perf_counter()
+            got = coll.query(query_embeddings=[q], n_results=k, include=[])["ids"][0]
+            lat.append((time.perf_counter() - t) * 1000)
+            hits += len({int(g) for g in got} & want)
+        out.append({"M": m, "construction_ef": efc, "search_ef": ef, "recall": hits / (k * len(qs)),
+                    "p50_ms": statistics.median(lat), "build_s": build_s})
+        client.delete_collection(name)
+    return out
+
+def pick(results: List[Dict[str, Any]], target: float) -> Dict[str, Any]:
+    """Fastest configuration reaching `target` recall (smaller graphs on ties), else the most accurate."""
+    ok = [r for r in results if r["recall"] >= target]
+    if ok:
+        return min(ok, key=lambda r: (round(r["p50_ms"], 2), r["M"], r["construction_ef"], r["search_ef"]))
+    return max(results, key=lambda r: (r["recall"], -r["p50_ms"]))
+
+def save_hnsw_settings(persist_dir: str, chosen: Dict[str, Any], **info) -> str:
+    path = os.path.join(persist_dir, HNSW_SETTINGS_FILE)
+    os.makedirs(persist_dir, exist_ok=True)
+    data = {key: int(chosen[key]) for key in HNSW_KEYS}
+    data.update(recall=round(chosen["recall"], 4), p50_ms=round(chosen["p50_ms"], 3), **info)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+    return path
+
+def apply_search_ef(persist_dir: str, names: List[str], search_ef: int) -> None:
+    """
+    search_ef is a query-time setting, so existing collections are updated in place.
+    Processes that already loaded a collection keep the old value (restart `serve`).
+    """
+    client = chroma_client(persist_dir)
+    for name in names:
+        client.get_collection(name, embedding_function=None).modify(configuration={"hnsw": {"ef_search": search_ef}})
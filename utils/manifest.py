@@ -0,0 +1,45 @@
+# utils/manifest.py
+import hashlib, json, os, pathlib
+
+# Bump when the entry layout changes; an unknown version is treated as empty.
+MANIFEST_VERSION = 1
+
+def load_manifest(path: str) -> dict:
+    """
+    Load the ingest manifest: {"version": 1, "files": {name: entry}}.
+    Each entry records {call_id, sha256, mtime, size, segments, chunk_ids}; "store" names
+    the vector store layout the chunks went into (utils.embeddings.store_layout).
+    A missing or unreadable manifest means "nothing ingested yet".
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"version": MANIFEST_VERSION, "files": {}}
+    if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+        return {"version": MANIFEST_VERSION, "files": {}}
+    data.setdefault("files", {})
+    return data
+
+def save_manifest(path: str, manifest: dict) -> None:
+    """Write atomically so an interrupted ingest never leaves a torn manifest."""
+    p = pathlib.Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_suffix(p.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, p)
+
+def file_sha256(path: str, bufsize: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            b = f.read(bufsize)
+            if not b:
+                break
+            h.update(b)
+    return h.hexdigest()
+
+def is_unchanged(entry: dict | None, st: os.stat_result) -> bool:
+    """Cheap check: same mtime and size as last ingest (no hashing needed)."""
+    return bool(entry) and entry.get("mtime") == st.st_mtime and entry.get("size") == st.st_size
@@ -0,0 +1,312 @@
+# utils/pipeline.py
+"""
+Ingest pipeline: parse/chunk → embed → upsert, with the manifest deciding what to skip.
+
+Stages:
+  1) parse + chunk changed files   (process pool when workers > 1)
+  2) embed fixed-size batches pooled across files   (single stage, main process)
+  3) bulk upsert                    (background writer thread, overlaps with 2)
+On a utils.dedup.DedupCollection (DEDUP=1), near-duplicates of stored chunks skip 2
+and 3 and are recorded as references instead.
+"""
+import os, pathlib
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator
+
+from utils.ingestion import call_id_for, iter_segments, iter_chunks
+from utils.embeddings import upsert_chunks, delete_chunks
+from utils.ingestion import FLAG_FIELDS
+from utils.catalog import CallStats
+from utils.segstore import SegmentStore
+from utils.manifest import file_sha256, is_unchanged
+from utils import dedup, trace
+
+@dataclass
+class IngestStats:
+    files_changed: int = 0
+    files_removed: int = 0
+    added: int = 0
+    deleted: int = 0
+    skipped: int = 0
+    deduped: int = 0    # new chunks recorded as references to a stored near-duplicate
+    promoted: int = 0   # references stored again because their canonical chunk was deleted
+
+    @property
+    def dedup_ratio(self) -> float:
+        """Share of the chunks sent for embedding that were near-duplicates instead."""
+        return self.deduped / max(1, self.added + self.deduped)
+
+def _tee(segs: Iterable, sink: Callable) -> Iterator:
+    for s in segs:
+        sink(s)
+        yield s
+
+def _prepare(path: str, old_sha: str | None, max_chars: int, force: bool, stream: bool = False,
+             minhash=None, segments_root: str | None = None) -> dict:
+    """
+    Hash, parse and chunk one transcript.
+    Returns chunks=None when the content hash matches the manifest (file only touched).
+    With stream=True, chunks is a lazy iterator (inline use only; not picklable).
+    With segments_root, the same segment stream also fills a utils.segstore.SegmentWriter
+    ("segments"), complete once chunks is exhausted; the caller installs it.
+    """
+    digest = file_sha256(path)
+    if not force and old_sha == digest:
+        return {"path": path, "sha256": digest, "chunks": None}
+    segs = iter_segments(path)
+    writer = None
+    if segments_root is not None:
+        writer = SegmentStore(segments_root).writer(call_id_for(path))
+        segs = _tee(segs, writer.add)
+    chunks = iter_chunks(segs, max_chars=max_chars, minhash=minhash)
+    return {
+        "path": path,
+        "sha256": digest,
+        "chunks": chunks if stream else list(chunks),
+        "segments": writer,
+    }
+
+def run_ingest(
+    coll,
+    files: Iterable[pathlib.Path],
+    manifest: dict,
+    max_chars: int = 1500,
+    force: bool = False,
+    workers: int = 1,
+    batch_size: int = 64,
+    stream_min_bytes: int = 8 << 20,
+    ef=None,
+    catalog=None,
+    lexical=None,
+    segments=None,
+    log: Callable[[str], None] = print,
+) -> IngestStats:
+    """
+    Bring `coll` in sync with `files`, updating `manifest` in place.
+    workers <= 0 uses every core; workers == 1 parses inline (no pool).
+    Chunks are consumed as a stream and flushed in batches, so peak memory is bounded
+    by batch_size rather than file size; files over stream_min_bytes are never sent
+    to the pool (which would materialize them) but streamed inline.
+    If a utils.catalog.Catalog is given, its per-call rows are kept in sync; calls
+    missing from it are re-parsed (not re-embedded) to backfill their rows.
+    If a utils.lexical.LexicalIndex is given, it receives the same adds/deletes
+    (the caller saves it).
+    If a utils.segstore.SegmentStore is given, every parsed call's segments are written
+    to it; calls missing from it are re-parsed (not re-embedded) like catalog gaps.
+    """
+    files = list(files)
+    entries = manifest["files"]
+    present = {fp.name for fp in files}
+    stats = IngestStats()
+    workers = workers if workers > 0 else (os.cpu_count() or 1)
+    index = getattr(coll, "dedup", None)
+    minhash = index.hasher if index is not None else None
+    seg_root = str(segments.root) if segments is not None else None
+
+    def known_sha(fp, entry) -> str | None:
+        # a call absent from the catalog or segment store must be re-parsed to backfill it
+        if catalog is not None and not catalog.has(call_id_for(str(fp))):
+            return None
+        if segments is not None and not segments.has(call_id_for(str(fp))):
+            return None
+        return (entry or {}).get("sha256")
+
+    # Cheap mtime/size check first; only the rest goes to the parse stage
+    todo = []
+    for fp in files:
+        entry = entries.get(fp.name)
+        st = fp.stat()
+        if not force and is_unchanged(entry, st) and known_sha(fp, entry):
+            stats.skipped += len(entry["chunk_ids"])
+        else:
+            todo.append((fp, st, entry))
+
+    pending: list[dict] = []
+    stale: list[str] = []
+    dup_rows: list[str] = []  # stored by an earlier run, now references (force / DEDUP turned on)
+    in_flight = []  # upsert futures, at most 2 so embedding stays just ahead of writes
+
+    if not entries and coll.count():
+        # index built before the manifest (uuid4 chunk ids): replace these calls' chunks outright,
+        # or every content-addressed chunk would land next to its old twin
+        calls = sorted({call_id_for(str(fp)) for fp in files})
+        legacy = coll.get(where={"call_id": {"$in": calls}}, include=[])["ids"] if calls else []
+        if legacy:
+            stats.deleted += delete_chunks(coll, legacy)
+            if lexical is not None:
+                lexical.remove(legacy)
+            if index is not None:
+                index.remove(legacy)
+            log(f"Replacing {len(legacy)} chunks indexed before the ingest manifest existed")
+
+    def drain(final: bool = False):
+        while len(pending) >= batch_size or (final and pending):
+            batch = pending[:batch_size]
+            del pending[:batch_size]
+            with trace.span("ingest.embed"):
+                emb = ef([c["text"] for c in batch]) if ef else None
+                trace.count("chunks_embedded", len(batch))
+            with trace.span("ingest.wait_writer"):
+                while len(in_flight) >= 2:
+                    stats.added += in_flight.pop(0).result()
+            # upserts run on the writer thread, so they show up as their own trace roots
+            in_flight.append(writer.submit(upsert_chunks, coll, batch, emb))
+            if lexical is not None:
+                with trace.span("ingest.lexical_add"):
+                    lexical.add(batch)
+
+    def queue(c: dict, stored: bool = False):
+        if index is not None:
+            _, refs = dedup.split(index, [c])
+            if refs:
+                stats.deduped += 1
+                if lexical is not None:
+                    lexical.add(refs)  # lexical filters see the call's own copy
+                if stored:
+                    dup_rows.append(c["id"])
+                return
+        pending.append(c)
+        drain()
+
+    def retire():
+        """Forget deleted chunks in the dedup index; store again references that lost their canonical."""
+        gone = stale + [cid for name in set(entries) - present for cid in entries[name]["chunk_ids"]]
+        orphans = index.remove(gone)
+        if not orphans:
+            return
+        live = {cid for name, e in entries.items() if name in present for cid in e["chunk_ids"]}
+        paths = {call_id_for(str(fp)): str(fp) for fp in files}
+        with trace.span("ingest.dedup_promote"):
+            for c in dedup.promote(orphans, paths, max_chars, minhash):
+                if c["id"] in live:
+                    stats.promoted += 1
+                    queue(c)
+
+    def consume(res: dict, st, entry):
+        with trace.span("ingest.file"):
+            _consume(res, st, entry)
+
+    def _consume(res: dict, st, entry):
+        name = pathlib.Path(res["path"]).name
+        if res["chunks"] is None:
+            # touched but not edited: refresh stat info only
+            entry["mtime"], entry["size"] = st.st_mtime, st.st_size
+            stats.skipped += len(entry["chunk_ids"])
+            if catalog is not None:
+                catalog.touch(entry["call_id"], st.st_mtime)
+            return
+        old_ids = set(entry["chunk_ids"]) if entry else set()
+        new_ids: list[str] = []
+        n_fresh = n_segments = 0
+        call = CallStats(call_id_for(res["path"]), name, st.st_mtime, FLAG_FIELDS)
+        for c in res["chunks"]:
+            new_ids.append(c["id"])
+            n_segments = c["meta"]["seg_end_idx"] + 1
+            call.add(c)
+            if force or c["id"] not in old_ids:
+                queue(c, stored=c["id"] in old_ids)
+                n_fresh += 1
+        if res["segments"] is not None:
+            with trace.span("ingest.segments"):
+                res["segments"].install()
+        gone = old_ids - set(new_ids)
+        stale.extend(gone)
+        stats.skipped += len(new_ids) - n_fresh
+        stats.files_changed += 1
+        entries[name] = {
+            "call_id": call_id_for(res["path"]),
+            "sha256": res["sha256"],
+            "mtime": st.st_mtime,
+            "size": st.st_size,
+            "segments": n_segments,
+            "chunk_ids": new_ids,
+        }
+        if catalog is not None:
+            if new_ids:
+                catalog.upsert(call.row)
+            else:
+                catalog.delete(call.row["call_id"])
+        log(f"Ingested [bold]{name}[/bold]: {n_segments} segments → {len(new_ids)} chunks "
+            f"(+{n_fresh} / -{len(gone)})")
+
+    def _result(fut) -> dict:
+        # parse/chunk runs in worker processes (not traced); this is the time spent waiting on them
+        with trace.span("ingest.wait_parse"):
+            return fut.result()
+
+    def inline(fp, st, entry):
+        consume(_prepare(str(fp), known_sha(fp, entry), max_chars, force, stream=True, minhash=minhash,
+                         segments_root=seg_root), st, entry)
+
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        if workers == 1 or len(todo) <= 1:
+            for fp, st, entry in todo:
+                inline(fp, st, entry)
+        else:
+            # spawn: the parent may hold ONNX/Chroma threads that are unsafe to fork
+            ctx = mp.get_context("spawn")
+            n_procs = min(workers, len(todo))
+            window = n_procs * 4  # bounded read-ahead: parsed files never pile up unconsumed
+            with ProcessPoolExecutor(max_workers=n_procs, mp_context=ctx) as pool:
+                futs = deque()
+                # consume in submission order so logs and manifest updates stay deterministic
+                for fp, st, entry in todo:
+                    if st.st_size >= stream_min_bytes:
+                        while futs:
+                            fut, st0, entry0 = futs.popleft()
+                            consume(_result(fut), st0, entry0)
+                        inline(fp, st, entry)
+                        continue
+                    futs.append((pool.submit(_prepare, str(fp), known_sha(fp, entry), max_chars, force, False, minhash,
+                                             seg_root),
+                                 st, entry))
+                    if len(futs) >= window:
+                        fut, st0, entry0 = futs.popleft()
+                        consume(_result(fut), st0, entry0)
+                while futs:
+                    fut, st0, entry0 = futs.popleft()
+                    consume(_result(fut), st0, entry0)
+        if index is not None:
+            retire()
+        drain(final=True)
+        with trace.span("ingest.wait_writer"):
+            for fut in in_flight:
+                stats.added += fut.result()
+
+    stats.deleted += delete_chunks(coll, stale) + delete_chunks(coll, dup_rows)
+    if lexical is not None:
+        lexical.remove(stale)
+
+    # Transcripts that disappeared since the last run: drop their chunks
+    for name in sorted(set(entries) - present):
+        gone_entry = entries.pop(name)
+        n = delete_chunks(coll, gone_entry["chunk_ids"])
+        if lexical is not None:
+            lexical.remove(gone_entry["chunk_ids"])
+        if catalog is not None:
+            catalog.delete(gone_entry["call_id"])
+        if segments is not None:
+            segments.delete(gone_entry["call_id"])
+        stats.deleted += n
+        stats.files_removed += 1
+        log(f"Removed [bold]{name}[/bold]: -{n} chunks")
+
+    if index is not None:
+        index.commit()
+    return stats
+
+def backfill_lexical(coll, lexical, page_size: int = 2000) -> int:
+    """Index every chunk already in `coll` (for collections built before the lexical index)."""
+    n, offset = 0, 0
+    while True:
+        page = coll.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            return n
+        n += lexical.add(
+            {"id": cid, "text": doc or "", "meta": meta or {}}
+            for cid, doc, meta in zip(page["ids"], page["documents"], page["metadatas"])
+        )
+        offset += len(page["ids"])
@@ -0,0 +1,164 @@
+# utils/planner.py
+"""
+Filter-aware query planning for vector search.
+
+Chroma's filtered HNSW search walks the graph and drops non-matching nodes, so a
+very selective filter (one call, or a call plus a flag) either costs a long walk
+or returns fewer than k hits. With chunk counts per filter we can do better:
+
+  ann         no filter: plain top-k from the index
+  native      the store filters exactly before scoring (flat backend): pass through
+  exhaustive  estimated matches <= PLANNER_EXHAUSTIVE_MAX: fetch the matching
+              chunks' embeddings with coll.get(where=...) and score all of them
+              (exact, and a single call is tens of chunks)
+  filtered    everything else: the index filter with n_results over-fetched by
+              the inverse selectivity (capped at PLANNER_OVERFETCH_MAX×), trimmed to k
+
+Estimates come from the call catalog (per-call chunk_count and flag_counts), so
+they are upper bounds: clauses the catalog can't model are ignored, which only
+ever makes the estimate larger. Every plan is a single pass over the store.
+"""
+import math, time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from config import PLANNER_EXHAUSTIVE_MAX, PLANNER_OVERFETCH_MAX, PLANNER_STATS_TTL
+from utils import trace
+from utils.ingestion import FLAG_FIELDS
+
+@dataclass(slots=True)
+class Plan:
+    strategy: str               # "ann" | "native" | "exhaustive" | "filtered"
+    n_results: int              # rows to ask the index for (>= k when over-fetching)
+    estimate: int | None = None  # upper bound on matching chunks (None = no statistics)
+
+def conjuncts(where: Dict[str, Any] | None) -> List[Tuple[str, Any]]:
+    """Top-level AND clauses as (key, value); {"$eq": v} is unwrapped, other operators are kept as dicts."""
+    if not where:
+        return []
+    out: List[Tuple[str, Any]] = []
+    for key, val in where.items():
+        if key == "$and":
+            for sub in val:
+                out.extend(conjuncts(sub))
+        elif not str(key).startswith("$"):
+            out.append((key, val["$eq"] if isinstance(val, dict) and set(val) == {"$eq"} else val))
+    return out
+
+class CatalogStats:
+    """
+    Selectivity statistics from a utils.catalog.Catalog. Per-call rows are read
+    live (primary-key lookup); corpus totals are cached for `ttl` seconds.
+    """
+
+    def __init__(self, catalog, ttl: float = PLANNER_STATS_TTL):
+        self.catalog = catalog
+        self.ttl = ttl
+        self._totals: Dict[str, Any] | None = None
+        self._at = 0.0
+
+    def totals(self) -> Dict[str, Any]:
+        if self._totals is None or time.monotonic() - self._at > self.ttl:
+            self._totals = self.catalog.totals(FLAG_FIELDS)
+            self._at = time.monotonic()
+        return self._totals
+
+    def total(self) -> int:
+        return int(self.totals()["chunk_count"])
+
+    def estimate(self, where: Dict[str, Any] | None) -> int | None:
+        clauses = conjuncts(where)
+        call_ids = [v for k, v in clauses if k == "call_id" and isinstance(v, str)]
+        if call_ids:
+            row = self.catalog.get(call_ids[0])
+            if row is None:
+                return None  # call not in the catalog (pre-catalog index): no estimate
+            base, flags = int(row["chunk_count"]), row["flag_counts"]
+        else:
+            t = self.totals()
+            if not t["chunk_count"]:
+                return None  # empty catalog (index built before it existed)
+            base, flags = int(t["chunk_count"]), t["flag_counts"]
+        est = base
+        for key, val in clauses:
+            if key in flags and isinstance(val, bool):
+                est = min(est, int(flags[key]) if val else base - int(flags[key]))
+        return est
+
+def plan(coll, where: Dict[str, Any] | None, k: int, stats=None) -> Plan:
+    if not where:
+        return Plan("ann", k)
+    if getattr(coll, "exact_filters", False):
+        return Plan("native", k)
+    est = stats.estimate(where) if stats is not None else None
+    if est is None:
+        # no statistics: a single call is small by construction, anything broader goes to the index
+        if any(key == "call_id" for key, _ in conjuncts(where)):
+            return Plan("exhaustive", k)
+        return Plan("filtered", k)
+    if est <= PLANNER_EXHAUSTIVE_MAX:
+        return Plan("exhaustive", k, est)
+    factor = min(float(PLANNER_OVERFETCH_MAX), max(1.0, stats.total() / max(est, 1)))
+    return Plan("filtered", max(k, min(est, math.ceil(k * factor))), est)
+
+def _equalities(where: Dict[str, Any]) -> List[Tuple[str, Any]] | None:
+    """The clauses if `where` is a plain AND of scalar equalities, else None."""
+    for key, val in where.items():
+        if key == "$and":
+            if not all(isinstance(sub, dict) and _equalities(sub) is not None for sub in val):
+                return None
+        elif str(key).startswith("$") or isinstance(val, (dict, list)):
+            return None
+    return conjuncts(where)
+
+def score_exhaustive(coll, qs: List[str], k: int, where: Dict[str, Any], store_where) -> List[List[Dict[str, Any]]] | None:
+    """
+    Exact top-k among the chunks matching `where`: one coll.get for their embeddings,
+    one matmul, one coll.get for the winners' documents. None if `coll` has no
+    embedding function to embed the queries with.
+
+    With a call_id equality the store is asked for that call only and the other
+    clauses are checked here (Chroma's $and lookups cost several times more than
+    the single call_id lookup). `store_where` is `where` in the store's syntax.
+    """
+    ef = getattr(coll, "_embedding_function", None)
+    if ef is None:
+        return None
+    with trace.span("retrieval.exhaustive", n=len(qs)):
+        clauses = _equalities(where)
+        call_ids = [v for key, v in clauses or () if key == "call_id"]
+        rest = [(key, v) for key, v in clauses or () if key != "call_id"]
+        if call_ids and len(set(call_ids)) == 1:
+            cand = coll.get(where={"call_id": call_ids[0]}, include=["embeddings", "metadatas"])
+        else:
+            cand, rest = coll.get(where=store_where, include=["embeddings"]), []
+        ids = list(cand.get("ids") or [])
+        keep = list(range(len(ids)))
+        if rest:
+            metas = cand.get("metadatas") or []
+            keep = [i for i in keep if all((metas[i] or {}).get(key) == v for key, v in rest)]
+            ids = [ids[i] for i in keep]
+        if not ids:
+            return [[] for _ in qs]
+        trace.count("planner.chunks_scored", len(ids) * len(qs))
+        mat = np.asarray(cand["embeddings"], dtype=np.float32)[keep]
+        mat /= np.maximum(np.linalg.norm(mat, axis=1, keepdims=True), 1e-12)
+        with trace.span("retrieval.embed_query"):
+            qv = np.asarray(ef(qs), dtype=np.float32)
+        qv /= np.maximum(np.linalg.norm(qv, axis=1, keepdims=True), 1e-12)
+        sims = qv @ mat.T
+        kk = min(k, len(ids))
+        tops = []
+        for row in sims:
+            top = np.argpartition(-row, kk - 1)[:kk] if len(ids) > kk else np.arange(len(ids))
+            tops.append(top[np.argsort(-row[top], kind="stable")])
+        want = sorted({ids[i] for top in tops for i in top})
+        res = coll.get(ids=want, include=["documents", "metadatas"])
+        by_id = {cid: (doc, meta) for cid, doc, meta in zip(res["ids"], res["documents"], res["metadatas"])}
+        out = []
+        for row, top in zip(sims, tops):
+            out.append([{"id": ids[i], "text": by_id[ids[i]][0], "meta": by_id[ids[i]][1], "score": float(row[i])}
+                        for i in top if ids[i] in by_id])
+        return out
@@ -1,9 +1,15 @@
 # utils/prompts.py
-from typing import List, Dict
-import sys
-from openai import OpenAI
-from config import GROQ_API_KEY, GROQ_MODEL
+from typing import Any, Callable, List, Dict
+import asyncio, hashlib, json, random, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    GROQ_API_KEY, GROQ_MODEL, GROQ_BASE_URL, LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MAX_BYTES,
+    SUMMARY_WINDOW, SUMMARY_FANIN, SUMMARY_WORKERS,
+)
 from textwrap import shorten
+from utils.cache import DiskCache
+from utils.context import budget_for, pack
+from utils import trace
 
 # System prompt for call summarization
 SYS_SUMMARY = """
@@ -30,15 +36,209 @@ Formatting & style rules:
 - If a section has nothing in the snippets, write “None mentioned.” (not omitted).
 - Do NOT add citations in the body; they’ll be appended by the caller.
 """
-# ---- Groq-only client (OpenAI-compatible) ----
-if not GROQ_API_KEY:
-    # Hard fail with a clear message so you know what's wrong
-    print("ERROR: GROQ_API_KEY not found. Create a .env with GROQ_API_KEY=gsk-... ", file=sys.stderr)
-    client = None
-    DEFAULT_MODEL = None
-else:
-    client = OpenAI(api_key=GROQ_API_KEY, base_url="https://api.groq.com/openai/v1")
-    DEFAULT_MODEL = GROQ_MODEL or "llama3-8b-8192"
+# ---- Groq-only client (OpenAI-compatible), created on first use ----
+# Importing openai and building the client costs ~0.7s, so commands that never
+# reach the LLM (list, ingest, --help) don't pay for it.
+client = None
+DEFAULT_MODEL = (GROQ_MODEL or "llama3-8b-8192") if GROQ_API_KEY else None
+_warned = False
+
+def get_client():
+    global client, _warned
+    if client is None:
+        if not GROQ_API_KEY:
+            if not _warned:
+                # Clear message so you know what's wrong
+                print("ERROR: GROQ_API_KEY not found. Create a .env with GROQ_API_KEY=gsk-... ", file=sys.stderr)
+                _warned = True
+            return None
+        with trace.span("llm.client_init"):
+            from openai import OpenAI
+            client = OpenAI(api_key=GROQ_API_KEY, base_url=GROQ_BASE_URL)
+    return client
+
+async_client = None
+
+def get_async_client():
+    """AsyncOpenAI twin of get_client() for concurrent batches; retries are ours (see _achat_retry)."""
+    global async_client
+    if async_client is None:
+        if not get_client():
+            return None
+        from openai import AsyncOpenAI
+        async_client = AsyncOpenAI(api_key=GROQ_API_KEY, base_url=GROQ_BASE_URL, max_retries=0)
+    return async_client
+
+# ---- LLM response cache (model + prompts + hit IDs → answer) ----
+_response_cache = None
+
+def _get_response_cache() -> DiskCache | None:
+    global _response_cache
+    if _response_cache is None and LLM_CACHE_PATH:
+        _response_cache = DiskCache(LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_bytes=LLM_CACHE_MAX_BYTES)
+    return _response_cache
+
+def _response_key(msgs: List[Dict], hits: List[Dict]) -> str:
+    raw = json.dumps(
+        {"model": DEFAULT_MODEL, "messages": msgs, "hit_ids": [h.get("id") for h in hits]},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _cache_lookup(msgs: List[Dict], hits: List[Dict], use_cache: bool):
+    """(cache, key, cached answer or None); cache is None when caching is off."""
+    cache = _get_response_cache() if use_cache else None
+    if cache is None:
+        return None, "", None
+    key = _response_key(msgs, hits)
+    cached = cache.get(key)
+    cache.incr("hits" if cached is not None else "misses")
+    trace.count("llm_cache.hits" if cached is not None else "llm_cache.misses")
+    return cache, key, cached["answer"] if cached is not None else None
+
+def _chat(msgs: List[Dict], hits: List[Dict], use_cache: bool = True, info: Dict[str, Any] | None = None) -> str:
+    """
+    One chat completion, served from the response cache when possible.
+    Raises on LLM failure: callers build their own fallback text, which is never cached.
+    `info` (if given) receives attempts / cached / llm_ms, as in _achat_retry.
+    """
+    info = info if info is not None else {}
+    cache, key, cached = _cache_lookup(msgs, hits, use_cache)
+    info.update(attempts=0, cached=cached is not None)
+    if cached is not None:
+        return cached
+
+    t0 = time.perf_counter()
+    info["attempts"] = 1
+    try:
+        with trace.span("llm.chat", model=DEFAULT_MODEL):
+            resp = get_client().chat.completions.create(
+                model=DEFAULT_MODEL,
+                messages=msgs,
+                temperature=0.2,
+            )
+            _count_usage(resp)
+    finally:
+        info["llm_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    answer = (resp.choices[0].message.content or "").strip()
+    if cache is not None and answer:
+        cache.put(key, {"answer": answer})
+    return answer
+
+def _chat_stream(msgs: List[Dict], hits: List[Dict], on_token: Callable[[str], None], use_cache: bool = True,
+                 info: Dict[str, Any] | None = None) -> str:
+    """
+    _chat() with stream=True: each content delta goes to `on_token` as it arrives.
+    info gets ttft_ms (time to first token) and gen_ms (whole generation).
+    An error before the first token raises like _chat(); an error after it ends the
+    answer with a note instead, since part of it is already on the user's screen.
+    Only complete answers are cached.
+    """
+    info = info if info is not None else {}
+    cache, key, cached = _cache_lookup(msgs, hits, use_cache)
+    info["cached"] = cached is not None
+    if cached is not None:
+        info.update(ttft_ms=0.0, gen_ms=0.0)
+        on_token(cached)
+        return cached
+
+    t0 = time.perf_counter()
+    parts: List[str] = []
+    sp = trace.span("llm.stream", model=DEFAULT_MODEL)
+    sp.__enter__()
+    try:
+        stream = get_client().chat.completions.create(
+            model=DEFAULT_MODEL,
+            messages=msgs,
+            temperature=0.2,
+            stream=True,
+        )
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            if not parts:
+                info["ttft_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            parts.append(delta)
+            on_token(delta)
+    except Exception as e:
+        if not parts:
+            raise
+        note = f"\n\n(LLM error mid-stream: {e.__class__.__name__}; answer may be incomplete)"
+        on_token(note)
+        info["error"] = e.__class__.__name__
+        return "".join(parts) + note
+    finally:
+        info["gen_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        sp.set(ttft_ms=info.get("ttft_ms"))
+        sp.__exit__(None, None, None)
+    answer = "".join(parts).strip()
+    if cache is not None and answer:
+        cache.put(key, {"answer": answer})
+    return answer
+
+def _complete(msgs: List[Dict], hits: List[Dict], use_cache: bool, on_token: Callable[[str], None] | None,
+              info: Dict[str, Any] | None) -> str:
+    if on_token is None:
+        return _chat(msgs, hits, use_cache=use_cache, info=info)
+    return _chat_stream(msgs, hits, on_token, use_cache=use_cache, info=info)
+
+def _emit(on_token: Callable[[str], None] | None, text: str) -> str:
+    if on_token is not None and text:
+        on_token(text)
+    return text
+
+def _count_usage(resp) -> None:
+    usage = getattr(resp, "usage", None)
+    if usage is not None:
+        trace.count("llm.prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+        trace.count("llm.completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+
+def _retryable(e: Exception) -> bool:
+    """Timeouts, connection errors, 408/409/429 and 5xx are worth another attempt; anything else is not."""
+    from openai import APIConnectionError, APITimeoutError  # already loaded by the async client
+    if isinstance(e, (asyncio.TimeoutError, APITimeoutError, APIConnectionError)):
+        return True
+    status = getattr(e, "status_code", None)
+    return status is not None and (status in (408, 409, 429) or status >= 500)
+
+async def _achat_retry(msgs: List[Dict], hits: List[Dict], use_cache: bool = True, timeout: float = 60.0,
+                       retries: int = 3, backoff: float = 0.5, info: Dict[str, Any] | None = None) -> str:
+    """
+    Async _chat(): per-attempt timeout, exponential backoff with jitter between
+    retryable failures. `info` (if given) receives attempts / cached / llm_ms.
+    Raises the last error once retries are exhausted.
+    """
+    info = info if info is not None else {}
+    cache, key, cached = _cache_lookup(msgs, hits, use_cache)
+    info.update(attempts=0, cached=cached is not None)
+    if cached is not None:
+        return cached
+
+    t0 = time.perf_counter()
+    with trace.span("llm.chat_async", model=DEFAULT_MODEL) as sp:
+        try:
+            for attempt in range(retries + 1):
+                info["attempts"] = attempt + 1
+                try:
+                    resp = await asyncio.wait_for(
+                        get_async_client().chat.completions.create(model=DEFAULT_MODEL, messages=msgs,
+                                                                   temperature=0.2),
+                        timeout,
+                    )
+                    break
+                except Exception as e:
+                    if attempt >= retries or not _retryable(e):
+                        raise
+                    await asyncio.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+        finally:
+            info["llm_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            sp.set(attempts=info["attempts"])
+    _count_usage(resp)
+    answer = (resp.choices[0].message.content or "").strip()
+    if cache is not None and answer:
+        cache.put(key, {"answer": answer})
+    return answer
 
 # -------------------- prompt templates --------------------
 SYS_QA = """You are a sales-call analysis copilot.
@@ -57,25 +257,29 @@ SYS_SUM = """Summarize the call for a sales rep. Include:
 Add citations like [call_id start_ts–end_ts]. Keep to 5–8 bullets.
 """
 
+_SNIP_SEP = "\n\n---\n\n"
+
+def _format_snip(h: Dict) -> str:
+    m = h["meta"]
+    cid = m.get("call_id", "?"); s = m.get("start_ts", "?"); e = m.get("end_ts", "?")
+    return f"[{cid} {s}–{e}]\n{h['text']}"
+
 def _format_snips(hits: List[Dict]) -> str:
-    blocks = []
-    for h in hits:
-        m = h["meta"]
-        cid = m.get("call_id", "?"); s = m.get("start_ts", "?"); e = m.get("end_ts", "?")
-        blocks.append(f"[{cid} {s}–{e}]\n{h['text']}")
-    return "\n\n---\n\n".join(blocks)
-
-def ask_qa(question: str, hits: List[Dict]) -> str:
-    ctx = _format_snips(hits) if hits else "(no relevant snippets retrieved)"
+    return _SNIP_SEP.join(_format_snip(h) for h in hits)
 
-    # If Groq isn't configured, still show a Sources section built from hits
-    if not client or not DEFAULT_MODEL:
-        return _format_answer_with_sources(
-            "(GROQ not configured) Showing top snippets-derived context below.",
-            hits
-        )
+def _pack(hits: List[Dict], info: Dict[str, Any] | None) -> List[Dict]:
+    """Fit hits to the model's snippet token budget (utils/context.py); stats land in info["context"]."""
+    with trace.span("prompts.pack"):
+        packed, stats = pack(hits, budget_for(DEFAULT_MODEL), render=_format_snip, sep=_SNIP_SEP)
+        trace.count("context.tokens_sent", stats.tokens_out)
+        trace.count("context.tokens_saved", stats.tokens_saved)
+    if info is not None:
+        info["context"] = stats.as_dict()
+    return packed
 
-    msgs = [
+def _qa_messages(question: str, hits: List[Dict]) -> List[Dict]:
+    ctx = _format_snips(hits) if hits else "(no relevant snippets retrieved)"
+    return [
         {"role": "system", "content": SYS_QA},
         {
             "role": "user",
@@ -88,40 +292,62 @@ def ask_qa(question: str, hits: List[Dict]) -> str:
         },
     ]
 
+def ask_qa(question: str, hits: List[Dict], use_cache: bool = True, info: Dict[str, Any] | None = None,
+           on_token: Callable[[str], None] | None = None) -> str:
+    """
+    Answer from the hits. With `on_token`, the answer is streamed through it as it is
+    generated, followed by the Sources block; the full text is returned either way.
+    """
+    # If Groq isn't configured, still show a Sources section built from hits
+    if not get_client() or not DEFAULT_MODEL:
+        return _emit(on_token, _format_answer_with_sources(
+            "(GROQ not configured) Showing top snippets-derived context below.",
+            hits
+        ))
+
+    hits = _pack(hits, info)
+    with trace.span("prompts.build"):
+        msgs = _qa_messages(question, hits)
     try:
-        resp = client.chat.completions.create(
-            model=DEFAULT_MODEL,
-            messages=msgs,
-            temperature=0.2,
-        )
-        answer = (resp.choices[0].message.content or "").strip()
+        answer = _complete(msgs, hits, use_cache, on_token, info)
     except Exception as e:
         # Graceful fallback if the LLM call fails
-        answer = f"(LLM error: {e.__class__.__name__}) Using retrieved snippets only."
+        answer = _emit(on_token, f"(LLM error: {e.__class__.__name__}) Using retrieved snippets only.")
 
     # Append compact, deterministic sources from the actual hits
-    return _format_answer_with_sources(answer, hits)
+    return answer.strip() + _emit(on_token, _sources_block(hits))
 
-def summarize_call(call_id: str, hits: List[Dict]) -> str:
+async def ask_qa_async(question: str, hits: List[Dict], use_cache: bool = True, timeout: float = 60.0,
+                       retries: int = 3, backoff: float = 0.5, info: Dict[str, Any] | None = None) -> str:
     """
-    Build a concise, structured summary for a single call using ONLY the retrieved snippets.
-    Always append a deterministic Sources block based on hits.
+    ask_qa() over the async client, for concurrent batches (see utils/batch.py).
+    Same fallbacks; on failure info["error"] holds the exception class name.
     """
-    ctx = _format_snips(hits) if hits else "(no relevant snippets retrieved)"
-
-    # Fallback if Groq isn't configured
-    if not client or not DEFAULT_MODEL:
+    info = info if info is not None else {}
+    if not get_async_client() or not DEFAULT_MODEL:
+        info["error"] = "llm_not_configured"
         return _format_answer_with_sources(
-            f"(GROQ not configured) Top snippets for {call_id}:\n\n{ctx}\n",
+            "(GROQ not configured) Showing top snippets-derived context below.",
             hits
         )
 
-    msgs = [
+    hits = _pack(hits, info)
+    try:
+        answer = await _achat_retry(_qa_messages(question, hits), hits, use_cache=use_cache, timeout=timeout,
+                                    retries=retries, backoff=backoff, info=info)
+    except Exception as e:
+        info["error"] = e.__class__.__name__
+        answer = f"(LLM error: {e.__class__.__name__}) Using retrieved snippets only."
+
+    return _format_answer_with_sources(answer, hits)
+
+def _summary_messages(call_id: str, ctx: str, source: str = "snippets") -> List[Dict]:
+    return [
         {"role": "system", "content": SYS_SUMMARY},
         {
             "role": "user",
             "content": (
-                "You must summarize ONLY using the snippets below.\n"
+                f"You must summarize ONLY using the {source} below.\n"
                 "If a detail isn't present, say you don't know.\n"
                 "Output the following sections, concise, no citations:\n"
                 "TL;DR (3–5 bullets)\n"
@@ -133,30 +359,110 @@ def summarize_call(call_id: str, hits: List[Dict]) -> str:
                 "Competitors\n"
                 "Action Items (who/what/when)\n"
                 "Risks / Open Questions\n\n"
-                f"Call ID: {call_id}\n\nSnippets:\n{ctx}"
+                f"Call ID: {call_id}\n\n{source.capitalize()}:\n{ctx}"
             ),
         },
     ]
 
+def summarize_call(call_id: str, hits: List[Dict], use_cache: bool = True, info: Dict[str, Any] | None = None,
+                   on_token: Callable[[str], None] | None = None) -> str:
+    """
+    Build a concise, structured summary for a single call using ONLY the retrieved snippets.
+    Always append a deterministic Sources block based on hits (streamed last with `on_token`).
+    """
+    ctx = _format_snips(hits) if hits else "(no relevant snippets retrieved)"
+
+    # Fallback if Groq isn't configured
+    if not get_client() or not DEFAULT_MODEL:
+        return _emit(on_token, _format_answer_with_sources(
+            f"(GROQ not configured) Top snippets for {call_id}:\n\n{ctx}\n",
+            hits
+        ))
+
+    hits = _pack(hits, info)
+    with trace.span("prompts.build"):
+        ctx = _format_snips(hits)
+        msgs = _summary_messages(call_id, ctx)
     try:
-        resp = client.chat.completions.create(
-            model=DEFAULT_MODEL,
-            messages=msgs,
-            temperature=0.2,
-        )
-        answer = (resp.choices[0].message.content or "").strip()
+        answer = _complete(msgs, hits, use_cache, on_token, info)
     except Exception as e:
-        answer = f"(LLM error: {e.__class__.__name__}) Showing retrieved snippets only.\n\n{ctx}"
+        answer = _emit(on_token, f"(LLM error: {e.__class__.__name__}) Showing retrieved snippets only.\n\n{ctx}")
 
-    return _format_answer_with_sources(answer, hits)
+    return answer.strip() + _emit(on_token, _sources_block(hits))
+
+# -------------------- full-coverage (map-reduce) summaries --------------------
+SYS_MAP = """You are taking notes on one excerpt of a longer sales call. Use ONLY the excerpt.
+Write compact bullets under these headings, in this order:
+Topics, Key Moments, Objections & Responses, Pricing, Security, Competitors, Action Items, Risks / Open Questions.
+Keep [mm:ss] timestamps and speaker roles from the excerpt. Write "None." under a heading with nothing to report.
+No preamble, no citations.
+"""
+
+SYS_MERGE = """You merge notes taken on consecutive parts of one sales call. Use ONLY the notes given.
+Keep the same headings in the same order. Combine duplicate points, keep timestamps and chronological order,
+and drop "None." when another part has content for that heading. No preamble, no citations.
+"""
+
+def _map_messages(call_id: str, window: List[Dict]) -> List[Dict]:
+    return [
+        {"role": "system", "content": SYS_MAP},
+        {"role": "user", "content": f"Call ID: {call_id}\n\nExcerpt:\n{_format_snips(window)}"},
+    ]
+
+def _join_notes(notes: List[str]) -> str:
+    return "\n\n---\n\n".join(f"Part {i}:\n{n}" for i, n in enumerate(notes, start=1))
+
+def _merge_messages(call_id: str, notes: List[str]) -> List[Dict]:
+    return [
+        {"role": "system", "content": SYS_MERGE},
+        {"role": "user", "content": f"Call ID: {call_id}\n\nNotes:\n{_join_notes(notes)}"},
+    ]
+
+def summarize_call_full(call_id: str, chunks: List[Dict], use_cache: bool = True, window: int = SUMMARY_WINDOW,
+                        fanin: int = SUMMARY_FANIN, workers: int = SUMMARY_WORKERS,
+                        info: Dict[str, Any] | None = None, on_token: Callable[[str], None] | None = None) -> str:
+    """
+    Summary covering every chunk of the call (pass them in transcript order).
+    Map: notes per window of `window` chunks, in parallel. Reduce: merge `fanin`
+    notes at a time until they fit one final SYS_SUMMARY call.
+    Windows are counted from the start of the call and every call goes through the
+    response cache (keyed on content), so after lines are appended only the tail
+    window and the merges above it are recomputed.
+    """
+    if len(chunks) <= window or not get_client() or not DEFAULT_MODEL:
+        return summarize_call(call_id, chunks, use_cache=use_cache, info=info, on_token=on_token)
+
+    windows = [chunks[i:i + window] for i in range(0, len(chunks), window)]
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            with trace.span("summarize.map", windows=len(windows)):
+                notes = list(pool.map(lambda w: _chat(_map_messages(call_id, w), w, use_cache=use_cache), windows))
+            while len(notes) > fanin:
+                groups = [notes[i:i + fanin] for i in range(0, len(notes), fanin)]
+                with trace.span("summarize.reduce", groups=len(groups)):
+                    notes = list(pool.map(
+                        lambda g: _chat(_merge_messages(call_id, g), [], use_cache=use_cache) if len(g) > 1 else g[0],
+                        groups,
+                    ))
+        # only the final pass is user-facing, so that is the one worth streaming
+        answer = _complete(_summary_messages(call_id, _join_notes(notes), source="notes"), [], use_cache, on_token, info)
+    except Exception as e:
+        answer = _emit(on_token, f"(LLM error: {e.__class__.__name__}) Showing the call's opening chunks only."
+                                 f"\n\n{_format_snips(windows[0])}")
+
+    return answer.strip() + _emit(on_token, _sources_block(chunks))
 
 def _format_answer_with_sources(answer: str, hits: list[dict], max_sources: int = 5, max_snippet_chars: int = 160) -> str:
     """
     Takes the raw LLM answer and appends a compact Sources section built from the retrieved hits.
     Each source shows: [#] call_id start–end : short snippet
     """
+    return answer.strip() + _sources_block(hits, max_sources, max_snippet_chars)
+
+def _sources_block(hits: list[dict], max_sources: int = 5, max_snippet_chars: int = 160) -> str:
+    """The "\n\nSources:\n..." tail on its own (empty without hits), so streamed answers can end with it."""
     if not hits:
-        return answer.strip()
+        return ""
 
     lines = []
     used = 0
@@ -172,8 +478,7 @@ def _format_answer_with_sources(answer: str, hits: list[dict], max_sources: int
             break
 
     return (
-        answer.strip()
-        + "\n\n"
+        "\n\n"
         + "Sources:\n"
         + "\n".join(lines)
-    )
\ No newline at end of file
+    )
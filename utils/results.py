@@ -0,0 +1,45 @@
+# utils/results.py
+"""
+Helpers for assembling Chroma-style get()/query() result dicts from several parts
+(shards in utils.shards, stored chunks plus resolved references in utils.dedup).
+"""
+from typing import Any, Dict, List, Sequence
+
+KEYS = ("documents", "metadatas", "embeddings", "distances")
+
+def concat(parts: List[Dict[str, Any]], include: Sequence[str]) -> Dict[str, Any]:
+    """One get() result holding every part's rows, in order."""
+    res: Dict[str, Any] = {"ids": []}
+    for key in KEYS:
+        res[key] = [] if key in include else None
+    for p in parts:
+        res["ids"].extend(p.get("ids") or [])
+        for key in KEYS:
+            if res[key] is not None and p.get(key) is not None:
+                res[key].extend(list(p[key]))
+    return res
+
+def page(res: Dict[str, Any], offset: int | None, limit: int | None) -> Dict[str, Any]:
+    """get()'s offset/limit applied to an assembled result."""
+    if not offset and limit is None:
+        return res
+    sl = slice(offset or 0, None if limit is None else (offset or 0) + limit)
+    return {key: (val[sl] if val is not None else None) for key, val in res.items()}
+
+def merge(parts: List[Dict[str, Any]], n_rows: int, n: int, include: Sequence[str]) -> Dict[str, Any]:
+    """Merge query results over disjoint sets of vectors into one top-n per query row, by ascending distance."""
+    res: Dict[str, Any] = {"ids": []}
+    for key in KEYS:
+        res[key] = [] if key in include else None
+    for r in range(n_rows):
+        cand = []
+        for p in parts:
+            for j, dist in enumerate(p["distances"][r]):
+                cand.append((float(dist), p, j))
+        cand.sort(key=lambda t: t[0])
+        cand = cand[:max(n, 0)]
+        res["ids"].append([p["ids"][r][j] for _, p, j in cand])
+        for key in KEYS:
+            if res[key] is not None:
+                res[key].append([p[key][r][j] for _, p, j in cand])
+    return res
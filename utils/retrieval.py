@@ -1,12 +1,30 @@
 # utils/retrieval.py
-from typing import Any, Dict, List
+import json
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from config import MMR_POOL
+from utils import planner, trace
 
 def list_call_ids(coll) -> List[str]:
+    if hasattr(coll, "call_ids"):  # flat backend: read the call column, no metadata decoding
+        return coll.call_ids()
     data = coll.get(include=["metadatas"])
     metas = data.get("metadatas") or []
     call_ids = {m.get("call_id") for m in metas if isinstance(m, dict) and m.get("call_id")}
     return sorted(call_ids)
 
+def get_call_chunks(coll, call_id: str) -> List[Dict[str, Any]]:
+    """Every chunk of one call as hits (score None), in transcript order."""
+    res = coll.get(where={"call_id": call_id}, include=["documents", "metadatas"])
+    hits = [
+        {"id": cid, "text": doc, "meta": meta or {}, "score": None}
+        for cid, doc, meta in zip(res.get("ids") or [], res.get("documents") or [], res.get("metadatas") or [])
+    ]
+    hits.sort(key=lambda h: h["meta"].get("seg_start_idx", 0))
+    return hits
+
 def _to_chroma_where(where: Dict[str, Any] | None):
     """
     Normalize filters for Chroma.
@@ -24,40 +42,239 @@ def _to_chroma_where(where: Dict[str, Any] | None):
         return {k: v}
     return {"$and": [{k: v} for k, v in where.items()]}
 
-def _to_hits(res) -> List[Dict[str, Any]]:
-    docs = (res.get("documents") or [[]])[0]
-    metas = (res.get("metadatas") or [[]])[0]
-    dists = (res.get("distances") or [[]])[0]
+def _to_hits(res, row: int = 0) -> List[Dict[str, Any]]:
+    def col(name):
+        rows = res.get(name) or []
+        return rows[row] if row < len(rows) else []
+    ids, docs, metas, dists = col("ids"), col("documents"), col("metadatas"), col("distances")
     # score = 1 - distance (when available)
     hits: List[Dict[str, Any]] = []
-    for doc, meta, dist in zip(docs, metas, dists):
+    ids = list(ids) + [None] * (len(docs) - len(ids))
+    for cid, doc, meta, dist in zip(ids, docs, metas, dists):
         try:
             score = 1.0 - float(dist)
         except Exception:
             score = None
-        hits.append({"id": None, "text": doc, "meta": meta, "score": score})
+        hits.append({"id": cid, "text": doc, "meta": meta, "score": score})
     return hits
 
-def search(coll, q: str, k: int = 6, where: Dict[str, Any] | None = None) -> List[Dict[str, Any]]:
+# Reciprocal-rank fusion constant (Cormack et al.): dampens the head of each ranking
+RRF_K = 60
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+
+def search(
+    coll,
+    q: str,
+    k: int = 6,
+    where: Dict[str, Any] | None = None,
+    cache=None,
+    mode: str = "vector",
+    lexical=None,
+    stats=None,
+    diversity: float = 0.0,
+) -> List[Dict[str, Any]]:
     """
     Return flat hits: [{'id': ..., 'text': ..., 'meta': {...}, 'score': float}, ...]
-    Tries a filtered query first; if it yields 0, falls back to unfiltered and
-    filters in Python (handles Chroma filter quirks).
+    Filtered vector queries go through utils.planner: selective filters are scored
+    exhaustively by id, broad ones over-fetch from the index filter; pass
+    `stats` (a planner.CatalogStats) so it can estimate how many chunks match.
+    Pass a utils.cache.RetrievalCache as `cache` to memoize results per index version.
+
+    mode: "vector" (embeddings), "lexical" (BM25 via `lexical`, a utils.lexical.LexicalIndex)
+    or "hybrid" (both, fused by reciprocal rank; score is then the RRF score).
+    Without a non-empty lexical index, or one that can't apply `where` (a tag added to
+    tags.toml since it was built), every mode degrades to "vector".
+
+    diversity > 0 re-ranks MMR_POOL×k candidates by maximal marginal relevance over
+    their stored embeddings (one extra coll.get): 0 ranks by relevance only, 1 by novelty only.
     """
-    include = ["documents", "metadatas", "distances"]
-    chroma_where = _to_chroma_where(where)
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"mode must be one of {SEARCH_MODES}, got {mode!r}")
+    if mode != "vector" and not _lexical_ok(lexical, [where]):
+        mode = "vector"
+    with trace.span("retrieval.search", mode=mode, k=k, filtered=bool(where)):
+        if cache is not None:
+            key = cache.key(q, where, k, mode=mode, diversity=diversity)
+            cached = cache.get(key)
+            trace.count("retrieval_cache.hits" if cached is not None else "retrieval_cache.misses")
+            if cached is not None:
+                return cached
+            hits = _diverse(coll, q, k, where, mode, lexical, stats, diversity)
+            cache.put(key, hits)
+            return hits
+        return _diverse(coll, q, k, where, mode, lexical, stats, diversity)
+
+def _lexical_ok(lexical, wheres) -> bool:
+    if lexical is None or not len(lexical):
+        return False
+    if all(lexical.can_filter(w) for w in wheres):
+        return True
+    trace.count("retrieval.lexical_unfilterable")
+    return False
+
+def _diverse(coll, q: str, k: int, where, mode: str, lexical, stats, diversity: float) -> List[Dict[str, Any]]:
+    if diversity <= 0:
+        return _dispatch(coll, q, k, where, mode, lexical, stats)
+    return mmr(coll, _dispatch(coll, q, k * MMR_POOL, where, mode, lexical, stats), k, diversity)
+
+def mmr(coll, hits: List[Dict[str, Any]], k: int, diversity: float) -> List[Dict[str, Any]]:
+    """
+    Greedy maximal marginal relevance: repeatedly take the hit maximizing
+    (1 - diversity) * relevance - diversity * (max cosine similarity to those taken).
+    Relevance is the hit score min-max scaled to [0, 1], so RRF and cosine scores
+    weigh the same. Hits keep their own scores.
+    """
+    if len(hits) <= 1:
+        return hits[:k]
+    with trace.span("retrieval.mmr", n=len(hits), k=k):
+        res = coll.get(ids=[h["id"] for h in hits], include=["embeddings"])
+        by_id = {cid: e for cid, e in zip(res["ids"], res["embeddings"])}
+        hits = [h for h in hits if h["id"] in by_id]
+        if not hits:
+            return []
+        vec = np.asarray([by_id[h["id"]] for h in hits], dtype=np.float32)
+        vec /= np.maximum(np.linalg.norm(vec, axis=1, keepdims=True), 1e-12)
+        rel = np.asarray([h.get("score") or 0.0 for h in hits], dtype=np.float64)
+        rel = (rel - rel.min()) / (rel.max() - rel.min()) if rel.max() > rel.min() else np.ones_like(rel)
+        sim = vec @ vec.T
+        chosen = [int(np.argmax(rel))]
+        nearest = sim[chosen[0]].astype(np.float64)
+        left = np.ones(len(hits), dtype=bool)
+        left[chosen[0]] = False
+        while len(chosen) < min(k, len(hits)):
+            gain = np.where(left, (1.0 - diversity) * rel - diversity * nearest, -np.inf)
+            i = int(np.argmax(gain))
+            chosen.append(i)
+            left[i] = False
+            nearest = np.maximum(nearest, sim[i])
+    return [hits[i] for i in chosen]
+
+def _dispatch(coll, q: str, k: int, where, mode: str, lexical, stats=None) -> List[Dict[str, Any]]:
+    if mode == "vector":
+        return _search(coll, q, k=k, where=where, stats=stats)
+    if mode == "lexical":
+        return _lexical_search(coll, lexical, q, k, where)
+    # hybrid: over-fetch both rankings so fusion has room to reorder
+    n = max(3 * k, 20)
+    return _rrf([_search(coll, q, k=n, where=where, stats=stats), _lexical_search(coll, lexical, q, n, where)], k)
+
+# Texts per coll.query call in search_many (bounds the embedding batch)
+QUERY_BATCH = 256
+
+def search_many(
+    coll,
+    queries: Sequence[Tuple[str, Dict[str, Any] | None]],
+    k: int = 6,
+    cache=None,
+    mode: str = "vector",
+    lexical=None,
+    stats=None,
+) -> List[List[Dict[str, Any]]]:
+    """
+    search() for many (q, where) pairs at once; results come back in input order.
+    Cache hits are served first; the remaining vector lookups go out as one
+    coll.query(query_texts=[...]) per distinct filter, so the embedding model
+    sees whole batches instead of one text per call.
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"mode must be one of {SEARCH_MODES}, got {mode!r}")
+    if mode != "vector" and not _lexical_ok(lexical, [where for _, where in queries]):
+        mode = "vector"
+    with trace.span("retrieval.search_many", mode=mode, k=k, queries=len(queries)):
+        return _search_many(coll, queries, k, cache, mode, lexical, stats)
+
+def _search_many(coll, queries, k, cache, mode, lexical, stats=None) -> List[List[Dict[str, Any]]]:
+    out: List[List[Dict[str, Any]] | None] = [None] * len(queries)
+    keys: List[str] = [""] * len(queries)
+    todo: List[int] = []
+    for i, (q, where) in enumerate(queries):
+        if cache is not None:
+            keys[i] = cache.key(q, where, k, mode=mode)
+            cached = cache.get(keys[i])
+            trace.count("retrieval_cache.hits" if cached is not None else "retrieval_cache.misses")
+            if cached is not None:
+                out[i] = cached
+                continue
+        todo.append(i)
 
-    # 1) try with filter (if any)
-    res = coll.query(query_texts=[q], n_results=k, where=chroma_where, include=include)
-    hits = _to_hits(res)
+    n = k if mode == "vector" else max(3 * k, 20)
+    vec: Dict[int, List[Dict[str, Any]]] = {}
+    if mode != "lexical":
+        groups: Dict[str, List[int]] = {}
+        for i in todo:
+            groups.setdefault(json.dumps(queries[i][1] or {}, sort_keys=True, default=str), []).append(i)
+        for idxs in groups.values():
+            where = queries[idxs[0]][1]
+            for s in range(0, len(idxs), QUERY_BATCH):
+                part = idxs[s:s + QUERY_BATCH]
+                vec.update(zip(part, _search_batch(coll, [queries[i][0] for i in part], n, where, stats)))
 
-    # 2) fallback: if asked for a specific call_id and nothing came back, query
-    #    without a filter and then filter in Python.
-    if (not hits) and where and isinstance(where, dict) and "call_id" in where:
-        unfiltered = coll.query(query_texts=[q], n_results=max(k, 12), include=include)
-        uf_hits = _to_hits(unfiltered)
-        call_id = where["call_id"]
-        hits = [h for h in uf_hits if isinstance(h.get("meta"), dict) and h["meta"].get("call_id") == call_id]
-        hits = hits[:k]
+    for i in todo:
+        q, where = queries[i]
+        if mode == "vector":
+            hits = vec[i]
+        elif mode == "lexical":
+            hits = _lexical_search(coll, lexical, q, k, where)
+        else:
+            hits = _rrf([vec[i], _lexical_search(coll, lexical, q, n, where)], k)
+        out[i] = hits
+        if cache is not None:
+            cache.put(keys[i], hits)
+    return out  # type: ignore[return-value]
 
+def _lexical_search(coll, lexical, q: str, k: int, where) -> List[Dict[str, Any]]:
+    with trace.span("retrieval.bm25"):
+        ranked = lexical.search(q, k=k, where=where)
+    if not ranked:
+        return []
+    with trace.span("retrieval.fetch_docs"):
+        res = coll.get(ids=[cid for cid, _ in ranked], include=["documents", "metadatas"])
+    by_id = {cid: (doc, meta) for cid, doc, meta in zip(res["ids"], res["documents"], res["metadatas"])}
+    if not any(key == "call_id" for key, _ in planner.conjuncts(where)):
+        # near-duplicate references (utils.dedup) only stand in for their call; elsewhere the canonical does
+        by_id = {cid: dm for cid, dm in by_id.items() if "dup_of" not in (dm[1] or {})}
+    hits = []
+    for cid, score in ranked:
+        if cid in by_id:  # the index may briefly lag a concurrent delete
+            doc, meta = by_id[cid]
+            hits.append({"id": cid, "text": doc, "meta": meta, "score": score})
     return hits
+
+def _rrf(rankings: List[List[Dict[str, Any]]], k: int) -> List[Dict[str, Any]]:
+    fused: Dict[str, float] = {}
+    first: Dict[str, Dict[str, Any]] = {}
+    for hits in rankings:
+        for rank, h in enumerate(hits, start=1):
+            fused[h["id"]] = fused.get(h["id"], 0.0) + 1.0 / (RRF_K + rank)
+            first.setdefault(h["id"], h)
+    order = sorted(fused, key=lambda cid: -fused[cid])[:k]
+    return [{**first[cid], "score": fused[cid]} for cid in order]
+
+def _search(coll, q: str, k: int, where: Dict[str, Any] | None, stats=None) -> List[Dict[str, Any]]:
+    return _search_batch(coll, [q], k, where, stats)[0]
+
+def _search_batch(coll, qs: List[str], k: int, where: Dict[str, Any] | None, stats=None) -> List[List[Dict[str, Any]]]:
+    include = ["documents", "metadatas", "distances"]
+    chroma_where = _to_chroma_where(where)
+    p = planner.plan(coll, where, k, stats)
+    trace.count(f"planner.{p.strategy}")
+    if p.strategy == "exhaustive":
+        out = planner.score_exhaustive(coll, qs, k, where, chroma_where)
+        if out is not None:
+            return out
+        # no embedding function to embed the queries with (embed=False): use the index filter
+    res = _query(coll, qs, p.n_results, chroma_where, include, "retrieval.vector_query")
+    return [_to_hits(res, row)[:k] for row in range(len(qs))]
+
+def _query(coll, qs: List[str], k: int, where, include: List[str], name: str):
+    if not trace.enabled():
+        return coll.query(query_texts=qs, n_results=k, where=where, include=include)
+    # profiling: embed here (same function Chroma would call) so model time and HNSW time show separately
+    ef = getattr(coll, "_embedding_function", None)
+    with trace.span(name, n=len(qs)):
+        if ef is None:
+            return coll.query(query_texts=qs, n_results=k, where=where, include=include)
+        with trace.span("retrieval.embed_query"):
+            emb = ef(qs)
+        with trace.span("retrieval.hnsw"):
+            return coll.query(query_embeddings=emb, n_results=k, where=where, include=include)
@@ -0,0 +1,231 @@
+# utils/segstore.py
+"""
+Per-call segment files: every transcript line (timestamp, speaker, text, flags), so
+hits can be widened to their neighbouring lines without another vector query.
+
+One file per call (<dir>/<call_id>.seg), little-endian:
+  header   b"SEG1", n (u32), blob_start (u64)
+  offsets  u64[n + 1]   byte offset of record i in the blob (offsets[n] = blob length)
+  flags    u32[n]       Segment.flags bitmasks
+  blob     record i = timestamp \\x1f speaker \\x1f text \\x1e  (UTF-8)
+Files are opened with mmap and the offset/flag tables are numpy views of the mapping,
+so reading segments [i, j) touches one contiguous byte range and copies nothing
+until that range is decoded. Writes go to a temp file and are swapped in with
+os.replace, so a reader holds either the old mapping or the new one.
+"""
+import mmap, os, pathlib, shutil, struct, tempfile, threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+from utils.ingestion import Segment
+from utils import trace
+
+MAGIC = b"SEG1"
+_HEADER = struct.Struct("<4sIQ")
+_FIELD, _RECORD = "\x1f", "\x1e"
+
+def _encode(seg: Segment) -> bytes:
+    # separators can't occur in parsed lines (LINE_RE fields are stripped single lines)
+    return f"{seg.timestamp}{_FIELD}{seg.speaker}{_FIELD}{seg.text}{_RECORD}".encode("utf-8")
+
+class SegmentFile:
+    """Read-only mmap view of one call's segment file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self.stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, blob = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path}: not a segment file")
+        self.n, self._blob = n, blob
+        self.offsets = np.frombuffer(self._mm, dtype="<u8", count=n + 1, offset=_HEADER.size)
+        self.flags = np.frombuffer(self._mm, dtype="<u4", count=n, offset=_HEADER.size + 8 * (n + 1))
+
+    def __len__(self) -> int:
+        return self.n
+
+    def raw(self, start: int, end: int) -> memoryview:
+        """Encoded records [start, end) as a view into the mapping (no copy)."""
+        start, end = max(0, start), min(self.n, end)
+        if start >= end:
+            return memoryview(b"")
+        return memoryview(self._mm)[self._blob + int(self.offsets[start]):self._blob + int(self.offsets[end])]
+
+    def segments(self, call_id: str, start: int = 0, end: int | None = None) -> List[Segment]:
+        start, end = max(0, start), self.n if end is None else min(self.n, end)
+        recs = str(self.raw(start, end), "utf-8").split(_RECORD)[:-1]
+        return [Segment(call_id, start + i, *rec.split(_FIELD, 2), int(self.flags[start + i]))
+                for i, rec in enumerate(recs)]
+
+class SegmentStore:
+    """
+    Directory of per-call segment files. Open files are cached (LRU, `max_open`) and
+    reopened when the file on disk was replaced, so a long-running server sees what
+    ingest/watch wrote. Evicted mappings are only dropped, never closed: a reader on
+    another thread may still be using one, and it is unmapped when the last one lets go.
+    """
+
+    def __init__(self, root: str, max_open: int = 64):
+        self.root = pathlib.Path(root)
+        self.max_open = max_open
+        self._open: "OrderedDict[str, SegmentFile]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, call_id: str) -> pathlib.Path:
+        return self.root / f"{call_id}.seg"
+
+    def has(self, call_id: str, n: int = 0) -> bool:
+        """True if the call's file exists and holds at least `n` segments."""
+        f = self.open(call_id)
+        return f is not None and len(f) >= n
+
+    def call_ids(self) -> List[str]:
+        if not self.root.is_dir():
+            return []
+        return sorted(p.stem for p in self.root.glob("*.seg"))
+
+    def open(self, call_id: str) -> SegmentFile | None:
+        p = self.path(call_id)
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            self._evict(call_id)
+            return None
+        with self._lock:
+            f = self._open.get(call_id)
+            if f is not None and f.stamp == (st.st_ino, st.st_mtime_ns, st.st_size):
+                self._open.move_to_end(call_id)
+                return f
+        f = SegmentFile(str(p))
+        with self._lock:
+            self._open.pop(call_id, None)
+            self._open[call_id] = f
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return f
+
+    def _evict(self, call_id: str) -> None:
+        with self._lock:
+            self._open.pop(call_id, None)
+
+    def write(self, call_id: str, segs: Iterable[Segment], keep: int = 0) -> int:
+        """
+        Replace the call's file with its first `keep` stored segments followed by `segs`
+        (watch rewrites only the tail it re-read). The blob is spooled to a temp file, so
+        memory stays flat for long calls. Returns the segment count.
+        """
+        w = self.writer(call_id, keep)
+        for s in segs:
+            w.add(s)
+        return w.install()
+
+    def writer(self, call_id: str, keep: int = 0) -> "SegmentWriter":
+        """A SegmentWriter for the call, starting from its first `keep` stored segments."""
+        w = SegmentWriter(str(self.path(call_id)))
+        if keep:
+            old = self.open(call_id)
+            if old is None or len(old) < keep:
+                w.discard()
+                raise ValueError(f"{call_id}: {keep} segments to keep, {len(old) if old else 0} stored")
+            w.blob.write(old.raw(0, keep))
+            w.offsets = old.offsets[:keep + 1].tolist()
+            w.flags = old.flags[:keep].tolist()
+        return w
+
+    def delete(self, call_id: str) -> bool:
+        self._evict(call_id)
+        try:
+            self.path(call_id).unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+class SegmentWriter:
+    """
+    One call's segment file, built from segments added one at a time (so it can ride
+    along the ingest parse stream) and swapped in by install(). finish() turns the
+    spooled records into a complete temp file next to the target; pickling finishes
+    first, so a parse worker process can build the file and hand it back.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.blob = tempfile.TemporaryFile(dir=os.path.dirname(path))
+        self.offsets: List[int] = [0]
+        self.flags: List[int] = []
+        self.n = 0
+        self.tmp: str | None = None
+
+    def add(self, s: Segment) -> None:
+        data = _encode(s)
+        self.blob.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+        self.flags.append(s.flags)
+
+    def finish(self) -> str:
+        if self.tmp is None:
+            self.n = len(self.flags)
+            tables = np.asarray(self.offsets, dtype="<u8").tobytes() + np.asarray(self.flags, dtype="<u4").tobytes()
+            fd, self.tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as out, self.blob:
+                out.write(_HEADER.pack(MAGIC, self.n, _HEADER.size + len(tables)))
+                out.write(tables)
+                self.blob.seek(0)
+                shutil.copyfileobj(self.blob, out)
+            self.blob, self.offsets, self.flags = None, [], []
+        return self.tmp
+
+    def install(self) -> int:
+        """Swap the finished file in for the call's; returns the segment count."""
+        os.replace(self.finish(), self.path)
+        return self.n
+
+    def discard(self) -> None:
+        if self.blob is not None:
+            self.blob.close()
+            self.blob = None
+        if self.tmp is not None:
+            try:
+                os.unlink(self.tmp)
+            except FileNotFoundError:
+                pass
+
+    def __getstate__(self) -> Dict[str, Any]:
+        self.finish()
+        return {"path": self.path, "n": self.n, "tmp": self.tmp}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state, blob=None, offsets=[], flags=[])
+
+def expand_hits(hits: List[Dict[str, Any]], store: SegmentStore, n: int) -> List[Dict[str, Any]]:
+    """
+    Copies of `hits` whose text spans n more segments on each side of their
+    seg_start_idx/seg_end_idx range, read from `store`; meta's range and timestamps are
+    widened to match, so context.pack drops windows another hit already covers. Hits
+    without a range, or whose call has no (or too short a) segment file, are kept as is.
+    """
+    if n <= 0:
+        return hits
+    with trace.span("segments.expand", n=n):
+        return [_expand(h, store, n) for h in hits]
+
+def _expand(h: Dict[str, Any], store: SegmentStore, n: int) -> Dict[str, Any]:
+    m = h.get("meta") or {}
+    s, e, call = m.get("seg_start_idx"), m.get("seg_end_idx"), m.get("call_id")
+    f = store.open(call) if call and s is not None and e is not None else None
+    if f is None or int(e) >= len(f):
+        return h
+    lo, hi = max(0, int(s) - n), min(len(f), int(e) + n + 1)
+    segs = f.segments(call, lo, hi)
+    trace.count("segments.expanded", len(segs))
+    return {**h, "text": "\n".join(f"[{x.timestamp}] {x.speaker}: {x.text}" for x in segs),
+            "meta": {**m, "seg_start_idx": lo, "seg_end_idx": hi - 1,
+                     "start_ts": segs[0].timestamp, "end_ts": segs[-1].timestamp,
+                     "hit_start_idx": int(s), "hit_end_idx": int(e)}}
@@ -0,0 +1,168 @@
+# utils/server.py
+"""
+Long-running local query server: keeps the collection, embedding model and LLM client warm.
+
+Endpoints (JSON in/out):
+  GET  /health
+  GET  /list
+  GET  /calls      catalog rows (counts, time range, flag counts)
+  GET  /stats      cache hit/miss counters
+  POST /search     {"q", "k", "where", "mode", "expand", "diversity"}              -> {"hits": [...]}
+  POST /ask        {"q", "k", "where", "mode", "no_cache", "expand", "diversity"}  -> {"answer": str, "context": ...,
+                   "hit_ids", "retrieval_ms", "llm_ms", "attempts", "cached"}
+  POST /summarize  {"call_id", "k", "no_cache", "full"}    -> {"summary": str, "context": packing stats}
+"expand": N widens each hit by N neighbouring segments from the segment store;
+"diversity" (0-1) re-ranks hits by MMR (retrieval.search).
+Errors come back as {"error": str} with a 4xx/5xx status.
+"""
+import json, sys, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, Dict
+
+from utils.planner import CatalogStats
+from utils.retrieval import list_call_ids, search, get_call_chunks
+from utils.prompts import ask_qa, summarize_call, summarize_call_full
+from utils.segstore import expand_hits
+
+class NotFound(Exception):
+    pass
+
+# Each op gets the server (for .coll / .cache / .catalog / .lexical / .segments) and the decoded JSON body
+
+def _has_catalog(srv) -> bool:
+    return srv.catalog is not None and len(srv.catalog) > 0
+
+def _check_call_id(srv, call_id: str | None, message: str) -> None:
+    if call_id and _has_catalog(srv) and not srv.catalog.has(call_id):
+        raise NotFound(message)
+
+def _op_list(srv, body: Dict[str, Any]) -> Dict[str, Any]:
+    if _has_catalog(srv):
+        return {"call_ids": srv.catalog.call_ids()}
+    return {"call_ids": list_call_ids(srv.coll)}
+
+def _op_calls(srv, body: Dict[str, Any]) -> Dict[str, Any]:
+    if _has_catalog(srv):
+        return {"calls": srv.catalog.rows()}
+    return {"calls": [{"call_id": cid} for cid in list_call_ids(srv.coll)]}
+
+def _op_stats(srv, body: Dict[str, Any]) -> Dict[str, Any]:
+    return {"retrieval_cache": srv.cache.stats() if srv.cache is not None else None}
+
+def _lexical(srv):
+    # pick up a lexical index saved by an ingest running in another process
+    if srv.lexical is not None:
+        srv.lexical = srv.lexical.refresh()
+    return srv.lexical
+
+def _expand(srv, hits, body: Dict[str, Any]):
+    n = int(body.get("expand") or 0)
+    if n and srv.segments is None:
+        raise ValueError("this server has no segment store to expand hits from")
+    return expand_hits(hits, srv.segments, n) if n else hits
+
+def _op_search(srv, body: Dict[str, Any]) -> Dict[str, Any]:
+    hits = search(srv.coll, body["q"], k=int(body.get("k", 6)), where=body.get("where") or None, cache=srv.cache,
+                  mode=body.get("mode", "vector"), lexical=_lexical(srv), stats=srv.stats,
+                  diversity=float(body.get("diversity") or 0.0))
+    return {"hits": _expand(srv, hits, body)}
+
+def _op_ask(srv, body: Dict[str, Any]) -> Dict[str, Any]:
+    q = body["q"]
+    no_cache = bool(body.get("no_cache"))
+    where = body.get("where") or {}
+    _check_call_id(srv, where.get("call_id"), f"Unknown call_id '{where.get('call_id')}'.")
+    t = time.perf_counter()
+    hits = search(srv.coll, q, k=int(body.get("k", 6)), where=where or None,
+                  cache=None if no_cache else srv.cache, mode=body.get("mode", "hybrid"), lexical=_lexical(srv),
+                  stats=srv.stats, diversity=float(body.get("diversity") or 0.0))
+    if not hits:
+        raise NotFound("No matches found. Try increasing --k or removing filters.")
+    hits = _expand(srv, hits, body)
+    retrieval_ms = round((time.perf_counter() - t) * 1000, 1)
+    info: Dict[str, Any] = {}
+    answer = ask_qa(q, hits, use_cache=not no_cache, info=info)
+    return {"answer": answer, "context": info.get("context"), "hit_ids": [h.get("id") for h in hits],
+            "retrieval_ms": retrieval_ms, "llm_ms": info.get("llm_ms", 0.0), "attempts": info.get("attempts", 0),
+            "cached": info.get("cached", False)}
+
+def _op_summarize(srv, body: Dict[str, Any]) -> Dict[str, Any]:
+    call_id = body["call_id"]
+    no_cache = bool(body.get("no_cache"))
+    _check_call_id(srv, call_id, f"No chunks found for call_id '{call_id}'.")
+    if body.get("full"):
+        hits = get_call_chunks(srv.coll, call_id)
+    else:
+        hits = search(srv.coll, f"summary of {call_id}", k=int(body.get("k", 12)),
+                      where={"call_id": call_id}, cache=None if no_cache else srv.cache, stats=srv.stats)
+    if not hits:
+        raise NotFound(f"No chunks found for call_id '{call_id}'.")
+    summarize = summarize_call_full if body.get("full") else summarize_call
+    info: Dict[str, Any] = {}
+    summary = summarize(call_id, hits, use_cache=not no_cache, info=info)
+    return {"summary": summary, "context": info.get("context")}
+
+ROUTES = {
+    ("GET", "/health"): lambda srv, body: {"ok": True},
+    ("GET", "/list"): _op_list,
+    ("GET", "/calls"): _op_calls,
+    ("GET", "/stats"): _op_stats,
+    ("POST", "/search"): _op_search,
+    ("POST", "/ask"): _op_ask,
+    ("POST", "/summarize"): _op_summarize,
+}
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "CallCopilot/0.1"
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method: str) -> None:
+        op = ROUTES.get((method, self.path.split("?", 1)[0]))
+        if op is None:
+            self._send(404, {"error": f"unknown endpoint {method} {self.path}"})
+            return
+        try:
+            n = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(n) or b"{}") if n else {}
+            self._send(200, op(self.server, body))
+        except NotFound as e:
+            self._send(404, {"error": str(e)})
+        except (KeyError, ValueError, TypeError) as e:
+            self._send(400, {"error": f"bad request: {e.__class__.__name__}: {e}"})
+        except Exception as e:
+            self._send(500, {"error": f"{e.__class__.__name__}: {e}"})
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            sys.stderr.write(f"[{time.strftime('%H:%M:%S')}] {self.address_string()} {fmt % args}\n")
+
+def make_server(coll, host: str = "127.0.0.1", port: int = 8765, verbose: bool = False,
+                cache=None, catalog=None, lexical=None, segments=None) -> ThreadingHTTPServer:
+    """
+    Build a threaded server bound to `coll` (one thread per request; the collection,
+    embedding function and LLM client are shared and thread-safe for reads).
+    """
+    srv = ThreadingHTTPServer((host, port), _Handler)
+    srv.daemon_threads = True
+    srv.coll = coll
+    srv.cache = cache
+    srv.catalog = catalog
+    srv.stats = CatalogStats(catalog) if catalog is not None else None
+    srv.lexical = lexical
+    srv.segments = segments
+    srv.verbose = verbose
+    return srv
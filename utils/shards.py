@@ -0,0 +1,200 @@
+# utils/shards.py
+"""
+Hash-partitioned vector store: VECTOR_SHARDS=N (> 1) splits the index into N
+collections named calls_s00of04, calls_s01of04, ... Each shard holds whole calls:
+shard = crc32(call_id) % N.
+
+ShardedCollection is a drop-in for the Collection API subset this repo uses (like
+utils.flatindex), so search(), the planner, ingest, watch and the server work
+unchanged on top of it:
+  - anything naming calls (where={"call_id": ...} or {"$in": [...]}, chunk ids,
+    which start with their call_id) goes to the owning shard(s) only;
+  - other queries fan out to every shard on a thread pool and the per-shard
+    top-n lists are merged by distance (exact: the global top-n is in the union);
+  - query texts are embedded once up front, not once per shard.
+
+Shards open on first use and at most `max_open` (SHARD_MAX_OPEN) stay open: the
+least recently used ones are dropped, which unmaps a flat shard's files (shards
+with unsaved writes stay until save()). A Chroma client keeps loaded segments
+itself, so for Chroma set SHARD_CACHE_BYTES to give it an LRU segment cache with
+that memory limit instead.
+
+The shard count is part of the names, so a new count starts from empty shards;
+ingest records the layout in its manifest and re-embeds when it changes.
+"""
+import contextvars, threading, zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Sequence
+
+import numpy as np
+
+from utils import trace
+from utils.planner import conjuncts
+from utils.results import concat, merge, page
+
+def shard_names(name: str, n: int) -> List[str]:
+    return [f"{name}_s{i:02d}of{n:02d}" for i in range(n)]
+
+def shard_of(call_id: str, n: int) -> int:
+    return zlib.crc32(call_id.encode("utf-8")) % n
+
+def call_of(chunk_id: str) -> str:
+    """The call_id a chunk id starts with (utils.ingestion.chunk_id: call_id:start-end:hash)."""
+    return chunk_id.rsplit(":", 2)[0]
+
+class ShardedCollection:
+    def __init__(self, opener: Callable[[str], Any], n: int, name: str = "calls", embedding_function=None,
+                 workers: int = 4, max_open: int = 0, exact_filters: bool = False):
+        if n < 1:
+            raise ValueError(f"need at least one shard, got {n}")
+        self.n = n
+        self.name = name
+        self.names = shard_names(name, n)
+        self.exact_filters = exact_filters  # shards' filters are exact (flat): the planner passes through
+        self._embedding_function = embedding_function
+        self._opener = opener
+        self._max_open = max_open
+        self._open: "OrderedDict[int, Any]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._pool: ThreadPoolExecutor | None = None
+        self._workers = max(1, min(workers, n))
+
+    # ---- shard handles ----
+    def shard(self, i: int):
+        with self._lock:
+            coll = self._open.get(i)
+            if coll is not None:
+                self._open.move_to_end(i)
+                return coll
+            with trace.span("shards.open", shard=i):
+                coll = self._open[i] = self._opener(self.names[i])
+            trace.count("shards.opened")
+            if self._max_open and len(self._open) > self._max_open:
+                # shards with staged (unsaved) flat writes stay until save(): a writer may still hold them
+                for j in [j for j, c in self._open.items() if j != i and not getattr(c, "dirty", False)]:
+                    if len(self._open) <= self._max_open:
+                        break
+                    del self._open[j]
+            return coll
+
+    def loaded(self) -> List[int]:
+        with self._lock:
+            return list(self._open)
+
+    def release(self) -> None:
+        """Flush and drop every open shard (they reopen on next use)."""
+        with self._lock:
+            self.save()
+            self._open.clear()
+
+    def _targets(self, where: Dict[str, Any] | None) -> List[int]:
+        for key, val in conjuncts(where):
+            if key != "call_id":
+                continue
+            if isinstance(val, str):
+                return [shard_of(val, self.n)]
+            if isinstance(val, dict) and isinstance(val.get("$in"), list):
+                return sorted({shard_of(str(v), self.n) for v in val["$in"]})
+        return list(range(self.n))
+
+    def _by_shard(self, ids: Sequence[str]) -> Dict[int, List[str]]:
+        out: Dict[int, List[str]] = {}
+        for cid in ids:
+            out.setdefault(shard_of(call_of(cid), self.n), []).append(cid)
+        return out
+
+    def _map(self, fn: Callable[[Any], Any], shards: List[int]) -> List[Any]:
+        """fn(shard collection) for each shard index, in parallel when there is more than one; results in order."""
+        if len(shards) <= 1:
+            return [fn(self.shard(i)) for i in shards]
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="shard")
+        # each task runs in a copy of this context so its spans nest under the caller's
+        futs = [self._pool.submit(contextvars.copy_context().run, lambda i=i: fn(self.shard(i))) for i in shards]
+        return [f.result() for f in futs]
+
+    # ---- Collection API ----
+    def count(self) -> int:
+        return sum(self._map(lambda c: c.count(), list(range(self.n))))
+
+    def call_ids(self) -> List[str]:
+        from utils.retrieval import list_call_ids
+        return sorted({cid for ids in self._map(list_call_ids, list(range(self.n))) for cid in ids})
+
+    def save(self, compact: bool = False) -> None:
+        """Flush open flat shards; compact=True opens and compacts every shard (flat.save(compact=True))."""
+        shards = range(self.n) if compact else list(self._open)
+        for i in shards:
+            coll = self.shard(i)
+            save = getattr(coll, "save", None)
+            if callable(save):
+                save(compact=True) if compact else save()
+
+    def upsert(self, ids: Sequence[str], documents: Sequence[str] | None = None,
+               metadatas: Sequence[Dict[str, Any]] | None = None, embeddings=None, **_) -> None:
+        groups: Dict[int, List[int]] = {}
+        for j, cid in enumerate(ids):
+            call_id = (metadatas[j] or {}).get("call_id") if metadatas is not None else None
+            groups.setdefault(shard_of(call_id or call_of(cid), self.n), []).append(j)
+        for i, rows in groups.items():
+            pick = lambda seq: [seq[j] for j in rows] if seq is not None else None
+            self.shard(i).upsert(ids=pick(ids), documents=pick(documents), metadatas=pick(metadatas),
+                                 embeddings=pick(embeddings))
+
+    def delete(self, ids: Sequence[str] | None = None, where: Dict[str, Any] | None = None, **_) -> None:
+        if ids is not None:
+            for i, part in self._by_shard(list(ids)).items():
+                self.shard(i).delete(ids=part, where=where)
+            return
+        for i in self._targets(where):
+            self.shard(i).delete(where=where)
+
+    def get(self, ids: Sequence[str] | None = None, where: Dict[str, Any] | None = None, limit: int | None = None,
+            offset: int | None = None, include: Sequence[str] = ("documents", "metadatas"), **_) -> Dict[str, Any]:
+        if ids is not None:
+            groups = self._by_shard(list(ids))
+            parts = [self.shard(i).get(ids=part, where=where, include=include) for i, part in groups.items()]
+            return page(concat(parts, include), offset, limit)
+        shards = self._targets(where)
+        if where is not None or (offset is None and limit is None):
+            res = concat(self._map(lambda c: c.get(where=where, include=include), shards), include)
+            return page(res, offset, limit)
+        # unfiltered paging (backfill_lexical): walk the shards in order, skipping whole ones by count
+        skip, left, parts = offset or 0, limit, []
+        for i in shards:
+            if left is not None and left <= 0:
+                break
+            coll = self.shard(i)
+            n = coll.count()
+            if skip >= n:
+                skip -= n
+                continue
+            part = coll.get(include=include, offset=skip, limit=left)
+            skip = 0
+            parts.append(part)
+            if left is not None:
+                left -= len(part["ids"])
+        return concat(parts, include)
+
+    def query(self, query_texts: Sequence[str] | None = None, query_embeddings=None, n_results: int = 10,
+              where: Dict[str, Any] | None = None, include: Sequence[str] = ("documents", "metadatas", "distances"),
+              **_) -> Dict[str, Any]:
+        if query_embeddings is None:
+            if self._embedding_function is None:
+                raise ValueError("query_texts needs an embedding_function (open with embed=True)")
+            with trace.span("retrieval.embed_query"):
+                query_embeddings = self._embedding_function(list(query_texts or []))
+        query_embeddings = [np.asarray(q, dtype=np.float32) for q in query_embeddings]
+        shards = self._targets(where)
+        trace.count("shards.queried", len(shards))
+        want = list(dict.fromkeys(list(include) + ["distances"]))
+
+        def one(coll):
+            with trace.span("shards.query"):
+                return coll.query(query_embeddings=query_embeddings, n_results=n_results, where=where, include=want)
+
+        with trace.span("shards.fanout", shards=len(shards)):
+            parts = self._map(one, shards)
+        return merge(parts, len(query_embeddings), n_results, include)
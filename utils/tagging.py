@@ -0,0 +1,231 @@
+# utils/tagging.py
+"""
+Keyword tagging driven by tags.toml (TAGS_FILE): tag name → list of regex patterns.
+
+Tag i is bit i of Segment.flags (and of the chunk's "flags" metadata); metadata also
+exposes it as the boolean field mentions_<name>, so Chroma can filter on it.
+Tagger.bits(line) sets a tag's bit iff one of its patterns re.I-searches the line,
+scanning the line once however many tags there are.
+"""
+import hashlib, json, re, tomllib
+from collections import defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+MAX_TAGS = 32  # Segment.flags is stored as u32 (segment files, lexical index)
+_NAME_RE = re.compile(r"^[a-z][a-z0-9_]*$")
+
+# Built in, for a tree without tags.toml (the original three flags)
+DEFAULT_TAGS: Dict[str, List[str]] = {
+    "pricing": ["₹", r"\bprice", "pricing", "discount", "overage", "minute", "SKU", "TCV", "ARR", "seat"],
+    "security": ["SOC", "ISO", "pen-?test", "DPA", "GDPR", "DPDPA", "KMS", "encrypt", "SSO", "SAML", "OIDC", "SCIM",
+                 "retention"],
+    "competitor": [r"Competitor\s+[A-Z]", "Brightcall", "battle-?card"],
+}
+
+def field_for(name: str) -> str:
+    return f"mentions_{name}"
+
+_ZERO_WIDTH = ("\\b", "\\A", "^")
+_SPECIAL = set(".^$*+?{}[]()|\\")
+
+def _class_end(p: str, i: int) -> int:
+    """Index just past the "]" closing the character class opened at p[i] (len(p) if unclosed)."""
+    j = i + 1
+    if p[j:j + 1] == "^":
+        j += 1
+    if p[j:j + 1] == "]":  # a leading ] is literal
+        j += 1
+    while j < len(p) and p[j] != "]":
+        j += 2 if p[j] == "\\" else 1
+    return j + 1
+
+def _group_end(p: str, i: int) -> int:
+    """Index of the ")" closing the group opened at p[i], or -1."""
+    depth, j = 0, i
+    while j < len(p):
+        c = p[j]
+        if c == "[":
+            j = _class_end(p, j)
+            continue
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth == 0:
+                return j
+        j += 2 if c == "\\" else 1
+    return -1
+
+def _split_top(p: str) -> List[str]:
+    """p split at its top-level "|"."""
+    parts, start, j = [], 0, 0
+    while j < len(p):
+        c = p[j]
+        if c == "[":
+            j = _class_end(p, j)
+            continue
+        if c == "(":
+            j = _group_end(p, j)
+            if j < 0:
+                return [p]
+        elif c == "|":
+            parts.append(p[start:j])
+            start = j + 1
+        j += 2 if c == "\\" else 1
+    return parts + [p[start:]]
+
+# Tagger merges every pattern's anchors (the literal text each match starts with:
+# "price" for \bprice, the month names of \b(?:January|...)) into one trie-shaped
+# regex, so one zero-width finditer per line stops only where some anchor starts, and
+# only the patterns owning that anchor are tried there. Alternating whole patterns
+# would be one regex too, but re tries every alternative at every character; the trie
+# keeps the per-character cost flat as patterns are added. Patterns without a literal
+# start (a leading class or repeat) get one search each per line.
+def _anchors(p: str) -> List[str] | None:
+    """
+    Casefolded literals one of which starts every match of pattern `p`, or None. Read
+    off the pattern text: leading \\b / ^ are skipped, then literal characters (or
+    escaped punctuation) up to the first metacharacter, minus the last one if a ?, *
+    or {m,n} makes it optional; a leading group of alternatives, and top-level
+    alternation, give one anchor per alternative. Anything else has no anchor.
+    """
+    alts = _split_top(p)
+    if len(alts) > 1:
+        found = [_anchors(alt) for alt in alts]
+        return None if any(a is None for a in found) else [a for alt in found for a in alt]
+    while p.startswith(_ZERO_WIDTH):
+        p = p[1:] if p[0] == "^" else p[2:]
+    if p.startswith("("):
+        end = _group_end(p, 0)
+        if end < 0 or p[end + 1:end + 2] in ("?", "*", "{"):
+            return None
+        body = p[3:end] if p.startswith("(?:") else p[1:end]
+        return None if p.startswith("(?") and not p.startswith("(?:") else _anchors(body)
+    out, j = [], 0
+    while j < len(p):
+        c = p[j]
+        if c == "\\":
+            if j + 1 >= len(p) or p[j + 1].isalnum():  # \s, \d, \b ... are not literal text
+                break
+            out.append(p[j + 1])
+            j += 2
+        elif c in _SPECIAL:
+            break
+        else:
+            out.append(c)
+            j += 1
+    if out and p[j:j + 1] in ("?", "*", "{"):
+        out.pop()
+    text = "".join(out)
+    low = text.casefold()
+    return [low] if low and len(low) == len(text) else None
+
+def _trie_pattern(words: Sequence[str]) -> str:
+    """Regex matching the longest of `words` at a position (shared prefixes factored out)."""
+    root: dict = {}
+    for w in words:
+        node = root
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node: dict) -> str:
+        alts = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else f"(?:{'|'.join(alts)})"
+        return f"(?:{body})?" if "" in node else body
+
+    return emit(root)
+
+class Tagger:
+    """Single-pass multi-pattern matcher: bits(text) → int bitmask over `names`."""
+
+    def __init__(self, tags: Dict[str, Sequence[str]]):
+        if not tags:
+            raise ValueError("no tags defined")
+        if len(tags) > MAX_TAGS:
+            raise ValueError(f"{len(tags)} tags defined; at most {MAX_TAGS} fit the flags bitmask")
+        self.names: Tuple[str, ...] = tuple(tags)
+        self.fields: Tuple[str, ...] = tuple(field_for(n) for n in self.names)
+        self.tags = {name: list(pats) for name, pats in tags.items()}
+        masks: Dict[str, int] = {}  # distinct pattern → bits of the tags listing it
+        for i, (name, pats) in enumerate(self.tags.items()):
+            if not _NAME_RE.match(name):
+                raise ValueError(f"tag name {name!r}: use lowercase letters, digits and _")
+            if not pats:
+                raise ValueError(f"tag {name!r} has no patterns")
+            for p in pats:
+                try:
+                    re.compile(p)
+                except re.error as e:
+                    raise ValueError(f"tag {name!r}: bad pattern {p!r} ({e})") from None
+                masks[p] = masks.get(p, 0) | (1 << i)
+        self._patterns = [(re.compile(p, re.I), mask) for p, mask in masks.items()]
+        by_anchor: Dict[str, List[int]] = defaultdict(list)
+        self._unanchored: List[int] = []
+        for j, p in enumerate(masks):
+            anchors = _anchors(p)
+            if anchors is None:
+                self._unanchored.append(j)
+            for a in anchors or ():
+                by_anchor[a].append(j)
+        # the scanner reports the longest anchor at a position; every shorter anchor that
+        # is a prefix of it starts there too
+        self._at = {a: sorted({j for b, js in by_anchor.items() if a.startswith(b) for j in js}) for a in by_anchor}
+        self._scan = re.compile(f"(?=({_trie_pattern(sorted(by_anchor))}))") if by_anchor else None
+        self.all = (1 << len(self.names)) - 1
+        self.fingerprint = hashlib.sha1(json.dumps(self.tags).encode("utf-8")).hexdigest()[:12]
+
+    def bits(self, text: str) -> int:
+        bits, full, pats = 0, self.all, self._patterns
+        for j in self._unanchored:
+            if pats[j][1] & ~bits and pats[j][0].search(text):
+                bits |= pats[j][1]
+        # casefolding maps re.I's case variants (ſ, K ... which lower() leaves) onto the
+        # anchors; if it changes offsets (ß→ss), search pattern by pattern instead
+        low = text.casefold()
+        if len(low) != len(text):
+            return bits | self._bits_slow(text)
+        if self._scan is None:
+            return bits
+        at = self._at
+        for m in self._scan.finditer(low):
+            if bits == full:
+                break
+            pos = m.start()
+            for j in at[m.group(1)]:
+                rx, mask = pats[j]
+                if mask & ~bits and rx.match(text, pos):
+                    bits |= mask
+        return bits
+
+    def _bits_slow(self, text: str) -> int:
+        bits = 0
+        for rx, mask in self._patterns:
+            if mask & ~bits and rx.search(text):
+                bits |= mask
+        return bits
+
+    def names_of(self, bits: int) -> List[str]:
+        return [n for i, n in enumerate(self.names) if bits & (1 << i)]
+
+    def meta(self, bits: int) -> Dict[str, bool]:
+        return {f: bool(bits & (1 << i)) for i, f in enumerate(self.fields)}
+
+def load_tagger(path: str) -> Tagger:
+    """Tagger for the tags file at `path` (DEFAULT_TAGS if it doesn't exist); raises ValueError if it is invalid."""
+    try:
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    except FileNotFoundError:
+        return Tagger(DEFAULT_TAGS)
+    except tomllib.TOMLDecodeError as e:
+        raise ValueError(f"{path}: {e}") from None
+    tags = {}
+    for name, pats in data.items():
+        pats = [pats] if isinstance(pats, str) else pats
+        if not isinstance(pats, list) or not all(isinstance(p, str) for p in pats):
+            raise ValueError(f"{path}: tag {name!r} must be a pattern or a list of patterns")
+        tags[name] = pats
+    return Tagger(tags)
@@ -0,0 +1,191 @@
+# utils/trace.py
+"""
+Lightweight span/timer instrumentation.
+
+    from utils import trace
+    with trace.span("retrieval.search", mode=mode, k=k):
+        ...
+        trace.count("retrieval_cache.hits")
+
+Disabled by default: span() returns a shared no-op object and count() returns
+immediately, so instrumented code pays one global check per call. `main.py --profile`
+enables it and prints render_tree(); `--trace-out` writes export_jsonl() /
+export_chrome() output (chrome://tracing, Perfetto).
+
+The current span lives in a ContextVar, so asyncio tasks nest under the span that
+created them. Worker threads start without a parent and show up as their own roots;
+spans in ingest worker processes are not collected.
+"""
+import contextvars, json, os, threading, time
+from typing import Any, Dict, List
+
+_enabled = False
+_lock = threading.Lock()
+_spans: List["Span"] = []
+_counters: Dict[str, float] = {}
+_current: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("trace_span", default=None)
+_next_id = 0
+
+class Span:
+    __slots__ = ("id", "parent", "name", "attrs", "counts", "start_ns", "dur_ns", "tid", "_token")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        global _next_id
+        with _lock:
+            _next_id += 1
+            self.id = _next_id
+        self.name = name
+        self.attrs = attrs
+        self.counts: Dict[str, float] = {}
+        self.parent = None
+        self.start_ns = self.dur_ns = 0
+        self.tid = 0
+        self._token = None
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "Span":
+        parent = _current.get()
+        self.parent = parent.id if parent is not None else None
+        self.tid = threading.get_ident()
+        self._token = _current.set(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.dur_ns = time.perf_counter_ns() - self.start_ns
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        try:
+            _current.reset(self._token)
+        except ValueError:  # closed from another context (e.g. a click close callback)
+            _current.set(None)
+        with _lock:
+            _spans.append(self)
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+_NOOP = _NoopSpan()
+
+def span(name: str, **attrs):
+    """Context manager timing a block; a shared no-op when tracing is off."""
+    if not _enabled:
+        return _NOOP
+    return Span(name, attrs)
+
+def count(name: str, n: float = 1) -> None:
+    """Add to a global counter and to the innermost open span."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+        cur = _current.get()
+        if cur is not None:
+            cur.counts[name] = cur.counts.get(name, 0) + n
+
+def enabled() -> bool:
+    return _enabled
+
+def enable(on: bool = True) -> None:
+    global _enabled
+    _enabled = on
+
+def reset() -> None:
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+def spans() -> List[Span]:
+    with _lock:
+        return sorted(_spans, key=lambda s: s.start_ns)
+
+def counters() -> Dict[str, float]:
+    with _lock:
+        return dict(_counters)
+
+# -------------------- output --------------------
+
+def _fmt_counts(counts: Dict[str, float]) -> str:
+    return ", ".join(f"{k}={v:g}" for k, v in sorted(counts.items()))
+
+def render_tree(width: int = 64) -> str:
+    """
+    Timing tree; sibling spans with the same name are merged (×n, summed time),
+    so a 500-batch ingest stays readable.
+    """
+    all_spans = spans()
+    ids = {s.id for s in all_spans}
+    children: Dict[Any, List[Span]] = {}
+    for s in all_spans:
+        children.setdefault(s.parent if s.parent in ids else None, []).append(s)
+
+    lines: List[str] = []
+
+    def walk(group: List[Span], prefix: str, last: bool, top: bool) -> None:
+        total = sum(s.dur_ns for s in group) / 1e6
+        counts: Dict[str, float] = {}
+        for s in group:
+            for k, v in s.counts.items():
+                counts[k] = counts.get(k, 0) + v
+        label = group[0].name + (f" ×{len(group)}" if len(group) > 1 else "")
+        head = "" if top else prefix + ("└─ " if last else "├─ ")
+        extra = f"  [{_fmt_counts(counts)}]" if counts else ""
+        lines.append(f"{(head + label).ljust(width)} {total:10.1f} ms{extra}")
+        by_name: Dict[str, List[Span]] = {}
+        for s in group:
+            for c in children.get(s.id, []):
+                by_name.setdefault(c.name, []).append(c)
+        kids = list(by_name.values())
+        child_prefix = "" if top else prefix + ("   " if last else "│  ")
+        for i, g in enumerate(kids):
+            walk(g, child_prefix, i == len(kids) - 1, False)
+
+    roots: Dict[str, List[Span]] = {}
+    for s in children.get(None, []):
+        roots.setdefault(s.name, []).append(s)
+    for g in roots.values():
+        walk(g, "", True, True)
+    if _counters:
+        lines.append("counters: " + _fmt_counts(counters()))
+    return "\n".join(lines)
+
+def _record(s: Span) -> Dict[str, Any]:
+    return {
+        "id": s.id, "parent": s.parent, "name": s.name, "start_us": s.start_ns // 1000,
+        "dur_us": s.dur_ns // 1000, "tid": s.tid, "attrs": s.attrs, "counts": s.counts,
+    }
+
+def export_jsonl(path: str) -> None:
+    """One JSON object per span, then a final {"counters": ...} line."""
+    with open(path, "w", encoding="utf-8") as f:
+        for s in spans():
+            f.write(json.dumps(_record(s), default=str) + "\n")
+        f.write(json.dumps({"counters": counters()}) + "\n")
+
+def export_chrome(path: str) -> None:
+    """Chrome trace-event format (complete "X" events + counter "C" events)."""
+    pid = os.getpid()
+    events = [
+        {"name": s.name, "ph": "X", "ts": s.start_ns / 1000, "dur": s.dur_ns / 1000, "pid": pid, "tid": s.tid,
+         "args": {**{k: str(v) for k, v in s.attrs.items()}, **s.counts}}
+        for s in spans()
+    ]
+    end = max((e["ts"] + e["dur"] for e in events), default=0)
+    events += [{"name": k, "ph": "C", "ts": end, "pid": pid, "args": {k: v}} for k, v in counters().items()]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+def export(path: str) -> None:
+    """By extension: .json → Chrome trace, anything else → JSON lines."""
+    (export_chrome if path.endswith(".json") else export_jsonl)(path)
@@ -0,0 +1,195 @@
+# utils/watch.py
+"""
+Live ingest for transcripts that are still being written (`main.py watch`).
+
+iter_chunks() is greedy and left-to-right, so once a chunk is followed by another
+it never changes; only a call's last ("open") chunk can still grow. Each manifest
+entry therefore also records, under "watch":
+  offset       byte offset after the last complete line read
+  tail_offset  byte offset of the open chunk's first line
+  tail_idx     that line's segment index
+  tail_meta    the open chunk's metadata (to adjust the catalog row)
+  check        sha1 of the bytes just before `offset` (detects in-place edits)
+A poll reads from tail_offset to the end of the file, re-chunks that span (the
+open chunk plus what was appended) and upserts only the chunks whose ids are new.
+Chunk ids are the ones `ingest` produces, so the two commands can be mixed.
+The call's segment file (utils.segstore) keeps its first tail_idx segments and gets
+the re-read ones appended.
+
+A file that shrank, or whose bytes before `offset` changed, was edited rather than
+appended to: it is re-read from the start, and unchanged chunks keep their ids, so
+they are not re-embedded. Files last written by `ingest` get the same one-time
+read to locate their open chunk. Removed transcripts are left to `ingest`.
+"""
+import hashlib, pathlib, time
+from typing import Any, Callable, Dict, Iterable, List
+
+from utils.catalog import CallStats
+from utils.embeddings import delete_chunks, upsert_chunks
+from utils.ingestion import FLAG_FIELDS, call_id_for, iter_chunks, read_segments_from
+from utils.manifest import is_unchanged
+from utils.pipeline import IngestStats
+from utils import dedup, trace
+
+CHECK_BYTES = 64
+
+def _check(path: str, offset: int) -> str:
+    with open(path, "rb") as f:
+        f.seek(max(0, offset - CHECK_BYTES))
+        return hashlib.sha1(f.read(min(offset, CHECK_BYTES))).hexdigest()
+
+def _advance(fp: pathlib.Path, st, entry: Dict[str, Any] | None, max_chars: int, final: bool, catalog,
+             segments=None) -> Dict[str, Any] | None:
+    """Re-chunk what changed in one file; None if no new complete line arrived."""
+    path, call_id = str(fp), call_id_for(str(fp))
+    w = (entry or {}).get("watch")
+    old_ids: List[str] = list((entry or {}).get("chunk_ids") or [])
+    restart = (
+        w is None
+        or st.st_size < w["offset"]
+        or _check(path, w["offset"]) != w["check"]
+        or (catalog is not None and old_ids and not catalog.has(call_id))
+        or (segments is not None and not segments.has(call_id, w["tail_idx"]))
+    )
+    if restart:
+        start, idx, keep = 0, 0, []
+    else:
+        start, idx, keep = w["tail_offset"], w["tail_idx"], old_ids[:-1]
+
+    segs, starts, end = read_segments_from(path, start, idx, final=final)
+    if not restart and end == w["offset"]:
+        return None
+    chunks = list(iter_chunks(segs, max_chars=max_chars))
+    new_ids = keep + [c["id"] for c in chunks]
+    if restart:
+        old = set(old_ids)
+        fresh = [c for c in chunks if c["id"] not in old]
+        stale = sorted(old - set(new_ids))
+    else:
+        # only the old open chunk can have been replaced
+        open_id = old_ids[-1] if old_ids else None
+        fresh = [c for c in chunks if c["id"] != open_id]
+        stale = [open_id] if open_id and open_id not in {c["id"] for c in chunks} else []
+
+    if chunks:
+        tail = chunks[-1]["meta"]
+        tail_offset, tail_idx = starts[tail["seg_start_idx"] - idx], tail["seg_start_idx"]
+    else:
+        tail, tail_offset, tail_idx = None, end, idx
+    return {
+        "call_id": call_id, "chunks": chunks, "fresh": fresh, "stale": stale, "restart": restart,
+        "segs": segs, "keep": idx,
+        "new_ids": new_ids, "bytes": end - (w["offset"] if not restart else 0),
+        "segments": (segs[-1].idx + 1) if segs else (entry or {}).get("segments", 0),
+        "watch": {"offset": end, "tail_offset": tail_offset, "tail_idx": tail_idx, "tail_meta": tail,
+                  "check": _check(path, end)},
+        "old_tail_meta": (w or {}).get("tail_meta"),
+    }
+
+def _catalog_row(catalog, res: Dict[str, Any], name: str, mtime: float) -> Dict[str, Any] | None:
+    """The call's catalog row after `res`: rebuilt on a restart, adjusted by the tail otherwise."""
+    chunks = res["chunks"]
+    if res["restart"] or catalog.get(res["call_id"]) is None:
+        call = CallStats(res["call_id"], name, mtime, FLAG_FIELDS)
+        for c in chunks:
+            call.add(c)
+        return call.row if chunks else None
+    row = catalog.get(res["call_id"])
+    old_tail = res["old_tail_meta"]
+    row["chunk_count"] += len(chunks) - (1 if old_tail else 0)
+    row["source_mtime"] = mtime
+    if chunks:
+        row["segment_count"] = chunks[-1]["meta"]["seg_end_idx"] + 1
+        row["first_ts"] = row["first_ts"] or chunks[0]["meta"]["start_ts"]
+        row["last_ts"] = chunks[-1]["meta"]["end_ts"]
+    for f in FLAG_FIELDS:
+        row["flag_counts"][f] = (row["flag_counts"].get(f, 0) - int(bool(old_tail and old_tail.get(f)))
+                                 + sum(1 for c in chunks if c["meta"].get(f)))
+    return row
+
+def poll(
+    coll,
+    files: Iterable[pathlib.Path],
+    manifest: dict,
+    max_chars: int = 1500,
+    batch_size: int = 64,
+    settle: float = 5.0,
+    ef=None,
+    catalog=None,
+    lexical=None,
+    segments=None,
+    log: Callable[[str], None] = print,
+) -> IngestStats:
+    """
+    One pass over `files`: index appended lines, updating `manifest` in place.
+    A last line without a newline counts once the file has been idle for `settle` seconds.
+    stats.files_changed counts entries updated (the caller saves the manifest then).
+    """
+    files = list(files)
+    entries = manifest["files"]
+    stats = IngestStats()
+    fresh: List[dict] = []
+    stale: List[str] = []
+    now = time.time()
+    for fp in files:
+        st = fp.stat()
+        entry = entries.get(fp.name)
+        w = (entry or {}).get("watch")
+        if is_unchanged(entry, st) and (w is None or w["offset"] == st.st_size):
+            continue
+        with trace.span("watch.file"):
+            res = _advance(fp, st, entry, max_chars, now - st.st_mtime >= settle, catalog, segments)
+        if res is None:
+            continue
+        if segments is not None:
+            segments.write(res["call_id"], res["segs"], keep=res["keep"])
+        fresh.extend(res["fresh"])
+        stale.extend(res["stale"])
+        stats.files_changed += 1
+        entries[fp.name] = {
+            "call_id": res["call_id"],
+            "sha256": None,  # not re-hashed here (that would re-read the file); ingest fills it in
+            "mtime": st.st_mtime,
+            "size": st.st_size,
+            "segments": res["segments"],
+            "chunk_ids": res["new_ids"],
+            "watch": res["watch"],
+        }
+        if catalog is not None:
+            row = _catalog_row(catalog, res, fp.name, st.st_mtime)
+            if row is not None:
+                catalog.upsert(row)
+        if res["fresh"] or res["stale"]:
+            log(f"Watched [bold]{fp.name}[/bold]: {res['bytes']:,} new bytes → "
+                f"+{len(res['fresh'])} / -{len(res['stale'])} chunks" + (" (re-read)" if res["restart"] else ""))
+
+    index = getattr(coll, "dedup", None)
+    if index is not None:
+        # the replaced tails leave the dedup index first, so a grown tail is not filed under its old self
+        orphans = index.remove(stale)
+        fresh, refs = dedup.split(index, fresh)
+        if orphans:
+            live = {cid for e in entries.values() for cid in e["chunk_ids"]}
+            paths = {call_id_for(str(fp)): str(fp) for fp in files}
+            more, more_refs = dedup.split(index, [c for c in dedup.promote(orphans, paths, max_chars, index.hasher)
+                                                  if c["id"] in live])
+            stats.promoted += len(more) + len(more_refs)
+            fresh, refs = fresh + more, refs + more_refs
+        stats.deduped += len(refs)
+        if lexical is not None:
+            lexical.add(refs)
+        index.commit()
+
+    # new chunks go in before the replaced tails come out, so a concurrent ask never misses the tail
+    for i in range(0, len(fresh), batch_size):
+        batch = fresh[i:i + batch_size]
+        with trace.span("ingest.embed"):
+            emb = ef([c["text"] for c in batch]) if ef else None
+            trace.count("chunks_embedded", len(batch))
+        stats.added += upsert_chunks(coll, batch, emb)
+        if lexical is not None:
+            lexical.add(batch)
+    stats.deleted += delete_chunks(coll, stale)
+    if lexical is not None:
+        lexical.remove(stale)
+    return stats